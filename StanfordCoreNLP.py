@@ -1,8 +1,41 @@
 #-*- coding: utf-8 -*-
 #!python3
 
+import array
+import asyncio
+import atexit
+import bisect
+import collections
+import contextlib
+import datetime
+import functools
+import hashlib
+import inspect
+import itertools
+import json
+import mmap
+import operator
+import os
+import pickle
+import queue
+import re
+import shutil
+import signal
+import socket
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.request
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 import langdetect
-from stanza.server import CoreNLPClient
+import requests
+from stanza.server import CoreNLPClient, AnnotationException, StartServer, TimeoutException
+from stanza.protobuf import Document, Sentence, parseFromDelimitedString
 
 '''
     For reference 
@@ -90,25 +123,3003 @@ from stanza.server import CoreNLPClient
             ann = client.annotate(text)
         sent_list = [token.word for token in ann.sentence[0].token]
         # ['国务院', '日前', '发出', '紧急', '通知', '，', '要求', '各地', '切实', '落实', '保证', '市场', '供应', '的', '各', '项', '政策', '，', '维护', '副食品', '价格', '稳定', '。']
+
+    ##############################
+    #### Batch options ###########
+    ##############################
+
+    # Options shared by Segment(), POS_Tag(), Dependency_Parse(), Annotate() and their iter_* versions:
+    :param (int) batch_size: number of documents packed in a single request, split back per document. Default 1.
+    :param (int) max_batch_chars: maximum number of characters in a single request when batch_size > 1.
+    :param (int) workers: number of requests kept in flight at the same time, the server gets as many threads. Results keep the input order.
+    :param (int) shards: number of servers started on separate ports, each taking the next documents when it is free.
+    :param (str) memory: JVM heap size of each server, e.g. '4G'. None for the stanza default.
+    :param (AnnotationCache | str) cache: AnnotationCache, or its path, answering the documents of previous runs. The others are added to it.
+    :param (CoreNLPSharedServer | bool) shared_server: True (or a CoreNLPSharedServer) to use a server shared with other Python processes. shards is then ignored.
+    :param (Checkpoint | str) checkpoint: Checkpoint, or its path, journaling the run. Run again with the same file and input to resume after a crash.
+    :param (list) failures: list receiving a dict per document that failed ('status': 'failed', which gets the empty result) or had to be split
+                            after a timeout ('status': 'split'). None (default) raises the error of the first failed document.
+    :param (bool) compact: True for a TokenStore (DependencyGraphs for Dependency_Parse()) instead of a list. Not with raw.
+    :param (bool) raw: True for an AnnotatedDocument per document, converted only when accessed. document.tolist() gives the usual result.
+    :param (Metrics) metrics: Metrics receiving the time spent in each stage and the document counters. None (default) measures nothing.
+    :param (bool) pipeline: True to send the next request while the previous results are converted.
+    :param (int) convert_processes: number of processes converting the results (implies pipeline). 0 (default) converts in this process.
+    :param (Dedup | bool) dedup: Dedup, or True for a new one, annotating each distinct document once and giving its result to every copy.
+    With timeout=AdaptiveTimeout(), each request gets a timeout fitted to its length, and a document that times out is annotated again in pieces.
+
+    # Options shared by the *_str_langdetect methods:
+    :param (bool | str) reuse_session: True to keep the server alive in CoreNLP_session_pool for the next calls with the same settings,
+                            'shared' to use the CoreNLPSharedServer of these settings, shared with other Python processes.
+    :param (ResultMemo | bool) memo: ResultMemo answering repeated strings with a copy of their result, True for CoreNLP_str_memo. None (default) disables it.
+    :param (Metrics) metrics: Metrics receiving the time spent in each stage. None (default) measures nothing, nor are answers of the memo.
 '''
 
-def get_StanfordCoreNLP_chinese_properties(properties=None):
+# properties from StanfordCoreNLP-chinese.properties, built once and read-only
+_CHINESE_PROPERTIES = types.MappingProxyType({'annotators':('tokenize', 'ssplit', 'pos', 'lemma', 'ner', 'parse', 'coref'),'tokenize.language':'zh','segment.model':'edu/stanford/nlp/models/segmenter/chinese/ctb.gz','segment.sighanCorporaDict':'edu/stanford/nlp/models/segmenter/chinese','segment.serDictionary':'edu/stanford/nlp/models/segmenter/chinese/dict-chris6.ser.gz','segment.sighanPostProcessing':True,'ssplit.boundaryTokenRegex':'[.。]|[!?！？]+','pos.model':'edu/stanford/nlp/models/pos-tagger/chinese-distsim.tagger','ner.language':'chinese','ner.model':'edu/stanford/nlp/models/ner/chinese.misc.distsim.crf.ser.gz','ner.applyNumericClassifiers':True,'ner.useSUTime':False,'ner.fine.regexner.mapping':'edu/stanford/nlp/models/kbp/chinese/gazetteers/cn_regexner_mapping.tab','ner.fine.regexner.noDefaultOverwriteLabels':'CITY,COUNTRY,STATE_OR_PROVINCE','parse.model':'edu/stanford/nlp/models/srparser/chineseSR.ser.gz','depparse.model   ':'edu/stanford/nlp/models/parser/nndep/UD_Chinese.gz','depparse.language':'chinese','coref.sieves':'ChineseHeadMatch, ExactStringMatch, PreciseConstructs, StrictHeadMatch1, StrictHeadMatch2, StrictHeadMatch3, StrictHeadMatch4, PronounMatch','coref.input.type':'raw','coref.postprocessing':True,'coref.calculateFeatureImportance':False,'coref.useConstituencyTree':True,'coref.useSemantics':False,'coref.algorithm':'hybrid','coref.path.word2vec':'','coref.language':'zh','coref.defaultPronounAgreement':True,'coref.zh.dict':'edu/stanford/nlp/models/dcoref/zh-attributes.txt.gz','coref.print.md.log':False,'coref.md.type':'RULE','coref.md.liberalChineseMD':False,'kbp.semgrex':'edu/stanford/nlp/models/kbp/chinese/semgrex','kbp.tokensregex':'edu/stanford/nlp/models/kbp/chinese/tokensregex','kbp.language':'zh','kbp.model':None,'entitylink.wikidict':'edu/stanford/nlp/models/kbp/chinese/wikidict_chinese.tsv.gz'})
+
+_CHINESE_SEGMENT_KEYS = ('tokenize.language', 'segment.model', 'segment.sighanCorporaDict', 'segment.serDictionary', 'segment.sighanPostProcessing', 'ssplit.boundaryTokenRegex')
+
+# Minimal properties per task: only the annotators and models that stage needs, so the server does not load NER, parser, coref or KBP resources.
+_CHINESE_TASK_PROPERTIES = {
+    'segment': types.MappingProxyType(dict([('annotators', ('tokenize', 'ssplit'))] +
+                                        [(key, _CHINESE_PROPERTIES[key]) for key in _CHINESE_SEGMENT_KEYS])),
+    'pos': types.MappingProxyType(dict([('annotators', ('tokenize', 'ssplit', 'pos'))] +
+                                        [(key, _CHINESE_PROPERTIES[key]) for key in _CHINESE_SEGMENT_KEYS + ('pos.model',)])),
+    'depparse': types.MappingProxyType(dict([('annotators', ('tokenize', 'ssplit', 'pos', 'depparse'))] +
+                                        [(key, _CHINESE_PROPERTIES[key]) for key in _CHINESE_SEGMENT_KEYS + ('pos.model', 'depparse.language')] +
+                                        [('depparse.model', _CHINESE_PROPERTIES['depparse.model   '])])),
+    }
+
+def get_StanfordCoreNLP_chinese_properties(properties=None, task=None):
     '''
         Exports properties taken from stanford-corenlp-4.1.0-models-chinese.jar to be able to run the Chinese models with the python client.
         
-        :param (dict) properties: additional request properties (written on top of Chinese ones exported here)
+        :param (dict) properties: additional request properties (written on top of Chinese ones exported here). The dict itself is not modified.
+        :param (str) task: None (default) for every Chinese property, or one of 'segment', 'pos', 'depparse' for only the annotators and models that task needs,
+                            which makes the server start faster and use less memory.
+
+        :return: Properties enabling Chinese language parsing, in addition to any in parameters.
+
+        For example:
+            properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
+            with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout) as client:
+                ann = client.annotate(text)
+
+            properties = get_StanfordCoreNLP_chinese_properties(task='segment')
+            >>>{'annotators': ('tokenize', 'ssplit'), 'tokenize.language': 'zh', 'segment.model': 'edu/stanford/nlp/models/segmenter/chinese/ctb.gz', ...}
+    '''
+    if task is None:
+        StanfordCoreNLP_chinese_properties = dict(_CHINESE_PROPERTIES)
+    else:
+        StanfordCoreNLP_chinese_properties = dict(_CHINESE_TASK_PROPERTIES[task])
+    if properties:
+        StanfordCoreNLP_chinese_properties.update(properties)
+    return StanfordCoreNLP_chinese_properties
+
+##########################
+##### Session pool #######
+##########################
+
+def _find_free_port():
+    '''
+        Asks the OS for a free local port so that several CoreNLP servers can run side by side without clashing on the default 9000.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+def _properties_key(properties):
+    '''
+        Hashable representation of a properties dict, used to tell apart servers started with different settings.
+    '''
+    if not properties:
+        return ()
+    return tuple(sorted((str(key), repr(value)) for key, value in properties.items()))
+
+class _PooledSession(object):
+    '''
+        A started CoreNLPClient plus the bookkeeping the pool needs to decide when it can be shut down.
+    '''
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.time()
+        self.in_use = 0
+
+class CoreNLPSessionPool(object):
+    '''
+        Keeps CoreNLPClient servers alive between calls, so that processing one string at a time does not start a JVM and load the models every time.
+        Clients are keyed by language, annotators, properties and timeout. Each client gets its own free port.
+        Clients unused for more than idle_timeout seconds are stopped by a background thread, and everything is stopped at interpreter exit.
+
+        :param (int | float) idle_timeout: seconds a client may stay unused before it is stopped. Set None to keep clients until close_all().
+        :param (int | float) reap_interval: seconds between checks for idle clients.
+        :param (str) memory: JVM heap size for each server started by the pool.
+
+        For example:
+            with CoreNLP_session_pool.session('zh-cn', ['tokenize', 'ssplit'], properties=properties) as client:
+                ann = client.annotate(text)
+    '''
+    def __init__(self, idle_timeout=300, reap_interval=30, memory='4G'):
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.memory = memory
+        self._sessions = {}
+        self._lock = threading.RLock()
+        self._reaper = None
+        self._stop_reaper = threading.Event()
+
+    def _start_reaper(self):
+        if self.idle_timeout is None or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        self._stop_reaper.clear()
+        self._reaper = threading.Thread(target=self._reap_loop, name='CoreNLPSessionPoolReaper')
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stop_reaper.wait(self.reap_interval):
+            self.close_idle()
+            with self._lock:
+                if not self._sessions:
+                    self._reaper = None
+                    return
+
+    def _acquire(self, lang, annotators, properties, timeout, be_quiet):
+        key = (lang, tuple(annotators or ()), _properties_key(properties), timeout)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                client = CoreNLPClient(annotators=annotators,
+                                    properties=properties,
+                                    timeout=timeout,
+                                    be_quiet=be_quiet,
+                                    memory=self.memory,
+                                    endpoint='http://localhost:{}'.format(_find_free_port()))
+                client.start()
+                session = _PooledSession(client)
+                self._sessions[key] = session
+                self._start_reaper()
+            session.in_use += 1
+            session.last_used = time.time()
+            return session
+
+    def _release(self, session):
+        with self._lock:
+            session.in_use -= 1
+            session.last_used = time.time()
+
+    def session(self, lang, annotators, properties=None, timeout=15000, be_quiet=True):
+        '''
+            Context manager returning a started client for the given settings, starting one only if the pool has none yet.
+            The client is not stopped on exit, it stays in the pool for the next call.
+        '''
+        return _PooledSessionContext(self, lang, annotators, properties, timeout, be_quiet)
+
+    def annotate(self, text, lang, annotators, properties=None, timeout=15000, be_quiet=True):
+        '''
+            Annotates text with a pooled client and returns the CoreNLP Document.
+        '''
+        with self.session(lang, annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
+            return client.annotate(text)
+
+    def close_idle(self):
+        '''
+            Stops clients that are not in use and have been idle for longer than idle_timeout.
+        '''
+        if self.idle_timeout is None:
+            return
+        now = time.time()
+        with self._lock:
+            idle = [key for key, session in self._sessions.items()
+                        if session.in_use == 0 and now - session.last_used > self.idle_timeout]
+            sessions = [self._sessions.pop(key) for key in idle]
+        for session in sessions:
+            session.client.stop()
+
+    def close_all(self):
+        '''
+            Stops every client in the pool. Registered to run at interpreter exit.
+        '''
+        self._stop_reaper.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            try:
+                session.client.stop()
+            except Exception:
+                pass
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+class _PooledSessionContext(object):
+    def __init__(self, pool, lang, annotators, properties, timeout, be_quiet):
+        self.pool = pool
+        self.args = (lang, annotators, properties, timeout, be_quiet)
+        self.session_ = None
+
+    def __enter__(self):
+        self.session_ = self.pool._acquire(*self.args)
+        return self.session_.client
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pool._release(self.session_)
+        return False
+
+# Module-level pool used by the *_str_langdetect methods when reuse_session=True
+CoreNLP_session_pool = CoreNLPSessionPool()
+atexit.register(CoreNLP_session_pool.close_all)
+
+def _annotate_str(text, lang, annotators, properties, timeout, be_quiet, reuse_session, metrics=None):
+    '''
+        Annotates a single string, either with a client from CoreNLP_session_pool, with the CoreNLPSharedServer of these settings (reuse_session='shared'),
+        or with a fresh client that is stopped right after.
+        With metrics, getting the client is timed as the server_start stage, and the request as the request and decode stages.
+    '''
+    if metrics is None:
+        if reuse_session == 'shared':
+            with _shared_server(annotators, properties, timeout).attach() as client:
+                return client.annotate(text)
+        if reuse_session:
+            return CoreNLP_session_pool.annotate(text, lang, annotators, properties=properties, timeout=timeout, be_quiet=be_quiet)
+        with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
+            return client.annotate(text)
+    metrics.count('documents')
+    metrics.count('chars', len(text))
+    started = time.perf_counter()
+    if reuse_session == 'shared':
+        session = _shared_server(annotators, properties, timeout).attach()
+    elif reuse_session:
+        session = CoreNLP_session_pool.session(lang, annotators, properties=properties, timeout=timeout, be_quiet=be_quiet)
+    else:
+        session = CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet)
+    with session as client:
+        metrics.lap('server_start', started)
+        return _timed_annotate(client, text, None, metrics)
+
+###########################
+##### Shared server #######
+###########################
+
+# Default folder of the lock files of the shared servers, one per settings
+_SHARED_SERVER_DIR = os.path.join(tempfile.gettempdir(), 'StanfordCoreNLP-shared')
+
+def _pid_alive(pid):
+    '''
+        True if a process with this pid is running. Used to tell stale lock and lease files from live ones.
+    '''
+    if pid is None:
+        return False
+    if os.name == 'nt':
+        import ctypes
+        # os.kill(pid, 0) terminates the process on Windows, so ask for its exit code instead
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == 259 # STILL_ACTIVE
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _server_ready(endpoint, timeout=2):
+    '''
+        Health check: True if the CoreNLP server at endpoint answers its /ready page.
+    '''
+    try:
+        with urllib.request.urlopen(endpoint + '/ready', timeout=timeout) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path, content):
+    '''
+        Replaces the file in one step, so that readers never see it half written.
+    '''
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(content, f)
+    os.replace(tmp_path, path)
+
+def _live_leases(lease_dir):
+    '''
+        Number of processes attached to a shared server. Leases left by processes that died without releasing are removed.
+    '''
+    try:
+        names = os.listdir(lease_dir)
+    except OSError:
+        return 0
+    live = 0
+    for name in names:
+        if name.isdigit() and _pid_alive(int(name)):
+            live += 1
+        else:
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(lease_dir, name))
+    return live
+
+class CoreNLPSharedServer(object):
+    '''
+        A CoreNLP server shared by every Python process of the user that asks for the same settings, so that ten worker processes
+        load the models once instead of ten times.
+        The first process to attach starts the server in a detached daemon process, which writes its endpoint and pid to a lock file
+        in :lock_dir:. The other processes find the lock file, check the server health and attach to it with CoreNLPClient(start_server=StartServer.DONT_START).
+        Each attached process holds a lease file. The daemon stops the server once no process has held a lease for idle_timeout seconds,
+        or as soon as the last one leaves with idle_timeout=0.
+
+        :param (list[str]) annotators: CoreNLP annotators loaded by the server
+        :param (dict) properties: server properties, e.g. get_StanfordCoreNLP_chinese_properties(task='segment')
+        :param (int) timeout: CoreNLP server time before raising exception.
+        :param (str) memory: JVM heap size of the server, e.g. '4G'
+        :param (int) threads: number of server threads, shared by every attached process
+        :param (int | float) idle_timeout: seconds without attached processes before the server is stopped
+        :param (str) lock_dir: folder of the lock and lease files. Processes share a server only if they use the same folder.
+        :param (int | float) start_timeout: seconds to wait for the server to start
+
+        For example:
+            server = CoreNLPSharedServer(['tokenize', 'ssplit'], properties=get_StanfordCoreNLP_chinese_properties(task='segment'))
+            with server.attach() as client:
+                ann = client.annotate(text)
+            server.status()
+            >>>{'pid': 4242, 'endpoint': 'http://localhost:40123', 'state': 'ready', 'users': 0, 'healthy': True, ...}
+    '''
+    def __init__(self, annotators, properties=None, timeout=15000, memory='4G', threads=5, idle_timeout=300, lock_dir=None, start_timeout=120):
+        self.annotators = list(annotators or ())
+        self.properties = dict(properties or {})
+        self.timeout = timeout
+        self.memory = memory
+        self.threads = threads
+        self.idle_timeout = idle_timeout
+        self.lock_dir = lock_dir or _SHARED_SERVER_DIR
+        self.start_timeout = start_timeout
+        settings = json.dumps([self.annotators, _properties_key(self.properties), timeout], sort_keys=True)
+        self.name = 'corenlp-' + hashlib.sha1(settings.encode('utf-8')).hexdigest()[:16]
+        self.lock_path = os.path.join(self.lock_dir, self.name + '.lock')
+        self._leases = collections.Counter()
+        self._healthy_pid = None
+        self._lock = threading.Lock()
+
+    def _daemon_command(self):
+        spec = {'annotators': self.annotators, 'properties': self.properties, 'timeout': self.timeout, 'memory': self.memory,
+                'threads': self.threads, 'idle_timeout': self.idle_timeout, 'lock_path': self.lock_path, 'start_timeout': self.start_timeout}
+        return [sys.executable, os.path.abspath(__file__), '--shared-server', json.dumps(spec)]
+
+    def _spawn_daemon(self):
+        '''
+            Starts the daemon in its own session, so that it outlives the process that started it, and waits until the server is ready.
+        '''
+        if os.name == 'nt':
+            detach = {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            detach = {'start_new_session': True}
+        with open(os.path.join(self.lock_dir, self.name + '.log'), 'ab') as log:
+            daemon = subprocess.Popen(self._daemon_command(), stdin=subprocess.DEVNULL, stdout=log, stderr=log, close_fds=True, **detach)
+        deadline = time.time() + self.start_timeout
+        while time.time() < deadline:
+            info = _read_json(self.lock_path)
+            if info is not None and info.get('state') == 'ready' and info.get('pid') == daemon.pid:
+                return
+            if daemon.poll() is not None:
+                break
+            time.sleep(0.2)
+        with contextlib.suppress(OSError):
+            os.remove(self.lock_path)
+        if daemon.poll() is None:
+            daemon.terminate()
+        raise RuntimeError('CoreNLP shared server did not start, see {}'.format(os.path.join(self.lock_dir, self.name + '.log')))
+
+    def _remove_stale_lock(self, info):
+        '''
+            Removes a lock file left by a daemon that died, unless another process replaced it in the meantime.
+        '''
+        if _read_json(self.lock_path) == info:
+            with contextlib.suppress(OSError):
+                os.remove(self.lock_path)
+
+    def _ready_info(self):
+        '''
+            Returns the lock file of a running, healthy server, starting the daemon first if no process did.
+        '''
+        os.makedirs(self.lock_dir, exist_ok=True)
+        deadline = time.time() + self.start_timeout
+        while time.time() < deadline:
+            info = _read_json(self.lock_path)
+            if info is None:
+                try:
+                    # Only the process that creates the lock file starts the daemon, the others wait for it
+                    fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    time.sleep(0.2)
+                    continue
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'state': 'starting', 'pid': os.getpid()}, f)
+                self._spawn_daemon()
+                continue
+            if not _pid_alive(info.get('pid')):
+                self._remove_stale_lock(info)
+                continue
+            if info.get('state') != 'ready':
+                time.sleep(0.2)
+                continue
+            if self._healthy_pid != info['pid']:
+                if not _server_ready(info['endpoint']):
+                    time.sleep(0.2)
+                    continue
+                self._healthy_pid = info['pid']
+            return info
+        raise RuntimeError('CoreNLP shared server not ready after {} seconds: {}'.format(self.start_timeout, self.lock_path))
+
+    def acquire(self):
+        '''
+            Attaches this process to the server, starting it if needed, and returns the lock file content (with its 'endpoint').
+            Each acquire() needs a release() of what it returned.
+        '''
+        with self._lock:
+            deadline = time.time() + self.start_timeout
+            while time.time() < deadline:
+                info = self._ready_info()
+                lease_path = os.path.join(info['leases'], str(os.getpid()))
+                with open(lease_path, 'a'):
+                    pass
+                # The daemon checks the leases after it takes its lock file down, so a lease made while the lock file is still up always counts
+                if _read_json(self.lock_path) == info:
+                    self._leases[lease_path] += 1
+                    return info
+                if not self._leases[lease_path]:
+                    with contextlib.suppress(OSError):
+                        os.remove(lease_path)
+            raise RuntimeError('Could not attach to the CoreNLP shared server in {} seconds, its lock file kept changing: {}'.format(
+                                self.start_timeout, self.lock_path))
+
+    def release(self, info):
+        '''
+            Detaches this process. The lease file is removed when the last acquire() of the process on that server is released.
+        '''
+        lease_path = os.path.join(info['leases'], str(os.getpid()))
+        with self._lock:
+            self._leases[lease_path] -= 1
+            if self._leases[lease_path] <= 0:
+                del self._leases[lease_path]
+                with contextlib.suppress(OSError):
+                    os.remove(lease_path)
+
+    @contextlib.contextmanager
+    def attach(self):
+        '''
+            Context manager returning a CoreNLPClient connected to the shared server, which it never starts nor stops.
+        '''
+        info = self.acquire()
+        try:
+            yield CoreNLPClient(annotators=self.annotators, properties=self.properties, timeout=self.timeout,
+                                endpoint=info['endpoint'], start_server=StartServer.DONT_START)
+        finally:
+            self.release(info)
+
+    def status(self):
+        '''
+            Returns the lock file content plus the number of attached processes and the health check result, or None if no server is running.
+        '''
+        info = _read_json(self.lock_path)
+        if info is None or not _pid_alive(info.get('pid')):
+            return None
+        info['users'] = _live_leases(info['leases']) if 'leases' in info else 0
+        info['healthy'] = info.get('state') == 'ready' and _server_ready(info['endpoint'])
+        return info
+
+    def stop(self):
+        '''
+            Stops the daemon whether or not other processes are attached.
+        '''
+        info = _read_json(self.lock_path)
+        if info is not None and _pid_alive(info.get('pid')) and info.get('state') == 'ready':
+            os.kill(info['pid'], signal.SIGTERM)
+
+def _serve_shared(spec):
+    '''
+        Main loop of the daemon started by CoreNLPSharedServer: runs the server, publishes it in the lock file and stops it when it has been unused for idle_timeout.
+    '''
+    lock_path = spec['lock_path']
+    lease_dir = '{}.{}.leases'.format(lock_path[:-len('.lock')], os.getpid())
+    os.makedirs(lease_dir, exist_ok=True)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    client = CoreNLPClient(annotators=spec['annotators'], properties=spec['properties'], timeout=spec['timeout'],
+                        memory=spec['memory'], threads=spec['threads'], be_quiet=True,
+                        endpoint='http://localhost:{}'.format(_find_free_port()))
+    published = False
+    try:
+        client.start()
+        deadline = time.time() + spec['start_timeout']
+        while not _server_ready(client.endpoint):
+            if time.time() > deadline:
+                return
+            time.sleep(0.5)
+        _write_json(lock_path, {'state': 'ready', 'pid': os.getpid(), 'endpoint': client.endpoint, 'leases': lease_dir,
+                                'server_pid': getattr(getattr(client, 'server', None), 'pid', None), 'started': time.time()})
+        published = True
+        last_used = time.time()
+        while True:
+            time.sleep(min(1.0, max(spec['idle_timeout'], 0.1)))
+            if not _server_ready(client.endpoint, timeout=10):
+                return
+            if _live_leases(lease_dir):
+                last_used = time.time()
+                continue
+            if time.time() - last_used < spec['idle_timeout']:
+                continue
+            # Take the lock file down first, then look at the leases once more: a process that attached in between keeps the server up
+            stopping_path = lock_path + '.stopping'
+            os.replace(lock_path, stopping_path)
+            if not _live_leases(lease_dir):
+                os.remove(stopping_path)
+                published = False
+                return
+            try:
+                os.link(stopping_path, lock_path)
+            except OSError:
+                # A new daemon took the lock meanwhile: serve the attached processes until they leave, without the lock file
+                published = False
+                while _live_leases(lease_dir):
+                    time.sleep(1.0)
+                return
+            finally:
+                with contextlib.suppress(OSError):
+                    os.remove(stopping_path)
+            last_used = time.time()
+    finally:
+        if published and (_read_json(lock_path) or {}).get('pid') == os.getpid():
+            with contextlib.suppress(OSError):
+                os.remove(lock_path)
+        client.stop()
+        shutil.rmtree(lease_dir, ignore_errors=True)
+
+# Shared servers of the *_str_langdetect methods with reuse_session='shared', and of the batch methods with shared_server=True
+_shared_servers = {}
+_shared_servers_lock = threading.Lock()
+
+def _shared_server(annotators, properties, timeout, memory=None, threads=None):
+    '''
+        Returns the CoreNLPSharedServer of these settings, the same object for every call in the process.
+    '''
+    key = (tuple(annotators or ()), _properties_key(properties), timeout)
+    with _shared_servers_lock:
+        if key not in _shared_servers:
+            kwargs = {}
+            if memory:
+                kwargs['memory'] = memory
+            if threads:
+                kwargs['threads'] = threads
+            _shared_servers[key] = CoreNLPSharedServer(annotators, properties=properties, timeout=timeout, **kwargs)
+        return _shared_servers[key]
+
+#############################
+##### Instrumentation #######
+#############################
+
+# Stages timed by Metrics, in pipeline order
+METRIC_STAGES = ('langdetect', 'server_start', 'request', 'decode', 'convert', 'format')
+
+class Metrics(object):
+    '''
+        Per-stage timings and counters of a run, given to the methods with their metrics parameter, to find out where the time goes.
+        Stages, see METRIC_STAGES:
+            langdetect: language detection of the *_str_langdetect methods and Route_by_language()
+            server_start: starting the servers, or attaching to a pooled or shared one
+            request: HTTP round trip to the server, including its annotation time
+            decode: parsing the protobuf Document of the response
+            convert: reading words, tags and edges from the protobuf sentences
+            format: building the output of the method (nested lists or strings)
+        Counters: documents, chars, requests, cache_hits, empty, failed and split documents.
+        Nothing is measured by the methods when they are given no Metrics.
+
+        :param (function) sink: called with (kind, name, value) for every measure, kind 'time' (value in seconds) or 'count',
+                                e.g. to forward them to statsd or Prometheus. None to only keep the totals.
+
+        For example:
+            metrics = Metrics()
+            Dependency_Parse(zh_texts, metrics=metrics)
+            print(metrics.report())
+            metrics.summary()['stages']['request']['seconds']
+    '''
+    def __init__(self, sink=None):
+        self.sink = sink
+        # stage -> [number of timings, total seconds]
+        self.timings = {}
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            timing = self.timings.get(stage)
+            if timing is None:
+                timing = self.timings[stage] = [0, 0.0]
+            timing[0] += 1
+            timing[1] += seconds
+        if self.sink is not None:
+            self.sink('time', stage, seconds)
+
+    def lap(self, stage, started):
+        '''
+            Records the time since :started: (a time.perf_counter() value) for :stage: and returns the current time, the start of the next stage.
+        '''
+        now = time.perf_counter()
+        self.add_time(stage, now - started)
+        return now
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.lap(stage, started)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+        if self.sink is not None:
+            self.sink('count', name, n)
+
+    def summary(self):
+        '''
+            {'stages': {stage: {'calls', 'seconds', 'mean_ms'}}, 'counters': {name: value}}
+        '''
+        with self._lock:
+            stages = dict((stage, {'calls': calls, 'seconds': seconds, 'mean_ms': 1000.0 * seconds / calls})
+                            for stage, (calls, seconds) in self.timings.items())
+            return {'stages': stages, 'counters': dict(self.counters)}
+
+    def report(self):
+        '''
+            The summary as a text table, stages in pipeline order.
+        '''
+        summary = self.summary()
+        stages = summary['stages']
+        total = sum(stage['seconds'] for stage in stages.values()) or 1.0
+        lines = []
+        for stage in [stage for stage in METRIC_STAGES if stage in stages] + sorted(set(stages) - set(METRIC_STAGES)):
+            timing = stages[stage]
+            lines.append('{:14} {:10.3f} s {:6.1%} {:10} calls {:10.3f} ms/call'.format(stage, timing['seconds'], timing['seconds'] / total,
+                                                                                    timing['calls'], timing['mean_ms']))
+        for name, value in sorted(summary['counters'].items()):
+            lines.append('{:14} {:10}'.format(name, value))
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+
+class ProgressReporter(object):
+    '''
+        Progress messages of the batch methods (verbose=1 or 3): "<action> <language> sentence i of n" with the throughput and the estimated time left,
+        printed for the first document, then at most once every :interval: seconds, and for the last one by finish().
+        Checking the clock is all it costs for the documents in between.
+
+        :param (str) action: e.g. 'Segmenting'
+        :param (str) language: e.g. 'Chinese'
+        :param (int) total: number of documents, None for an input of unknown length
+        :param (float) interval: minimum number of seconds between two messages
+        :param (file) stream: where to print, sys.stdout by default
+    '''
+    def __init__(self, action, language, total=None, interval=2.0, stream=None):
+        self.action = action
+        self.language = language
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.done = 0
+        self._printed = 0
+        self._started = None
+        self._next = 0.0
+
+    def __call__(self, i):
+        self.done = i + 1
+        now = time.monotonic()
+        if self._started is None:
+            self._started = now
+        if now >= self._next:
+            self._next = now + self.interval
+            self._print(now)
+
+    def finish(self):
+        '''
+            Prints the last document if it was not printed yet.
+        '''
+        if self.done != self._printed:
+            self._print(time.monotonic())
+
+    def _print(self, now):
+        self._printed = self.done
+        message = '{} {} sentence {}'.format(self.action, self.language, self.done)
+        if self.total is not None:
+            message += ' of {}'.format(self.total)
+        elapsed = now - self._started
+        if elapsed > 0:
+            rate = (self.done - 1) / elapsed
+            if self.total is not None and rate > 0:
+                left = datetime.timedelta(seconds=int((self.total - self.done) / rate))
+                message += ' ({:.1f} docs/s, ETA {})'.format(rate, left)
+            else:
+                message += ' ({:.1f} docs/s)'.format(rate)
+        print(message, file=self.stream)
+
+#############################
+##### Deduplication #########
+#############################
+
+def collapse_whitespace(text):
+    '''
+        Normalization for Dedup: texts that only differ in runs of spaces, tabs and newlines, or in leading and trailing whitespace, count as copies.
+        Do not use it with pre_tokenized texts, whose newlines are sentence breaks.
+    '''
+    return ' '.join(text.split())
+
+# Where Dedup(sentences=True) splits documents: sentence-final punctuation with its closing quotes, followed by a space for Western punctuation
+_SENTENCE_ENDS = re.compile(r'[。！？]+[”’」』）)"\']*|[.!?]+[”’)"\']*(?=\s)')
+# Sentence breaks of pre-tokenized text
+_LINE_ENDS = re.compile(r'\n')
+
+class Dedup(object):
+    '''
+        Deduplication of the documents of a batch run, given to the batch and iter_* methods with their dedup parameter (True for a new Dedup).
+        Each distinct document is annotated once and its result given to every copy, so reposts, templated ads and boilerplate cost a single request.
+        Each copy gets its own result object, equal to the result of the first copy as it was first yielded, so copies can be changed apart.
+        A copy of a document that failed gets the same result, only the first copy is listed in failures.
+        The counters add up over all the runs the Dedup is given to, but results are only shared within a run.
+
+        :param (function) normalize: function(text) returning the form compared between documents, e.g. collapse_whitespace.
+                                None (default) only merges identical texts.
+        :param (bool) sentences: set to True to also annotate each distinct sentence once, for documents sharing some of their sentences
+                                (quoted reposts, signatures). Documents are then split before annotation, at sentence-final punctuation (at newlines
+                                with pre_tokenized), which can differ from the split of the server, e.g. around abbreviations.
+                                Ignored by methods that do not split sentences (sent_split=False).
+        :param (int) capacity: maximum number of distinct documents, and of distinct sentences, whose result is kept for later copies.
+                                The least recently seen are dropped first.
+
+        For example:
+            dedup = Dedup(normalize=collapse_whitespace)
+            Segment(weibo_texts, batch_size=16, dedup=dedup)
+            print(dedup.stats())
+    '''
+    def __init__(self, normalize=None, sentences=False, capacity=100000):
+        self.normalize = normalize
+        self.sentences = sentences
+        self.capacity = capacity
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stats(self):
+        '''
+            :return: dict with the number of documents and sentences seen, their duplicates, and the share of duplicates (ratio, sentence_ratio)
+        '''
+        with self._lock:
+            counters = self.counters
+            return {'documents': counters['documents'],
+                    'duplicate_documents': counters['duplicate_documents'],
+                    'ratio': float(counters['duplicate_documents']) / counters['documents'] if counters['documents'] else 0.0,
+                    'sentences': counters['sentences'],
+                    'duplicate_sentences': counters['duplicate_sentences'],
+                    'sentence_ratio': float(counters['duplicate_sentences']) / counters['sentences'] if counters['sentences'] else 0.0}
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+
+class _DuplicateOf(object):
+    '''
+        Result of the copies of a document whose first copy is still being annotated, filled in (pickled) once it is done.
+    '''
+    __slots__ = ('key', 'result')
+
+    def __init__(self, key):
+        self.key = key
+        self.result = _MISSING
+
+class _DedupRun(object):
+    '''
+        State of a Dedup during one run: the results of the distinct documents seen so far, pickled so that each copy is unpickled apart,
+        and with sentences=True, the protobuf sentences of the distinct sentences, as copies detached from the Document of their request.
+
+        :param (Dedup) dedup: settings and counters
+        :param (re.Pattern) sentence_ends: where to split documents into sentences, None to only merge whole documents
+        :param (Metrics) metrics: counts the duplicates, None to count nothing
+    '''
+    def __init__(self, dedup, sentence_ends=None, metrics=None):
+        self.dedup = dedup
+        self.sentence_ends = sentence_ends if dedup.sentences else None
+        self.metrics = metrics
+        self.documents = collections.OrderedDict()
+        self.sentences = collections.OrderedDict()
+        # text of each document sent to the server -> _DuplicateOf given to its copies
+        self.firsts = {}
+        self._lock = threading.Lock()
+
+    def key(self, text):
+        if self.dedup.normalize is not None:
+            text = self.dedup.normalize(text)
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def _count(self, name, n=1):
+        self.dedup.count(name, n)
+        if self.metrics is not None and name.startswith('duplicate_') and n:
+            self.metrics.count(name, n)
+
+    def lookup(self, text):
+        '''
+            Result of an earlier copy of a document (a _DuplicateOf while it is annotated), or _MISSING for the first copy,
+            whose result must then be given to done().
+        '''
+        key = self.key(text)
+        self._count('documents')
+        known = self.documents.get(key, _MISSING)
+        if known is not _MISSING:
+            self.documents.move_to_end(key)
+            self._count('duplicate_documents')
+            return known if isinstance(known, _DuplicateOf) else pickle.loads(known)
+        self.documents[key] = self.firsts[text] = _DuplicateOf(key)
+        return _MISSING
+
+    def done(self, text, result):
+        first = self.firsts.pop(text)
+        first.result = self.documents[first.key] = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        # Documents still being annotated stay, their copies wait for them
+        while len(self.documents) > self.dedup.capacity and not isinstance(next(iter(self.documents.values())), _DuplicateOf):
+            self.documents.popitem(last=False)
+
+    def split(self, text):
+        '''
+            :return: list of (key, sentence) of the non-blank sentences of text, which add up to text with the blanks between them
+        '''
+        pieces = []
+        start = 0
+        for match in self.sentence_ends.finditer(text):
+            pieces.append(text[start:match.end()])
+            start = match.end()
+        pieces.append(text[start:])
+        return [(self.key(piece.strip()), piece) for piece in pieces if piece.strip()]
+
+    def annotate_batch(self, client, texts, timeout=None, metrics=None):
+        '''
+            _annotate_batch() annotating each distinct sentence of :texts: once. The sentences already annotated in this run are reused,
+            the others are packed into one request, and each document gets the sentences of its pieces back in order.
+        '''
+        pieces = [self.split(text) for text in texts]
+        known = {}
+        missing = collections.OrderedDict()
+        duplicates = 0
+        with self._lock:
+            for document in pieces:
+                for key, piece in document:
+                    if key in known or key in missing:
+                        duplicates += 1
+                        continue
+                    sentences = self.sentences.get(key)
+                    if sentences is None:
+                        missing[key] = piece
+                    else:
+                        self.sentences.move_to_end(key)
+                        known[key] = sentences
+                        duplicates += 1
+        self._count('sentences', sum(len(document) for document in pieces))
+        self._count('duplicate_sentences', duplicates)
+        annotated = _annotate_batch(client, list(missing.values()), timeout, metrics) if missing else []
+        failed = {}
+        for key, sentences in zip(missing, annotated):
+            if isinstance(sentences, _FailedDocument):
+                failed[key] = sentences
+            else:
+                known[key] = [_detached_sentence(sent) for sent in sentences or ()]
+        with self._lock:
+            for key in missing:
+                if key in known:
+                    self.sentences[key] = known[key]
+            while len(self.sentences) > self.dedup.capacity:
+                self.sentences.popitem(last=False)
+        per_document = []
+        for text, document in zip(texts, pieces):
+            errors = [failed[key] for key, piece in document if key in failed]
+            if text == '':
+                per_document.append(None)
+            elif errors:
+                per_document.append(errors[0])
+            else:
+                per_document.append([sent for key, piece in document for sent in known[key]])
+        return per_document
+
+def _detached_sentence(sent):
+    '''
+        Copy of a protobuf sentence that does not keep the Document of its request alive.
+    '''
+    copy = Sentence()
+    copy.CopyFrom(sent)
+    return copy
+
+def _dedup_run(dedup, annotators, properties, metrics=None):
+    '''
+        _DedupRun of the dedup parameter of a batch method (None, False, True or a Dedup), None when there is nothing to merge.
+        Sentences are split like the server is asked to: at newlines for pre-tokenized text, not at all for tokenization alone or with tokenize_no_ssplit.
+    '''
+    if dedup is None or dedup is False:
+        return None
+    if dedup is True:
+        dedup = Dedup()
+    properties = properties or {}
+    if list(annotators) == ['tokenize'] or properties.get('tokenize_no_ssplit'):
+        sentence_ends = None
+    elif properties.get('tokenize_pretokenized') or str(properties.get('ssplit.eolonly')).lower() == 'true':
+        sentence_ends = _LINE_ENDS
+    else:
+        sentence_ends = _SENTENCE_ENDS
+    return _DedupRun(dedup, sentence_ends, metrics)
+
+##############################
+##### Batch annotation #######
+##############################
+
+# Documents packed in one request are joined by a blank line, which is also made a sentence break for that request,
+# so that no sentence can start in one document and end in the next.
+_DOCUMENT_DELIMITER = '\n\n'
+_PACKED_REQUEST_PROPERTIES = {'ssplit.newlineIsSentenceBreak': 'two'}
+
+def _verbose_flags(verbose):
+    '''
+        Translates the verbose level of the batch methods into (be_quiet, print_progress).
+    '''
+    if verbose == 0:
+        return True, False
+    elif verbose == 1:
+        return True, True
+    elif verbose == 2:
+        return False, False
+    else:
+        return False, True
+
+def _batch_properties(properties, lang, sent_split=True, pre_tokenized=False, task=None, tokens=False):
+    '''
+        Adds the tokenization options and, for Chinese, the Chinese model properties of :task: to the user properties of a batch method.
+        Returns a new dict, the user properties are not modified.
+        With :tokens: (token-list input, see _token_documents()), the text is split at its spaces and newlines only, whatever the language,
+        so that the server gives back exactly the tokens and sentences sent.
+    '''
+    if tokens:
+        sent_split = True
+        pre_tokenized = True
+    if pre_tokenized:
+        if not properties:
+            properties={'tokenize_pretokenized': True}
+            # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
+        else:
+            properties = dict(properties)
+            properties.update({'tokenize_pretokenized': True})
+            # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
+    if sent_split==False:
+        if not properties:
+            properties={'tokenize_no_ssplit':True}
+            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
+        else:
+            properties = dict(properties)
+            properties.update({'tokenize_no_ssplit':True})
+            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
+    if lang == "zh-cn":
+        properties = get_StanfordCoreNLP_chinese_properties(properties=properties, task=task)
+    if tokens:
+        properties = dict(properties)
+        properties.update(_TOKEN_INPUT_PROPERTIES)
+    return properties
+
+# Server properties of token-list input: whitespace tokenizer (no Chinese segmenter), one sentence per line
+_TOKEN_INPUT_PROPERTIES = {'tokenize.language': 'Whitespace', 'tokenize.whitespace': 'true', 'ssplit.eolonly': 'true'}
+
+def _token_documents(texts, pre_tokenized=True):
+    '''
+        Lets POS_Tag() and Dependency_Parse() take documents as lists of sentences of tokens, e.g. the output of Segment(),
+        which are sent as pre-tokenized text (tokens joined by spaces, sentences by newlines) instead of being joined by the caller.
+        The input is taken as token lists when its first document that is not an empty string is a list or tuple.
+        Strings are then read as pre-tokenized text.
+
+        :param (iterable) texts: documents of a batch method
+        :param (bool) pre_tokenized: pre_tokenized of the method, which token lists require
+
+        :return: (texts, tokens): the documents, serialized lazily (or as a list for a list input) when tokens is True
+    '''
+    # Empty documents say nothing about the input type
+    if isinstance(texts, (list, tuple)):
+        first = next((document for document in texts if document != ''), '')
+    else:
+        texts = iter(texts)
+        read = []
+        for document in texts:
+            read.append(document)
+            if document != '':
+                break
+        first = read[-1] if read else ''
+        texts = itertools.chain(read, texts)
+    if isinstance(first, str):
+        return texts, False
+    if not pre_tokenized:
+        raise ValueError('token lists are pre-tokenized input, they cannot be used with pre_tokenized=False')
+    if isinstance(texts, (list, tuple)):
+        return [_tokens_text(document) for document in texts], True
+    return map(_tokens_text, texts), True
+
+def _tokens_text(document):
+    '''
+        Pre-tokenized text of a document given as a list of sentences of tokens. A token can also be a (word, tag) pair
+        (POS_Tag() output), of which the word is sent. A flat list of tokens (output with sent_split=False) is one sentence.
+        A string document is kept as it is.
+    '''
+    if isinstance(document, str):
+        return document
+    document = list(document)
+    if document and _is_token(document[0]):
+        document = [document]
+    lines = []
+    for sentence in document:
+        if isinstance(sentence, str) or _is_token(sentence):
+            raise ValueError('a token-list document is a list of tokens or a list of sentences of tokens, got {!r}'.format(sentence))
+        words = [token if isinstance(token, str) else token[0] for token in sentence]
+        line = ' '.join(words)
+        # The server splits at whitespace: a token that is empty or holds whitespace would not come back as one token
+        if not words or len(line.split()) != len(words):
+            raise ValueError('tokens must be non-empty and without whitespace, and sentences non-empty, got {!r}'.format(words))
+        lines.append(line)
+    return '\n'.join(lines)
+
+def _is_token(item):
+    '''
+        Tells a token of a token-list document (a word, or a (word, tag) pair) from a sentence, which is a list of tokens.
+    '''
+    return isinstance(item, str) or (isinstance(item, tuple) and len(item) == 2 and isinstance(item[0], str))
+
+def _progress_printer(action, lang, limit):
+    '''
+        Returns a ProgressReporter printing "<action> <language> sentence i of limit" for a document index, or None for languages without a message.
+        With limit=None (input of unknown length) only the document number is printed.
+    '''
+    language = {'zh-cn': 'Chinese', 'en': 'English'}.get(lang)
+    if language is None:
+        return None
+    return ProgressReporter(action, language, total=limit)
+
+class AdaptiveTimeout(object):
+    '''
+        Per-request timeout that scales with the length of the request and with the throughput observed so far in the run,
+        so that long documents get the time they need while short ones still fail fast.
+        Until a request has completed, every request gets :initial:. Afterwards a request of n characters gets
+        slack times the time n characters have taken on average, within [minimum, maximum].
+
+        :param (int) initial: timeout in milliseconds before any throughput is known
+        :param (int) minimum: shortest timeout in milliseconds
+        :param (int) maximum: longest timeout in milliseconds, also the time the client waits for the server
+        :param (float) slack: multiple of the expected time allowed to a request
+
+        For example:
+            failures = []
+            Dependency_Parse(zh_texts, timeout=AdaptiveTimeout(maximum=120000), failures=failures)
+    '''
+    def __init__(self, initial=15000, minimum=5000, maximum=300000, slack=5.0):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.slack = slack
+        self.chars_per_ms = None
+        self._lock = threading.Lock()
+
+    def for_chars(self, chars):
+        '''
+            Timeout in milliseconds for a request of :chars: characters.
+        '''
+        if self.chars_per_ms is None:
+            return self.initial
+        expected = chars / self.chars_per_ms
+        return int(min(self.maximum, max(self.minimum, expected * self.slack)))
+
+    def observe(self, chars, seconds):
+        '''
+            Records a completed request, updating the moving average of the throughput.
+        '''
+        chars_per_ms = max(chars, 1) / max(seconds*1000, 1.0)
+        with self._lock:
+            if self.chars_per_ms is None:
+                self.chars_per_ms = chars_per_ms
+            else:
+                self.chars_per_ms = 0.8*self.chars_per_ms + 0.2*chars_per_ms
+
+def _client_timeout(timeout):
+    '''
+        Timeout the clients are created with: the largest per-request timeout for an AdaptiveTimeout.
+    '''
+    if isinstance(timeout, AdaptiveTimeout):
+        return timeout.maximum
+    return timeout
+
+class _LazyClients(object):
+    '''
+        Servers used by a batch method, started on first use (so that a run whose documents are all known already never starts a JVM) and stopped on exit.
+        A single server keeps the stanza default endpoint. With shards > 1, each server gets its own free port.
+        Each server is started with as many threads as the requests sent to it at the same time.
+
+        :param (int) workers: number of requests sent to each server at the same time
+        :param (int) shards: number of servers
+        :param (str) memory: JVM heap size of each server, e.g. '4G'. None for the stanza default.
+        :param (CoreNLPSharedServer | bool) shared_server: attach to a CoreNLPSharedServer instead of starting servers, True for the one of these settings.
+                                shards is then ignored.
+        :param (Metrics) metrics: times the server start, and the requests sent through these clients
+
+        For example:
+            with _LazyClients(annotators, properties, timeout, be_quiet, shards=4) as clients:
+                client = clients.get()[0]
+    '''
+    def __init__(self, annotators, properties, timeout, be_quiet, workers=1, shards=1, memory=None, shared_server=False, metrics=None):
+        self.annotators = annotators
+        self.properties = properties
+        self.timeout = timeout
+        self.be_quiet = be_quiet
+        self.workers = max(workers, 1)
+        self.shards = max(shards, 1)
+        self.memory = memory
+        self.shared_server = shared_server
+        self.metrics = metrics
+        self._clients = None
+        self._stack = contextlib.ExitStack()
+        self._lock = threading.Lock()
+
+    def get(self):
+        '''
+            Returns the list of started clients, starting them if needed.
+        '''
+        with self._lock:
+            if self._clients is not None:
+                return self._clients
+            started = time.perf_counter()
+            if self.shared_server:
+                server = self.shared_server
+                if not isinstance(server, CoreNLPSharedServer):
+                    server = _shared_server(self.annotators, self.properties, _client_timeout(self.timeout), memory=self.memory, threads=self.workers)
+                self._clients = [self._stack.enter_context(server.attach())]
+            else:
+                client_kwargs = {}
+                if self.workers > 1:
+                    client_kwargs['threads'] = self.workers
+                if self.memory:
+                    client_kwargs['memory'] = self.memory
+                clients = []
+                for shard in range(self.shards):
+                    if self.shards > 1:
+                        client_kwargs['endpoint'] = 'http://localhost:{}'.format(_find_free_port())
+                    client = CoreNLPClient(annotators=self.annotators, properties=self.properties, timeout=_client_timeout(self.timeout),
+                                        be_quiet=self.be_quiet, **client_kwargs)
+                    clients.append(self._stack.enter_context(client))
+                self._clients = clients
+            if self.metrics is not None:
+                self.metrics.lap('server_start', started)
+            return self._clients
+
+    @property
+    def started(self):
+        return self._clients is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stack.close()
+        return False
+
+def _utf16_len(text):
+    '''
+        Length of text as counted by the Java server, which uses UTF-16 code units for character offsets (emoji count as 2).
+    '''
+    return len(text.encode('utf-16-le')) // 2
+
+class _ResolvedBatch(list):
+    '''
+        A list of (index, text) whose results are already known (e.g. empty or cached documents), passed along with the batches to annotate without reaching the server.
+    '''
+    def __init__(self, items=(), results=()):
+        list.__init__(self, items)
+        self.results = list(results)
+
+    def append_result(self, i, text, result):
+        self.append((i, text))
+        self.results.append(result)
+
+# Returned by resolve functions for documents that must be annotated
+_MISSING = object()
+
+def _iter_document_batches(indexed_texts, batch_size=1, max_batch_chars=20000, resolve=None):
+    '''
+        Groups (index, text) pairs into lists to be annotated in a single request each.
+        Empty texts and texts containing the document delimiter are always sent alone.
+        With :resolve:, documents whose result is already known are collected in _ResolvedBatch lists instead.
+        These are yielded after the batch being filled at the same time, so batches can come slightly out of input order.
+
+        :param (iterable[tuple[int, str]]) indexed_texts: documents with their position in the input
+        :param (int) batch_size: maximum number of documents per request
+        :param (int) max_batch_chars: maximum number of characters per request, a longer document is still sent alone
+        :param (function) resolve: function(text) returning the known result of a document, or _MISSING
+
+        :return: generator of lists of (index, text)
+    '''
+    batch = []
+    batch_chars = 0
+    resolved = _ResolvedBatch()
+    for i, text in indexed_texts:
+        if resolve is not None:
+            result = resolve(text)
+            if result is not _MISSING:
+                resolved.append_result(i, text, result)
+                if len(resolved) >= max(batch_size, 1):
+                    if batch:
+                        yield batch
+                        batch = []
+                        batch_chars = 0
+                    yield resolved
+                    resolved = _ResolvedBatch()
+                continue
+        if batch_size <= 1 or text == '' or _DOCUMENT_DELIMITER in text:
+            if batch:
+                yield batch
+                batch = []
+                batch_chars = 0
+            yield [(i, text)]
+            if resolved:
+                yield resolved
+                resolved = _ResolvedBatch()
+            continue
+        if batch and (len(batch) >= batch_size or batch_chars + len(text) > max_batch_chars):
+            yield batch
+            batch = []
+            batch_chars = 0
+            if resolved:
+                yield resolved
+                resolved = _ResolvedBatch()
+        batch.append((i, text))
+        batch_chars += len(text) + len(_DOCUMENT_DELIMITER)
+    if batch:
+        yield batch
+    if resolved:
+        yield resolved
+
+class _FailedDocument(object):
+    '''
+        Returned by _annotate_batch() in place of the sentences of a document that could not be annotated, even in pieces.
+    '''
+    def __init__(self, error):
+        self.error = error
+
+class _SplitSentences(list):
+    '''
+        Sentences of a document that timed out as a whole and was annotated in :pieces: pieces, split at paragraph or sentence boundaries.
+    '''
+    def __init__(self, sentences, pieces):
+        list.__init__(self, sentences)
+        self.pieces = pieces
+
+# Documents shorter than this are not split any further after a timeout
+_MIN_SPLIT_CHARS = 200
+# Places to split a document at, tried in order: paragraphs, lines, then sentence ends
+_SPLIT_BOUNDARIES = (re.compile(r'\n\s*\n'), re.compile(r'\n'), re.compile(r'(?<=[。！？!?；;.])'))
+
+def _split_text(text):
+    '''
+        Splits a document in two at the paragraph or sentence boundary closest to its middle.
+
+        :return: (first half, second half), or None if the document is too short or has no boundary
+    '''
+    if len(text) < _MIN_SPLIT_CHARS:
+        return None
+    middle = len(text) // 2
+    for boundary in _SPLIT_BOUNDARIES:
+        ends = [match.end() for match in boundary.finditer(text) if text[:match.start()].strip() and text[match.end():].strip()]
+        if ends:
+            end = min(ends, key=lambda end: abs(end - middle))
+            return text[:end], text[end:]
+    return None
+
+# Error messages of the CoreNLP server when it gives up on a document because of its length
+_TOO_LONG_MESSAGES = ('timed out', 'timeout', 'too long')
+
+def _too_long(error):
+    '''
+        Tells whether a request failed because of the length of its text (timeout, document too long), which smaller requests can get through.
+        Connection errors and the other errors of the server are not: retrying them in pieces only multiplies the failing requests.
+    '''
+    if isinstance(error.__context__, requests.exceptions.ConnectionError):
+        return False
+    if isinstance(error, TimeoutException):
+        return True
+    if isinstance(error, AnnotationException) and error.args:
+        response = getattr(error.args[0], 'response', None)
+        if response is not None:
+            return any(message in response.text.lower() for message in _TOO_LONG_MESSAGES)
+    return False
+
+def _annotate_request(client, text, properties=None, timeout=None, metrics=None):
+    '''
+        Sends one request, with a timeout fitted to its length when timeout is an AdaptiveTimeout.
+    '''
+    if isinstance(timeout, AdaptiveTimeout):
+        properties = dict(properties or {})
+        properties['timeout'] = timeout.for_chars(len(text))
+        started = time.time()
+        ann = _timed_annotate(client, text, properties, metrics) if metrics is not None else client.annotate(text, properties=properties)
+        timeout.observe(len(text), time.time() - started)
+        return ann
+    if metrics is not None:
+        return _timed_annotate(client, text, properties, metrics)
+    if properties:
+        return client.annotate(text, properties=properties)
+    return client.annotate(text)
+
+def _timed_annotate(client, text, properties, metrics):
+    '''
+        client.annotate() with the HTTP round trip and the protobuf decoding timed apart, as the request and decode stages of :metrics:.
+        The request is sent through CoreNLPClient._request() with the properties annotate() would send. Clients without it are timed as a whole.
+    '''
+    metrics.count('requests')
+    request = getattr(client, '_request', None)
+    if request is None or getattr(client, 'output_format', None) != 'serialized':
+        with metrics.timer('request'):
+            if properties:
+                return client.annotate(text, properties=properties)
+            return client.annotate(text)
+    request_properties = {'outputFormat': client.output_format}
+    if client.annotators is not None:
+        request_properties['annotators'] = client.annotators
+    request_properties.update(properties or {})
+    started = time.perf_counter()
+    response = request(text.encode('utf-8'), request_properties, False)
+    started = metrics.lap('request', started)
+    ann = Document()
+    parseFromDelimitedString(ann, response.content)
+    metrics.lap('decode', started)
+    return ann
+
+def _annotate_document(client, text, timeout=None, metrics=None):
+    '''
+        Annotates a single document. If the server gives up on it (timeout, document too long), the document is split at a paragraph
+        or sentence boundary and each half annotated on its own, recursively, and the sentences are put back together.
+        Other errors fail the document at once.
+
+        :return: list of sentences (_SplitSentences if the document was split), or _FailedDocument
+    '''
+    try:
+        return _annotate_request(client, text, timeout=timeout, metrics=metrics).sentence
+    except Exception as error:
+        halves = _split_text(text) if _too_long(error) else None
+        if halves is None:
+            return _FailedDocument(error)
+    sentences = []
+    pieces = 0
+    for half in halves:
+        half_sentences = _annotate_document(client, half, timeout, metrics)
+        if isinstance(half_sentences, _FailedDocument):
+            return half_sentences
+        sentences.extend(half_sentences)
+        pieces += getattr(half_sentences, 'pieces', 1)
+    return _SplitSentences(sentences, pieces)
+
+def _annotate_batch(client, texts, timeout=None, metrics=None):
+    '''
+        Annotates several documents in one request and splits the returned sentences back per document, using the character offsets of their tokens.
+        If a sentence is found to span two documents, the documents involved are annotated again one by one.
+        A request the server gives up on (timeout, too long) is retried in halves, down to single documents, so that one oversized document
+        never costs the others their results. Any other error, such as a server that cannot be reached, fails every document of the batch at once.
+
+        :param (CoreNLPClient) client: started client
+        :param (list[str]) texts: documents to annotate
+        :param (int | AdaptiveTimeout) timeout: timeout of the run. Only an AdaptiveTimeout is sent with each request.
+        :param (Metrics) metrics: times the requests, None to measure nothing
+
+        :return: list with the sentences of each document, None for empty documents, or _FailedDocument
+    '''
+    if len(texts) == 1:
+        if texts[0] == '':
+            return [None]
+        return [_annotate_document(client, texts[0], timeout, metrics)]
+    try:
+        ann = _annotate_request(client, _DOCUMENT_DELIMITER.join(texts), properties=_PACKED_REQUEST_PROPERTIES, timeout=timeout, metrics=metrics)
+    except Exception as error:
+        if not _too_long(error):
+            return [_FailedDocument(error) for text in texts]
+        half = len(texts) // 2
+        return _annotate_batch(client, texts[:half], timeout, metrics) + _annotate_batch(client, texts[half:], timeout, metrics)
+    per_document, broken = _split_sentences_by_document(ann, texts)
+    for j in broken:
+        per_document[j] = _annotate_document(client, texts[j], timeout, metrics)
+    return per_document
+
+def _split_sentences_by_document(ann, texts):
+    '''
+        Assigns the sentences of a packed request back to the documents joined by _DOCUMENT_DELIMITER.
+
+        :return: (list of sentence lists per document, sorted indices of documents that a sentence spans across and must be annotated alone)
+    '''
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += _utf16_len(text) + len(_DOCUMENT_DELIMITER)
+    per_document = [[] for text in texts]
+    broken = set()
+    for sent in ann.sentence:
+        if len(sent.token) == 0:
+            continue
+        first = bisect.bisect_right(starts, sent.token[0].beginChar) - 1
+        last = bisect.bisect_right(starts, sent.token[-1].beginChar) - 1
+        if first != last:
+            broken.update(range(first, last+1))
+        per_document[first].append(sent)
+    return per_document, sorted(broken)
+
+def _iter_annotated_batches(clients, batches, workers=1, max_pending=None, pipeline=False, annotate=_annotate_batch):
+    '''
+        Annotates batches of (index, text) and yields (batch, sentences per document) in the same order as batches.
+        With several servers or workers, or with pipeline, up to max_pending requests are kept in flight by a thread pool while earlier results are consumed.
+        Each thread takes whichever server slot is free next, so a slow server ends up with fewer batches instead of stalling the run.
+        Batches are pulled from :batches: only as requests are sent, so a lazy input is never read further ahead than that.
+        _ResolvedBatch lists are passed along in order with their known results, without starting the servers.
+
+        :param (_LazyClients) clients: servers to use
+        :param (iterable[list[tuple[int, str]]]) batches: output of _iter_document_batches()
+        :param (int) workers: number of requests sent to each server at the same time
+        :param (int) max_pending: maximum number of batches in flight. Default twice the number of threads.
+        :param (bool) pipeline: send the next request of a single server while the results of the previous one are consumed
+        :param (function) annotate: _annotate_batch(), or a function with the same parameters and result
+    '''
+    threads = clients.shards * max(workers, 1)
+    if threads == 1 and not pipeline:
+        for batch in batches:
+            if isinstance(batch, _ResolvedBatch):
+                yield batch, batch.results
+            else:
+                yield batch, annotate(clients.get()[0], [text for i, text in batch], clients.timeout, clients.metrics)
+        return
+    free_shards = queue.Queue()
+    for worker in range(max(workers, 1)):
+        for shard in range(clients.shards):
+            free_shards.put(shard)
+    def annotate_on_free_client(texts):
+        shard = free_shards.get()
+        try:
+            return annotate(clients.get()[shard], texts, clients.timeout, clients.metrics)
+        finally:
+            free_shards.put(shard)
+    if max_pending is None:
+        max_pending = 2*threads
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = collections.deque()
+        for batch in batches:
+            if isinstance(batch, _ResolvedBatch):
+                pending.append((batch, None))
+            else:
+                pending.append((batch, executor.submit(annotate_on_free_client, [text for i, text in batch])))
+            if len(pending) >= max_pending:
+                batch, future = pending.popleft()
+                yield batch, (batch.results if future is None else future.result())
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, (batch.results if future is None else future.result())
+
+def _iter_documents(clients, texts, convert, empty_result, batch_size=1, max_batch_chars=20000, workers=1, max_pending=None, progress=None,
+                    cache=None, cache_namespace=None, start=0, failures=None, metrics=None, pipeline=False, convert_pool=None, max_converting=None,
+                    deduplicated=None):
+    '''
+        Runs every document of an iterable through the clients and yields the converted result of each one, in input order, as soon as it is ready.
+        Empty documents, cache hits and copies of earlier documents never reach the server.
+        A document that cannot be annotated raises its error, unless :failures: is given: it is then recorded there and gets the result of an empty document.
+
+        :param (_LazyClients) clients: servers to use
+        :param (iterable[str]) texts: documents to annotate, read lazily
+        :param (function) convert: function(sentences) returning the result of one document
+        :param (function) empty_result: function(text) returning the result of an empty document
+        :param (int) batch_size: maximum number of documents per request
+        :param (int) max_batch_chars: maximum number of characters per request
+        :param (int) workers: number of requests sent to each server at the same time
+        :param (int) max_pending: maximum number of batches in flight
+        :param (function) progress: called with the index of each finished document
+        :param (AnnotationCache) cache: results of previous runs, new results are added to it
+        :param (str) cache_namespace: output of AnnotationCache.namespace() for the settings of this run
+        :param (int) start: index of the first document of texts in the whole input, for progress messages
+        :param (list) failures: list receiving a dict for every document that failed or had to be split, see Segment()
+        :param (Metrics) metrics: counts the documents, None to count nothing
+        :param (bool) pipeline: keep the next request in flight while converting, see _iter_annotated_batches()
+        :param (concurrent.futures.Executor) convert_pool: process pool running :convert:, None to convert in this thread
+        :param (int) max_converting: number of documents waiting for the pool before their results are waited for
+        :param (_DedupRun) deduplicated: gives copies of a document the result of the first one, None to annotate every document
+    '''
+    def resolve(text):
+        if metrics is not None:
+            metrics.count('documents')
+            metrics.count('chars', len(text))
+        if text == '':
+            if metrics is not None:
+                metrics.count('empty')
+            return empty_result(text)
+        if deduplicated is not None:
+            result = deduplicated.lookup(text)
+            if result is not _MISSING:
+                return result
+        if cache is not None:
+            result = cache.get(cache.key(cache_namespace, text), _MISSING)
+            if result is not _MISSING:
+                if metrics is not None:
+                    metrics.count('cache_hits')
+                if deduplicated is not None:
+                    deduplicated.done(text, result)
+            return result
+        return _MISSING
+    def converted(sentences):
+        if convert_pool is None or len(sentences) == 0:
+            return convert(sentences)
+        return convert_pool.submit(_convert_serialized, convert, [sent.SerializeToString() for sent in sentences])
+    # Documents converted by the pool are added to the cache once their result is back
+    uncached = {}
+    # Documents whose copies wait for their result
+    firsts = {}
+    def finished(wait):
+        # Yields the results that are ready, in order. Results of the pool are only waited for when :wait:, or when too many are pending.
+        nonlocal next_index
+        while next_index in ready:
+            i = next_index
+            result = ready[i]
+            if isinstance(result, Future):
+                if not wait and not result.done() and len(ready) <= max_converting:
+                    return
+                result = result.result()
+                if i in uncached:
+                    cache.put(cache.key(cache_namespace, uncached.pop(i)), result)
+            elif isinstance(result, _DuplicateOf):
+                result = pickle.loads(result.result)
+            if i in firsts:
+                deduplicated.done(firsts.pop(i), result)
+            del ready[i]
+            if progress:
+                progress(i)
+            yield result
+            next_index += 1
+    batches = _iter_document_batches(enumerate(texts, start), batch_size=batch_size, max_batch_chars=max_batch_chars, resolve=resolve)
+    ready = {}
+    next_index = start
+    annotate = _annotate_batch if deduplicated is None or deduplicated.sentence_ends is None else deduplicated.annotate_batch
+    for batch, per_document in _iter_annotated_batches(clients, batches, workers=workers, max_pending=max_pending, pipeline=pipeline,
+                                                        annotate=annotate):
+        if isinstance(batch, _ResolvedBatch):
+            for (i, text), result in zip(batch, per_document):
+                ready[i] = result
+        else:
+            for (i, text), sentences in zip(batch, per_document):
+                if deduplicated is not None:
+                    firsts[i] = text
+                if sentences is None:
+                    ready[i] = empty_result(text)
+                elif isinstance(sentences, _FailedDocument):
+                    if failures is None:
+                        raise sentences.error
+                    failures.append({'index': i, 'status': 'failed', 'chars': len(text), 'error': repr(sentences.error)})
+                    if metrics is not None:
+                        metrics.count('failed')
+                    ready[i] = empty_result('')
+                elif isinstance(sentences, _SplitSentences):
+                    if failures is not None:
+                        failures.append({'index': i, 'status': 'split', 'chars': len(text), 'pieces': sentences.pieces})
+                    if metrics is not None:
+                        metrics.count('split')
+                    ready[i] = converted(sentences)
+                else:
+                    ready[i] = converted(sentences)
+                    if cache is not None:
+                        if isinstance(ready[i], Future):
+                            uncached[i] = text
+                        else:
+                            cache.put(cache.key(cache_namespace, text), ready[i])
+        for result in finished(False):
+            yield result
+    for result in finished(True):
+        yield result
+
+def _convert_serialized(convert, blobs):
+    '''
+        Runs :convert: in a worker process of convert_processes, on the sentences of one document serialized by the parent process.
+    '''
+    sentences = []
+    for blob in blobs:
+        sent = Sentence()
+        sent.ParseFromString(blob)
+        sentences.append(sent)
+    return convert(sentences)
+
+def _noop():
+    pass
+
+@contextlib.contextmanager
+def _convert_pool(processes):
+    '''
+        Process pool of the convert_processes parameter, None for processes=0. The workers are started right away,
+        before the servers and their threads, and stopped on exit.
+    '''
+    if not processes:
+        yield None
+        return
+    pool = ProcessPoolExecutor(max_workers=processes)
+    try:
+        pool.submit(_noop).result()
+        yield pool
+    finally:
+        pool.shutdown(wait=True)
+
+_PROGRESS_ACTIONS = {'Segment': 'Segmenting', 'POS_Tag': 'POS Tagging', 'Dependency_Parse': 'Dependency Parsing', 'Annotate': 'Annotating'}
+
+def _run_batch(method, texts, annotators, properties, convert, empty_result, result_options,
+                timeout=15000, verbose=1, lang='zh-cn', batch_size=1, max_batch_chars=20000, workers=1, shards=1, memory=None,
+                cache=None, window=None, shared_server=False, checkpoint=None, failures=None, raw=False, metrics=None,
+                pipeline=False, convert_processes=0, dedup=None):
+    '''
+        Generator shared by the batch and iter_* methods: starts the servers when first needed, annotates every document and yields the results in order.
+
+        :param (str) method: name of the public method, used for progress messages and cache entries
+        :param (iterable[str]) texts: documents to annotate
+        :param (list[str]) annotators: CoreNLP annotators
+        :param (dict) properties: effective properties, output of _batch_properties()
+        :param (function) convert: function(sentences) returning the result of one document
+        :param (function) empty_result: function(text) returning the result of an empty document
+        :param (dict) result_options: output options of the method, which tell apart cache entries
+        :param (int) window: maximum number of documents read ahead. None for the default of _iter_annotated_batches().
+        :param (bool) raw: yield an AnnotatedDocument per document, which calls :convert: only when asked
+        See Segment() for the other parameters.
+    '''
+    if raw:
+        # Nothing left to convert in worker processes
+        convert_processes = 0
+        dependency_type = result_options.get('dependency_type', 'basicDependencies')
+        convert = functools.partial(_raw_document, convert=convert, dependency_type=dependency_type)
+        empty_result = functools.partial(_raw_empty, empty_result=empty_result, dependency_type=dependency_type)
+        result_options = dict(result_options, raw=True)
+    elif metrics is not None and not convert_processes:
+        # The converters time their own convert and format stages
+        convert = functools.partial(convert, metrics=metrics)
+    be_quiet, print_progress = _verbose_flags(verbose)
+    progress = None
+    if print_progress:
+        progress = _progress_printer(_PROGRESS_ACTIONS[method], lang, len(texts) if hasattr(texts, '__len__') else None)
+    max_pending = None if window is None else _window_pending(window, batch_size)
+    deduplicated = _dedup_run(dedup, annotators, properties, metrics=metrics)
+    if checkpoint is not None:
+        texts = iter(texts)
+        # Texts read ahead but not yet yielded, in order, so that each result is journaled with its text
+        read_texts = collections.deque()
+        def read(texts):
+            for text in texts:
+                read_texts.append(text)
+                yield text
+    with _opened_cache(cache) as cache, _convert_pool(convert_processes) as convert_pool, \
+            _LazyClients(annotators, properties, timeout, be_quiet, workers=workers, shards=shards, memory=memory,
+                        shared_server=shared_server, metrics=metrics) as clients:
+        namespace = AnnotationCache.namespace(method, annotators, properties, **result_options)
+        with _opened_checkpoint(checkpoint, namespace) as journal:
+            start = 0
+            if journal is not None:
+                for result in journal.replay(texts):
+                    if progress:
+                        progress(start)
+                    start += 1
+                    yield result
+                texts = read(texts)
+                # Documents listed as failed are journaled as such, for a resumed run to annotate them again
+                index = start
+                failed = set()
+                seen_failures = len(failures) if failures is not None else 0
+            for result in _iter_documents(clients, texts, convert, empty_result, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                                        workers=workers, max_pending=max_pending, progress=progress,
+                                        cache=cache, cache_namespace=namespace, start=start, failures=failures, metrics=metrics,
+                                        pipeline=pipeline or bool(convert_processes), convert_pool=convert_pool, max_converting=2*convert_processes,
+                                        deduplicated=deduplicated):
+                if journal is not None:
+                    while failures is not None and seen_failures < len(failures):
+                        if failures[seen_failures]['status'] == 'failed':
+                            failed.add(failures[seen_failures]['index'])
+                        seen_failures += 1
+                    journal.append(read_texts.popleft(), result, failed=index in failed)
+                    index += 1
+                yield result
+    if progress:
+        progress.finish()
+
+def _window_pending(window, batch_size):
+    '''
+        Number of batches that can be in flight without reading more than :window: documents ahead.
+    '''
+    return max(1, window // max(batch_size, 1))
+
+##############################
+##### Annotation cache #######
+##############################
+
+class AnnotationCache(object):
+    '''
+        Persistent on-disk cache of per-document results, shared between runs (and processes) through a single SQLite file.
+        Entries are keyed by a hash of the text and of everything that affects the result: the method, annotators,
+        the effective properties (including the Chinese ones) and the output options such as dependency_type.
+        When the file grows over max_bytes, the least recently used entries are removed.
+
+        :param (str) path: cache file, created if it does not exist
+        :param (int) max_bytes: maximum total size of the stored results
+        :param (int) commit_every: number of new entries written before committing them to disk
+
+        hits and misses count lookups since the cache was opened, evictions counts removed entries.
+
+        For example:
+            cache = AnnotationCache('corenlp_cache.sqlite')
+            Dependency_Parse(zh_texts, cache=cache)
+            Dependency_Parse(zh_texts, cache=cache) # no server started
+            print(cache.stats())
+    '''
+    def __init__(self, path, max_bytes=2*1024**3, commit_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._uncommitted = 0
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access REAL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self._connection.commit()
+        self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    @staticmethod
+    def namespace(method, annotators, properties, **options):
+        '''
+            Hash of the settings of a run, computed once and combined with each text by key().
+
+            :param (str) method: name of the method producing the results
+            :param (list[str]) annotators: CoreNLP annotators
+            :param (dict) properties: effective properties sent to the server
+            :param options: output options affecting the result, e.g. dependency_type, tolist
+        '''
+        settings = [method, list(annotators or ()), _properties_key(properties), sorted((key, repr(value)) for key, value in options.items())]
+        return hashlib.sha256(json.dumps(settings, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key(namespace, text):
+        return hashlib.sha256((namespace + '\0' + text).encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        '''
+            Returns the cached result for key (a new copy every time), or default.
+        '''
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM entries WHERE key=?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._connection.execute('UPDATE entries SET last_access=? WHERE key=?', (time.time(), key))
+            self._written()
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        '''
+            Stores a result, evicting the least recently used entries if the cache grows over max_bytes.
+        '''
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            row = self._connection.execute('SELECT size FROM entries WHERE key=?', (key,)).fetchone()
+            if row is not None:
+                self._size -= row[0]
+            self._connection.execute('INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                                    (key, sqlite3.Binary(blob), len(blob), time.time()))
+            self._size += len(blob)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._written()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            rows = self._connection.execute('SELECT key, size FROM entries ORDER BY last_access LIMIT 100').fetchall()
+            if not rows:
+                self._size = 0
+                break
+            for key, size in rows:
+                self._connection.execute('DELETE FROM entries WHERE key=?', (key,))
+                self._size -= size
+                self.evictions += 1
+                if self._size <= self.max_bytes:
+                    break
+
+    def _written(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        '''
+            Commits pending writes to disk.
+        '''
+        with self._lock:
+            self._connection.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def stats(self):
+        '''
+            :return: dict with hits, misses, hit_rate, evictions, entries and size_bytes
+        '''
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self),
+                'size_bytes': self._size}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+@contextlib.contextmanager
+def _opened_cache(cache):
+    '''
+        Accepts an AnnotationCache, a path to open one (closed on exit), or None. Pending writes are committed on exit.
+    '''
+    if cache is None:
+        yield None
+    elif isinstance(cache, AnnotationCache):
+        try:
+            yield cache
+        finally:
+            cache.flush()
+    else:
+        with AnnotationCache(cache) as opened:
+            yield opened
+
+########################
+##### Checkpoints ######
+########################
+
+# Each frame of a checkpoint file is its length followed by a pickled list
+_FRAME_HEADER = struct.Struct('<Q')
+_CHECKPOINT_VERSION = 1
+
+class _FailedDocumentEntry(object):
+    '''
+        Class of _FAILED_DOCUMENT, the result journaled for a document that failed. Pickled by reference, so it is the same object once read back.
+    '''
+    def __reduce__(self):
+        return '_FAILED_DOCUMENT'
+
+_FAILED_DOCUMENT = _FailedDocumentEntry()
+
+def _text_digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+class Checkpoint(object):
+    '''
+        Journal of a long batch run, so that a run that dies (server crash, out of memory, timeout) can resume where it stopped
+        instead of starting again from zero.
+        Results are appended to the file in input order, every :every: documents and when the run stops, together with a hash of each text.
+        Run again with the same file, input and settings, the documents already done are read back from the file instead of annotated,
+        and the output is the same as that of an uninterrupted run. A file written with other settings, or for another input, raises ValueError.
+        Documents that failed (see the failures parameter of the methods) are journaled as failed: a resumed run stops reading the file
+        at the first of them, and annotates it again together with the documents after it.
+
+        :param (str) path: checkpoint file, created if it does not exist
+        :param (int) every: number of documents written to disk at once. A crash loses at most this many documents.
+
+        For example:
+            result = Dependency_Parse(zh_texts, checkpoint='dependency_parse.ckpt') # dies at document 800k
+            result = Dependency_Parse(zh_texts, checkpoint='dependency_parse.ckpt') # reads 800k results back, annotates the rest
+    '''
+    def __init__(self, path, every=1000):
+        self.path = path
+        self.every = every
+        self.done = 0
+        self._pending = []
+        self._file = None
+
+    def open(self, namespace):
+        '''
+            Opens the file for the run with these settings (output of AnnotationCache.namespace()), writing its header if it is new.
+        '''
+        self._file = open(self.path, 'a+b')
+        self._file.seek(0)
+        header = self._read_frame()
+        if header is None:
+            self._file.seek(0)
+            self._file.truncate()
+            self._write_frame({'version': _CHECKPOINT_VERSION, 'namespace': namespace})
+            self._file.seek(0)
+            self._read_frame()
+        elif header != {'version': _CHECKPOINT_VERSION, 'namespace': namespace}:
+            self._file.close()
+            raise ValueError('Checkpoint {} was written with other settings'.format(self.path))
+        self.done = 0
+        return self
+
+    def _read_frame(self):
+        '''
+            Returns the next frame, or None at the end of the file or at a frame cut short by a crash.
+        '''
+        head = self._file.read(_FRAME_HEADER.size)
+        if len(head) < _FRAME_HEADER.size:
+            return None
+        size, = _FRAME_HEADER.unpack(head)
+        body = self._file.read(size)
+        if len(body) < size:
+            return None
+        return pickle.loads(body)
+
+    def _write_frame(self, content):
+        body = pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.write(_FRAME_HEADER.pack(len(body)) + body)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def replay(self, texts):
+        '''
+            Yields the results already in the file, reading the matching texts from the :texts: iterator,
+            and leaves the rest of the iterator for the documents still to annotate.
+        '''
+        while True:
+            offset = self._file.tell()
+            records = self._read_frame()
+            if records is None:
+                # Drop a last frame cut short by a crash, new frames are appended after the last complete one
+                self._file.seek(offset)
+                self._file.truncate()
+                return
+            for n, (digest, result) in enumerate(records):
+                if result is _FAILED_DOCUMENT:
+                    # Keep the records before it, the failed document and the ones after it are annotated and journaled again
+                    self._file.seek(offset)
+                    self._file.truncate()
+                    if n:
+                        self._write_frame(records[:n])
+                    return
+                text = next(texts, None)
+                if text is None or _text_digest(text) != digest:
+                    raise ValueError('Checkpoint {} does not match the input at document {}'.format(self.path, self.done))
+                self.done += 1
+                yield result
+
+    def append(self, text, result, failed=False):
+        self._pending.append((_text_digest(text), _FAILED_DOCUMENT if failed else result))
+        if len(self._pending) >= self.every:
+            self.flush()
+
+    def flush(self):
+        '''
+            Writes the pending results to disk.
+        '''
+        if self._pending:
+            self._write_frame(self._pending)
+            self.done += len(self._pending)
+            self._pending = []
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+@contextlib.contextmanager
+def _opened_checkpoint(checkpoint, namespace):
+    '''
+        Accepts a Checkpoint, a path to open one, or None. Pending results are written on exit, also when the run fails.
+    '''
+    if checkpoint is None:
+        yield None
+        return
+    if not isinstance(checkpoint, Checkpoint):
+        checkpoint = Checkpoint(checkpoint)
+    checkpoint.open(namespace)
+    try:
+        yield checkpoint
+    finally:
+        checkpoint.close()
+
+##########################
+##### Compact results ####
+##########################
+
+class TokenStore(object):
+    '''
+        Compact container of Segment() or POS_Tag() results, returned by these methods with compact=True.
+        Words and tags are interned once in a vocabulary, and the documents are stored as flat arrays of ids:
+            word_ids: vocabulary id of each token, in order (array of unsigned int)
+            tag_ids: tag id of each token, for POS_Tag() results (array of unsigned short)
+            sentence_offsets: index in word_ids of the first token of each sentence, plus the total number of tokens
+            document_offsets: index in sentence_offsets of the first sentence of each document, plus the total number of sentences
+        This takes about a tenth of the memory of the nested lists of strings and tuples, and pickles as a few byte strings.
+        Documents are read through light views, and converted to the usual output only when asked:
+            store[i].tolist() is what the method returns for document i without compact, and store.tolist() the whole list.
+
+        :param (bool) tagged: True for POS_Tag() results of (word, tag), False for Segment() results of words
+        :param (bool) sent_split: sent_split of the method, used by tolist()
+        :param (bool) tolist: tolist of the method, used by tolist()
+
+        For example:
+            store = Segment(zh_texts, compact=True)
+            store[0].tolist()
+            >>>[['国务院', '日前', '发出', ...]]
+            store[0][0].words
+            >>>['国务院', '日前', '发出', ...]
+            arrays = store.to_numpy() # needs NumPy
+    '''
+    # Name and typecode of the arrays holding the documents
+    _ARRAYS = (('word_ids', 'I'), ('tag_ids', 'H'), ('sentence_offsets', 'Q'), ('document_offsets', 'Q'))
+
+    def __init__(self, tagged=False, sent_split=True, tolist=True):
+        self.tagged = tagged
+        self.output_options = {'sent_split': sent_split, 'tolist': tolist}
+        self.vocabulary = []
+        self.tags = []
+        self.word_ids = array.array('I')
+        self.tag_ids = array.array('H')
+        self.sentence_offsets = array.array('Q', [0])
+        self.document_offsets = array.array('Q', [0])
+        self._vocabulary_ids = {}
+        self._tag_ids = {}
+
+    @classmethod
+    def from_results(cls, results, tagged=False, sent_split=True, tolist=True):
+        '''
+            Builds a store from an iterable of results in the sent_split=True, tolist=True format, e.g. iter_segment() or iter_pos_tag() output.
+        '''
+        store = cls(tagged=tagged, sent_split=sent_split, tolist=tolist)
+        store.extend(results)
+        return store
+
+    def _intern(self, word, ids, values):
+        word_id = ids.get(word)
+        if word_id is None:
+            word_id = ids[word] = len(values)
+            values.append(word)
+        return word_id
+
+    def append(self, sentences):
+        '''
+            Adds one document, given as a list of sentences of words (or of (word, tag) for a tagged store).
+        '''
+        for sent in sentences:
+            if self.tagged:
+                for word, tag in sent:
+                    self.word_ids.append(self._intern(word, self._vocabulary_ids, self.vocabulary))
+                    self.tag_ids.append(self._intern(tag, self._tag_ids, self.tags))
+            else:
+                self.word_ids.extend(self._intern(word, self._vocabulary_ids, self.vocabulary) for word in sent)
+            self.sentence_offsets.append(len(self.word_ids))
+        self.document_offsets.append(len(self.sentence_offsets) - 1)
+
+    def extend(self, results):
+        for sentences in results:
+            self.append(sentences)
+
+    def __len__(self):
+        return len(self.document_offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [_DocumentView(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('document index out of range')
+        return _DocumentView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield _DocumentView(self, i)
+
+    def tolist(self):
+        '''
+            The results in the usual nested-list (or string) format of the method, for every document.
+        '''
+        return [document.tolist() for document in self]
+
+    def _document_output(self, document):
+        if self.tagged:
+            return _pos_tagged_output([sent.pairs for sent in document], **self.output_options)
+        return _segmented_output([sent.words for sent in document], **self.output_options)
+
+    @property
+    def nbytes(self):
+        '''
+            Size of the arrays in bytes, the vocabularies not included.
+        '''
+        return sum(len(getattr(self, name)) * getattr(self, name).itemsize for name, typecode in self._ARRAYS)
+
+    def to_numpy(self):
+        '''
+            The arrays of the store (word_ids, tag_ids, sentence_offsets, ...) as a dict of NumPy arrays sharing its memory (no copy).
+            The store cannot grow while they are in use.
+        '''
+        import numpy
+        dtypes = {'H': numpy.uint16, 'I': numpy.uint32, 'Q': numpy.uint64}
+        arrays = {}
+        for name, typecode in self._ARRAYS:
+            values = getattr(self, name)
+            arrays[name] = numpy.frombuffer(values, dtype=dtypes[typecode]) if len(values) else numpy.zeros(0, dtype=dtypes[typecode])
+        return arrays
+
+    def __getstate__(self):
+        state = {'tagged': self.tagged, 'output_options': self.output_options, 'vocabulary': self.vocabulary, 'tags': self.tags}
+        for name, typecode in self._ARRAYS:
+            state[name] = getattr(self, name).tobytes()
+        return state
+
+    def __setstate__(self, state):
+        self.tagged = state['tagged']
+        self.output_options = state['output_options']
+        self.vocabulary = state['vocabulary']
+        self.tags = state['tags']
+        self._vocabulary_ids = {word: word_id for word_id, word in enumerate(self.vocabulary)}
+        self._tag_ids = {tag: tag_id for tag_id, tag in enumerate(self.tags)}
+        for name, typecode in self._ARRAYS:
+            values = array.array(typecode)
+            values.frombytes(state[name])
+            setattr(self, name, values)
+
+class _DocumentView(object):
+    '''
+        Document i of a TokenStore, indexable by sentence.
+    '''
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __len__(self):
+        offsets = self.store.document_offsets
+        return offsets[self.index+1] - offsets[self.index]
+
+    def __getitem__(self, j):
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError('sentence index out of range')
+        return self.store._sentence_view(self.store, self.store.document_offsets[self.index] + j)
+
+    def __iter__(self):
+        for j in range(self.store.document_offsets[self.index], self.store.document_offsets[self.index+1]):
+            yield self.store._sentence_view(self.store, j)
+
+    def tolist(self):
+        '''
+            The result of this document in the usual format of the method.
+        '''
+        return self.store._document_output(self)
+
+class _SentenceView(object):
+    '''
+        Sentence j of a TokenStore.
+    '''
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def _span(self):
+        offsets = self.store.sentence_offsets
+        return offsets[self.index], offsets[self.index+1]
+
+    def __len__(self):
+        start, end = self._span()
+        return end - start
+
+    @property
+    def word_ids(self):
+        start, end = self._span()
+        return self.store.word_ids[start:end]
+
+    @property
+    def words(self):
+        vocabulary = self.store.vocabulary
+        return [vocabulary[word_id] for word_id in self.word_ids]
+
+    @property
+    def tags(self):
+        start, end = self._span()
+        tags = self.store.tags
+        return [tags[tag_id] for tag_id in self.store.tag_ids[start:end]]
+
+    @property
+    def pairs(self):
+        return list(zip(self.words, self.tags))
+
+TokenStore._sentence_view = _SentenceView
+
+class DependencyGraphs(TokenStore):
+    '''
+        Compact container of Dependency_Parse() results, returned by it with compact=True. Edges keep the token indices instead of words,
+        so a word that repeats in a sentence is never ambiguous, and the whole batch is held in flat arrays (CSR layout) that NumPy can use as they are.
+        On top of the word ids and offsets of TokenStore:
+            sources, targets: index of the head and of the dependent of each edge in its sentence, from 1 as in CoreNLP (array of unsigned int)
+            label_ids: id of the relation of each edge in labels (array of unsigned short)
+            edge_offsets: index in sources of the first edge of each sentence, plus the total number of edges
+        The index in word_ids of the head of edge e in sentence s is sentence_offsets[s] + sources[e] - 1.
+        store[i].tolist() is what Dependency_Parse() returns for document i without compact, and store.tolist() the whole list.
+
+        :param (bool) tolist: tolist of Dependency_Parse(), used by tolist()
+        :param (bool) output_with_sentence: output_with_sentence of Dependency_Parse(), used by tolist()
+
+        For example:
+            graphs = Dependency_Parse(zh_texts, compact=True)
+            graphs[0][0].edges
+            >>>[('compound:nn', 3, 1), ...]
+            arrays = graphs.to_numpy()
+            edge_sentence = numpy.repeat(numpy.arange(len(arrays['edge_offsets']) - 1), numpy.diff(arrays['edge_offsets']))
+            heads = arrays['sentence_offsets'][edge_sentence] + arrays['sources'] - 1
+    '''
+    _ARRAYS = TokenStore._ARRAYS + (('sources', 'I'), ('targets', 'I'), ('label_ids', 'H'), ('edge_offsets', 'Q'))
+
+    def __init__(self, tolist=True, output_with_sentence=True):
+        TokenStore.__init__(self, tagged=False)
+        self.output_options = {'tolist': tolist, 'output_with_sentence': output_with_sentence}
+        self.labels = []
+        self.sources = array.array('I')
+        self.targets = array.array('I')
+        self.label_ids = array.array('H')
+        self.edge_offsets = array.array('Q', [0])
+        self.empty_documents = set()
+        self._label_ids = {}
+
+    @classmethod
+    def from_results(cls, results, tolist=True, output_with_sentence=True):
+        '''
+            Builds a store from an iterable of lists of (words, edges) per sentence, None for an empty document.
+        '''
+        store = cls(tolist=tolist, output_with_sentence=output_with_sentence)
+        store.extend(results)
+        return store
+
+    def append(self, graphs):
+        '''
+            Adds one document, given as a list of (words, edges) per sentence, each edge a (dep, source, target) tuple. None adds an empty document.
+        '''
+        if graphs is None:
+            self.empty_documents.add(len(self))
+            graphs = []
+        for words, edges in graphs:
+            for dep, source, target in edges:
+                self.sources.append(source)
+                self.targets.append(target)
+                self.label_ids.append(self._intern(dep, self._label_ids, self.labels))
+            self.edge_offsets.append(len(self.sources))
+        TokenStore.append(self, [words for words, edges in graphs])
+
+    def _document_output(self, document):
+        if document.index in self.empty_documents:
+            return _dependency_parse_empty('', **self.output_options)
+        return _dependency_parse_output([(sent.words, sent.edges) for sent in document], **self.output_options)
+
+    def __getstate__(self):
+        state = TokenStore.__getstate__(self)
+        state.update({'labels': self.labels, 'empty_documents': sorted(self.empty_documents)})
+        return state
+
+    def __setstate__(self, state):
+        TokenStore.__setstate__(self, state)
+        self.labels = state['labels']
+        self._label_ids = {label: label_id for label_id, label in enumerate(self.labels)}
+        self.empty_documents = set(state['empty_documents'])
+
+class _GraphSentenceView(_SentenceView):
+    '''
+        Sentence j of a DependencyGraphs, with its edges.
+    '''
+    __slots__ = ()
+
+    @property
+    def edges(self):
+        '''
+            List of (dep, source, target), with the token indices of CoreNLP (from 1).
+        '''
+        store = self.store
+        start, end = store.edge_offsets[self.index], store.edge_offsets[self.index+1]
+        labels = store.labels
+        return [(labels[label_id], source, target)
+                for label_id, source, target in zip(store.label_ids[start:end], store.sources[start:end], store.targets[start:end])]
+
+DependencyGraphs._sentence_view = _GraphSentenceView
+
+######################
+##### Raw results ####
+######################
+
+class AnnotatedDocument(object):
+    '''
+        Lazy result of one document, returned by the batch and iter_* methods with raw=True. It keeps the protobuf sentences sent back by the server
+        and reads words, tags or edges from them only when they are accessed, so a loop that looks at a few fields skips building the nested lists
+        and strings of every document. tolist() converts it to the usual output of the method, with the options of the call.
+        The sentences of documents packed in one request (batch_size > 1) share the protobuf Document of the request, which is freed with the last of them.
+
+        sentences: protobuf Sentence messages of the document
+        document.words, document.tags: words and tags per sentence
+        document.edges: (dep, source, target) per sentence, with the token indices of CoreNLP (from 1), for the dependency_type of the call
+        document[j]: light view of sentence j, with the same fields
+
+        For example:
+            for document in iter_dependency_parse(texts, raw=True):
+                roots = [[target for dep, source, target in edges if dep == 'root'] for edges in document.edges]
+            Dependency_Parse(zh_texts, raw=True)[0].tolist()
+            >>>[(['国务院', '日前', '发出', ...], [('nsubj', '发出', '国务院'), ...])]
+    '''
+    __slots__ = ('sentences', 'dependency_type', '_convert', '_empty')
+
+    def __init__(self, sentences, convert=None, dependency_type='basicDependencies', empty=None):
+        self.sentences = sentences
+        self.dependency_type = dependency_type
+        self._convert = convert
+        # (result,) of an empty or failed document, which has no sentences to convert
+        self._empty = empty
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def __getitem__(self, j):
+        return _RawSentenceView(self.sentences[j], self.dependency_type)
+
+    def __iter__(self):
+        for sent in self.sentences:
+            yield _RawSentenceView(sent, self.dependency_type)
+
+    @property
+    def words(self):
+        return [[token.word for token in sent.token] for sent in self.sentences]
+
+    @property
+    def tags(self):
+        return [[token.pos for token in sent.token] for sent in self.sentences]
+
+    @property
+    def edges(self):
+        return [sent.edges for sent in self]
+
+    def tolist(self):
+        '''
+            The result of this document in the usual format of the method.
+        '''
+        if self._empty is not None:
+            return self._empty[0]
+        return self._convert(self.sentences)
+
+    def __getstate__(self):
+        # stanza's protobuf classes cannot be pickled by reference, the sentences are stored serialized
+        return {'sentences': [sent.SerializeToString() for sent in self.sentences], 'dependency_type': self.dependency_type,
+                'convert': self._convert, 'empty': self._empty}
+
+    def __setstate__(self, state):
+        self.sentences = []
+        for blob in state['sentences']:
+            sent = Sentence()
+            sent.ParseFromString(blob)
+            self.sentences.append(sent)
+        self.dependency_type = state['dependency_type']
+        self._convert = state['convert']
+        self._empty = state['empty']
+
+class _RawSentenceView(object):
+    '''
+        One protobuf sentence of an AnnotatedDocument.
+    '''
+    __slots__ = ('sentence', 'dependency_type')
+
+    def __init__(self, sentence, dependency_type='basicDependencies'):
+        self.sentence = sentence
+        self.dependency_type = dependency_type
+
+    def __len__(self):
+        return len(self.sentence.token)
+
+    @property
+    def words(self):
+        return [token.word for token in self.sentence.token]
+
+    @property
+    def tags(self):
+        return [token.pos for token in self.sentence.token]
+
+    @property
+    def pairs(self):
+        return [(token.word, token.pos) for token in self.sentence.token]
+
+    @property
+    def edges(self):
+        '''
+            List of (dep, source, target), with the token indices of CoreNLP (from 1). A dict of these lists by type for a list of dependency types.
+        '''
+        types = _dependency_types(self.dependency_type)
+        if types is None:
+            return [(edge.dep, edge.source, edge.target) for edge in _dependency_getter(self.dependency_type)(self.sentence).edge]
+        return dict((one_type, [(edge.dep, edge.source, edge.target) for edge in _dependency_getter(one_type)(self.sentence).edge]) for one_type in types)
+
+def _raw_document(sentences, convert, dependency_type='basicDependencies'):
+    '''
+        Wraps the annotated sentences of one document instead of converting them, for raw=True.
+    '''
+    return AnnotatedDocument(list(sentences), convert, dependency_type=dependency_type)
+
+def _raw_empty(text, empty_result, dependency_type='basicDependencies'):
+    '''
+        AnnotatedDocument of an empty or failed document, holding its usual result.
+    '''
+    return AnnotatedDocument([], dependency_type=dependency_type, empty=(empty_result(text),))
+
+##########################
+##### Result files #######
+##########################
+
+# First line of a result file, followed by one JSON document per line
+_RESULT_FILE_FORMAT = 'StanfordCoreNLP-results'
+_RESULT_FILE_VERSION = 1
+_RESULT_KINDS = ('segment', 'pos_tag', 'dependency_parse')
+
+def _restore_pos_tag(document, sent_split=True):
+    if isinstance(document, str):
+        return document
+    if sent_split:
+        return [[tuple(pair) for pair in sent] for sent in document]
+    return [tuple(pair) for pair in document]
+
+def _restore_dependency_parse(document, output_with_sentence=True):
+    if isinstance(document, str):
+        return document
+    if isinstance(document, dict):
+        # Several dependency types of the same document
+        return {one_type: _restore_dependency_parse(one_document, output_with_sentence) for one_type, one_document in document.items()}
+    if output_with_sentence:
+        return [(words, [tuple(edge) for edge in edges]) for words, edges in document]
+    return [[tuple(edge) for edge in edges] for edges in document]
+
+class ResultWriter(object):
+    '''
+        Writes Segment(), POS_Tag() or Dependency_Parse() results to a file, one document per line, as they come.
+        The file starts with a header line giving the format version, the kind of results and the options needed to read them back,
+        then every document is a line of JSON, so words containing '#', ',', '(', ')', spaces or newlines are stored safely,
+        unlike the strings of tolist=False. read_results() reads the file back to the same nested lists and tuples.
+
+        :param (str | file) file: path of the file to create, or a file opened in text mode
+        :param (str) kind: 'segment', 'pos_tag' or 'dependency_parse'
+        :param (bool) sent_split: sent_split of POS_Tag()
+        :param (bool) output_with_sentence: output_with_sentence of Dependency_Parse()
+
+        For example:
+            with ResultWriter('parsed.jsonl', 'dependency_parse') as writer:
+                for result in iter_dependency_parse(texts):
+                    writer.write(result)
+
+            for result in read_results('parsed.jsonl'):
+                ...
+    '''
+    def __init__(self, file, kind, sent_split=True, output_with_sentence=True):
+        if kind not in _RESULT_KINDS:
+            raise ValueError('kind must be one of {}'.format(', '.join(_RESULT_KINDS)))
+        self._owned = isinstance(file, str)
+        self._file = open(file, 'w', encoding='utf-8') if self._owned else file
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        self.count = 0
+        header = {'format': _RESULT_FILE_FORMAT, 'version': _RESULT_FILE_VERSION, 'kind': kind,
+                'options': {'sent_split': sent_split, 'output_with_sentence': output_with_sentence}}
+        self._file.write(self._encode(header) + '\n')
+
+    def write(self, result):
+        '''
+            Writes the result of one document.
+        '''
+        self._file.write(self._encode(result) + '\n')
+        self.count += 1
+
+    def write_all(self, results):
+        for result in results:
+            self.write(result)
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def read_results(file):
+    '''
+        Reads a file written by ResultWriter, one document at a time, in a single pass.
+
+        :param (str | file) file: path of the file, or a file opened in text mode
+
+        :return: generator of results, in the format the method returned them (nested lists, tuples or strings)
+    '''
+    owned = isinstance(file, str)
+    if owned:
+        file = open(file, encoding='utf-8')
+    try:
+        decode = json.JSONDecoder().decode
+        header = decode(file.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != _RESULT_FILE_FORMAT:
+            raise ValueError('Not a StanfordCoreNLP results file')
+        if header['version'] > _RESULT_FILE_VERSION:
+            raise ValueError('Results file version {} is newer than this module reads ({})'.format(header['version'], _RESULT_FILE_VERSION))
+        options = header['options']
+        if header['kind'] == 'pos_tag':
+            restore = functools.partial(_restore_pos_tag, sent_split=options['sent_split'])
+        elif header['kind'] == 'dependency_parse':
+            restore = functools.partial(_restore_dependency_parse, output_with_sentence=options['output_with_sentence'])
+        else:
+            restore = None
+        for line in file:
+            document = decode(line)
+            yield document if restore is None else restore(document)
+    finally:
+        if owned:
+            file.close()
+
+class ShardedResultWriter(object):
+    '''
+        Streams results into a folder of shard files with an offset index, so that ShardedResults can later read any document
+        without loading the others. Each shard holds :docs_per_shard: documents:
+            shard-00000.bin: the documents one after the other, each encoded as in ResultWriter
+            shard-00000.idx: the byte offset of each document in the .bin file, then the size of the file, as unsigned 64-bit integers
+        meta.json gives the format version, the kind of results, their options and the number of documents. It is written when the writer
+        is created and replaced each time a shard is complete, so after a crash ShardedResults still reads the documents of the complete shards.
+
+        :param (str) directory: folder to write to, created if needed
+        :param (str) kind: 'segment', 'pos_tag' or 'dependency_parse'
+        :param (int) docs_per_shard: number of documents per shard file
+        :param (bool) sent_split: sent_split of POS_Tag()
+        :param (bool) output_with_sentence: output_with_sentence of Dependency_Parse()
+
+        For example:
+            with ShardedResultWriter('weibo_parsed', 'dependency_parse') as writer:
+                for result in iter_dependency_parse(texts):
+                    writer.write(result)
+    '''
+    def __init__(self, directory, kind, docs_per_shard=100000, sent_split=True, output_with_sentence=True):
+        if kind not in _RESULT_KINDS:
+            raise ValueError('kind must be one of {}'.format(', '.join(_RESULT_KINDS)))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.docs_per_shard = docs_per_shard
+        self.count = 0
+        self._meta = {'format': _RESULT_FILE_FORMAT, 'version': _RESULT_FILE_VERSION, 'kind': kind, 'docs_per_shard': docs_per_shard,
+                    'options': {'sent_split': sent_split, 'output_with_sentence': output_with_sentence}}
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        self._data = None
+        self._index = None
+        self._offset = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        self._meta['count'] = self.count
+        _write_json(os.path.join(self.directory, 'meta.json'), self._meta)
+
+    def _open_shard(self, shard):
+        self._close_shard()
+        path = os.path.join(self.directory, 'shard-{:05d}'.format(shard))
+        self._data = open(path + '.bin', 'wb')
+        self._index = open(path + '.idx', 'wb')
+        self._index.write(_FRAME_HEADER.pack(0))
+        self._offset = 0
+
+    def _close_shard(self):
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    def write(self, result):
+        '''
+            Appends the result of the next document.
+        '''
+        if self._data is None:
+            self._open_shard(self.count // self.docs_per_shard)
+        blob = self._encode(result).encode('utf-8')
+        self._data.write(blob)
+        self._offset += len(blob)
+        self._index.write(_FRAME_HEADER.pack(self._offset))
+        self.count += 1
+        if self.count % self.docs_per_shard == 0:
+            self._close_shard()
+            self._write_meta()
+
+    def write_all(self, results):
+        for result in results:
+            self.write(result)
+
+    def close(self):
+        self._close_shard()
+        self._write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+class ShardedResults(object):
+    '''
+        Random access to the results written by ShardedResultWriter. The shard files are memory-mapped, so results[i] reads
+        and decodes document i only, in constant time, whatever the size of the corpus: suited to training-data samplers.
+
+        :param (str) directory: folder written by ShardedResultWriter
+
+        For example:
+            with ShardedResults('weibo_parsed') as results:
+                len(results)
+                results[123456]
+                batch = [results[i] for i in random.sample(range(len(results)), 32)]
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        meta = _read_json(os.path.join(directory, 'meta.json'))
+        if meta is None or meta.get('format') != _RESULT_FILE_FORMAT:
+            raise ValueError('Not a sharded results folder: {}'.format(directory))
+        if meta['version'] > _RESULT_FILE_VERSION:
+            raise ValueError('Results version {} is newer than this module reads ({})'.format(meta['version'], _RESULT_FILE_VERSION))
+        self.kind = meta['kind']
+        self.options = meta['options']
+        self.docs_per_shard = meta['docs_per_shard']
+        self._count = meta['count']
+        if self.kind == 'pos_tag':
+            self._restore = functools.partial(_restore_pos_tag, sent_split=self.options['sent_split'])
+        elif self.kind == 'dependency_parse':
+            self._restore = functools.partial(_restore_dependency_parse, output_with_sentence=self.options['output_with_sentence'])
+        else:
+            self._restore = None
+        self._decode = json.JSONDecoder().decode
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _shard(self, shard):
+        '''
+            Memory maps of the data and index of a shard, opened on first use.
+        '''
+        maps = self._shards.get(shard)
+        if maps is None:
+            with self._lock:
+                maps = self._shards.get(shard)
+                if maps is None:
+                    path = os.path.join(self.directory, 'shard-{:05d}'.format(shard))
+                    maps = tuple(self._map(path + extension) for extension in ('.bin', '.idx'))
+                    self._shards[shard] = maps
+        return maps
+
+    @staticmethod
+    def _map(path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError('document index out of range')
+        data, index = self._shard(i // self.docs_per_shard)
+        local = i % self.docs_per_shard
+        start, end = struct.unpack_from('<QQ', index, local * _FRAME_HEADER.size)
+        document = self._decode(data[start:end].decode('utf-8'))
+        return document if self._restore is None else self._restore(document)
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self):
+        with self._lock:
+            for maps in self._shards.values():
+                for shard_map in maps:
+                    if isinstance(shard_map, mmap.mmap):
+                        shard_map.close()
+            self._shards = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+#############################
+##### In-memory memo ########
+#############################
+
+class ResultMemo(object):
+    '''
+        Bounded, thread-safe, in-memory LRU memo of single-string results, for strings that come back over and over (greetings, boilerplate, templated notices).
+        Results are stored serialized and every lookup returns a new copy, so callers modifying a result cannot change what the memo returns next.
+
+        :param (int) capacity: maximum number of results kept, the least recently used are dropped first
+
+        For example:
+            memo = ResultMemo(capacity=50000)
+            Segment_str_langdetect(text, reuse_session=True, memo=memo)
+            print(memo.stats())
+    '''
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = blob
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        '''
+            :return: dict with hits, misses, hit_rate, evictions, size and capacity
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                    'evictions': self.evictions,
+                    'size': len(self._entries),
+                    'capacity': self.capacity}
+
+# Module-level memo used by the *_str_langdetect methods when memo=True
+CoreNLP_str_memo = ResultMemo()
+
+# Parameters of the *_str_langdetect methods that do not change their result
+_NOT_RESULT_PARAMETERS = ('timeout', 'be_quiet', 'reuse_session', 'memo', 'metrics')
+
+def _memoized(function):
+    '''
+        Lets a *_str_langdetect method answer from a ResultMemo given by its memo parameter (True for CoreNLP_str_memo).
+        The memo key is the method name, the text and every parameter that changes the result, including the properties given by the caller.
+    '''
+    signature = inspect.signature(function)
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        memo = bound.arguments['memo']
+        if memo is None or memo is False:
+            return function(*args, **kwargs)
+        if memo is True:
+            memo = CoreNLP_str_memo
+        key = [function.__name__]
+        for name, value in bound.arguments.items():
+            if name in _NOT_RESULT_PARAMETERS:
+                continue
+            if name == 'properties':
+                value = _properties_key(value)
+            elif isinstance(value, list):
+                value = tuple(value)
+            key.append(value)
+        key = tuple(key)
+        result = memo.get(key, _MISSING)
+        if result is _MISSING:
+            result = function(*args, **kwargs)
+            memo.put(key, result)
+        return result
+    return wrapper
+
+###############################
+##### Language routing ########
+###############################
+
+# Common English words, used to accept Latin-script text as English without running langdetect
+_ENGLISH_FUNCTION_WORDS = frozenset(('the', 'a', 'an', 'and', 'or', 'but', 'of', 'to', 'in', 'on', 'at', 'for', 'with', 'from', 'by', 'about',
+                                    'is', 'are', 'was', 'were', 'be', 'been', 'am', 'do', 'does', 'did', 'have', 'has', 'had', 'will', 'would',
+                                    'can', 'could', 'should', 'not', 'no', 'this', 'that', 'these', 'those', 'it', 'its', 'i', 'you', 'he',
+                                    'she', 'we', 'they', 'me', 'him', 'her', 'us', 'them', 'my', 'your', 'our', 'their', 'what', 'which',
+                                    'who', 'when', 'where', 'why', 'how', 'if', 'so', 'as', 'than', 'then', 'there', 'here', 'all', 'just'))
+
+def _script_counts(text):
+    '''
+        Counts the letters of text by script: (han, kana, hangul, latin, other letters).
+    '''
+    han = kana = hangul = latin = other = 0
+    for char in text:
+        code = ord(char)
+        if code < 0x80:
+            if ('a' <= char <= 'z') or ('A' <= char <= 'Z'):
+                latin += 1
+        elif 0x4e00 <= code <= 0x9fff or 0x3400 <= code <= 0x4dbf or 0xf900 <= code <= 0xfaff or 0x20000 <= code <= 0x2ebef:
+            han += 1
+        elif 0x3040 <= code <= 0x30ff:
+            kana += 1
+        elif 0xac00 <= code <= 0xd7af or 0x1100 <= code <= 0x11ff:
+            hangul += 1
+        elif char.isalpha():
+            if code <= 0x24f:
+                latin += 1
+            else:
+                other += 1
+    return han, kana, hangul, latin, other
+
+# DetectorFactory of detect_language(), loaded on first use
+_language_detector_factory = None
+_language_detector_lock = threading.Lock()
+
+def _language_detector(seed):
+    '''
+        langdetect Detector with its own seed, made by a DetectorFactory of this module, so that the global langdetect seed,
+        which other code in the process may rely on, is left alone.
+    '''
+    global _language_detector_factory
+    with _language_detector_lock:
+        if _language_detector_factory is None:
+            factory = langdetect.detector_factory.DetectorFactory()
+            factory.load_profile(langdetect.detector_factory.PROFILES_DIRECTORY)
+            _language_detector_factory = factory
+    detector = _language_detector_factory.create()
+    detector.seed = seed
+    return detector
+
+def detect_language(text, chinese_ratio=0.5, english_ratio=0.15, seed=0):
+    '''
+        Fast language detection for routing texts to the Chinese or English server.
+        Clear-cut texts are decided from the share of Chinese characters among the letters, or, for Latin-only text, the share of common English words.
+        Only ambiguous texts go to langdetect, seeded so that the same text always gets the same answer.
+        Traditional and Simplified Chinese are both returned as 'zh-cn', the language code used for the Chinese models in this module.
+
+        :param (str) text: text to route
+        :param (float) chinese_ratio: minimum share of Chinese characters among the letters to return 'zh-cn' without langdetect (if there is no kana or hangul)
+        :param (float) english_ratio: minimum share of common English words among the words of a Latin-only text to return 'en' without langdetect
+        :param (int) seed: langdetect seed. None to leave langdetect random.
+
+        :return: langdetect language code, 'zh-cn' for any Chinese, or 'undetermined' for texts without letters
+
+        Example:
+
+        detect_language("國務院日前發出緊急通知")
+        >>>'zh-cn'
+        detect_language('This is a test sentence for the server to handle.')
+        >>>'en'
+    '''
+    han, kana, hangul, latin, other = _script_counts(text)
+    letters = han + kana + hangul + latin + other
+    if letters == 0:
+        return 'undetermined'
+    if kana == 0 and hangul == 0 and han >= chinese_ratio * letters:
+        return 'zh-cn'
+    if latin == letters:
+        words = text.lower().split()
+        if words and sum(1 for word in words if word.strip('.,;:!?"\'()[]') in _ENGLISH_FUNCTION_WORDS) >= english_ratio * len(words):
+            return 'en'
+    try:
+        detector = _language_detector(seed)
+        detector.append(text)
+        lang = detector.detect()
+    except langdetect.lang_detect_exception.LangDetectException:
+        return 'undetermined'
+    if lang == 'zh-tw':
+        return 'zh-cn'
+    return lang
+
+def _timed_detect_language(text, metrics=None):
+    '''
+        detect_language(), timed as the langdetect stage when metrics is given.
+    '''
+    if metrics is None:
+        return detect_language(text)
+    with metrics.timer('langdetect'):
+        return detect_language(text)
+
+def _unprocessed_result(method, text, tolist=True):
+    '''
+        Output of the *_str_langdetect methods for texts in a language they do not process.
+    '''
+    if method is Dependency_Parse:
+        return None if tolist else ''
+    if tolist:
+        return text.split()
+    return text
+
+def Route_by_language(method, text_list, chinese_only=False, **kwargs):
+    '''
+        Processes a list of mixed Chinese and English texts with one of the batch methods: detects the language of each text with detect_language(),
+        sends all the texts of each language in one call (one server per language) and returns the results in the original order.
+        Texts in other languages are left unprocessed like in the *_str_langdetect methods.
+
+        :param (function) method: Segment, POS_Tag or Dependency_Parse
+        :param (list[str] | tuple[str] | str) text_list: list of strings of raw text for the CoreNLPServer to parse
+        :param (bool) chinese_only: set to True to ignore English and other languages. Set to False to process English and Chinese.
+        :param kwargs: other parameters of :method:, except lang
 
-        :return: Properties enabling Chinese language parsing, in addition to any in parameters.
+        :return: list of :method: results in the same order as text_list
 
-        For example:
-            properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
-            with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout) as client:
-                ann = client.annotate(text)
+        Example:
+
+        Route_by_language(Segment, ['国务院日前发出紧急通知。', 'This is a test sentence.'], verbose=0)
+        >>>[[['国务院', '日前', '发出', '紧急', '通知', '。']], [['This', 'is', 'a', 'test', 'sentence', '.']]]
     '''
-    StanfordCoreNLP_chinese_properties = {'annotators':('tokenize', 'ssplit', 'pos', 'lemma', 'ner', 'parse', 'coref'),'tokenize.language':'zh','segment.model':'edu/stanford/nlp/models/segmenter/chinese/ctb.gz','segment.sighanCorporaDict':'edu/stanford/nlp/models/segmenter/chinese','segment.serDictionary':'edu/stanford/nlp/models/segmenter/chinese/dict-chris6.ser.gz','segment.sighanPostProcessing':True,'ssplit.boundaryTokenRegex':'[.。]|[!?！？]+','pos.model':'edu/stanford/nlp/models/pos-tagger/chinese-distsim.tagger','ner.language':'chinese','ner.model':'edu/stanford/nlp/models/ner/chinese.misc.distsim.crf.ser.gz','ner.applyNumericClassifiers':True,'ner.useSUTime':False,'ner.fine.regexner.mapping':'edu/stanford/nlp/models/kbp/chinese/gazetteers/cn_regexner_mapping.tab','ner.fine.regexner.noDefaultOverwriteLabels':'CITY,COUNTRY,STATE_OR_PROVINCE','parse.model':'edu/stanford/nlp/models/srparser/chineseSR.ser.gz','depparse.model   ':'edu/stanford/nlp/models/parser/nndep/UD_Chinese.gz','depparse.language':'chinese','coref.sieves':'ChineseHeadMatch, ExactStringMatch, PreciseConstructs, StrictHeadMatch1, StrictHeadMatch2, StrictHeadMatch3, StrictHeadMatch4, PronounMatch','coref.input.type':'raw','coref.postprocessing':True,'coref.calculateFeatureImportance':False,'coref.useConstituencyTree':True,'coref.useSemantics':False,'coref.algorithm':'hybrid','coref.path.word2vec':'','coref.language':'zh','coref.defaultPronounAgreement':True,'coref.zh.dict':'edu/stanford/nlp/models/dcoref/zh-attributes.txt.gz','coref.print.md.log':False,'coref.md.type':'RULE','coref.md.liberalChineseMD':False,'kbp.semgrex':'edu/stanford/nlp/models/kbp/chinese/semgrex','kbp.tokensregex':'edu/stanford/nlp/models/kbp/chinese/tokensregex','kbp.language':'zh','kbp.model':None,'entitylink.wikidict':'edu/stanford/nlp/models/kbp/chinese/wikidict_chinese.tsv.gz'}
-    if properties:
-        StanfordCoreNLP_chinese_properties.update(properties)
-    return StanfordCoreNLP_chinese_properties
+    if type(text_list)==type(''):
+        text_list = [text_list]
+    langs = ('zh-cn',) if chinese_only else ('zh-cn', 'en')
+    groups = collections.OrderedDict((lang, []) for lang in langs)
+    result = [None] * len(text_list)
+    metrics = kwargs.get('metrics')
+    for i, text in enumerate(text_list):
+        lang = _timed_detect_language(text, metrics) if text != '' else 'zh-cn'
+        if lang in groups:
+            groups[lang].append(i)
+        else:
+            result[i] = _unprocessed_result(method, text, tolist=kwargs.get('tolist', True))
+    for lang, indices in groups.items():
+        if indices:
+            group_result = method([text_list[i] for i in indices], lang=lang, **kwargs)
+            for i, value in zip(indices, group_result):
+                result[i] = value
+    return result
 
 #############################################################################################
 #############################################################################################
@@ -122,13 +3133,52 @@ def get_StanfordCoreNLP_chinese_properties(properties=None):
 ##### Segmentation #######
 ##########################
 
+def _segment_sentences(sentences, sent_split=True, tolist=True, metrics=None):
+    '''
+        Converts annotated sentences to Segment() output for one document, timing the convert and format stages when metrics is given.
+    '''
+    if metrics is not None:
+        started = time.perf_counter()
+    words = [[token.word for token in sent.token] for sent in sentences]
+    if metrics is not None:
+        started = metrics.lap('convert', started)
+    result = _segmented_output(words, sent_split=sent_split, tolist=tolist)
+    if metrics is not None:
+        metrics.lap('format', started)
+    return result
+
+def _segmented_output(words, sent_split=True, tolist=True):
+    '''
+        Segment() output for one document from its list of words per sentence.
+    '''
+    if tolist:
+        if sent_split:
+            return words
+        return [word for sent in words for word in sent]
+    segmented_list = [' '.join(wordlist) for wordlist in words]
+    if sent_split:
+        return '\n'.join(segmented_list)
+    return ' '.join(segmented_list)
+
+def _segment_empty(text, tolist=True):
+    '''
+        Segment() and POS_Tag() output for an empty document.
+    '''
+    if tolist:
+        return []
+    return text
+
+@_memoized
 def Segment_str_langdetect(text, 
                         sent_split=True, 
                         tolist=True, 
                         properties=None, 
                         timeout=15000,
                         be_quiet=False,
-                        chinese_only=False):
+                        chinese_only=False,
+                        reuse_session=False,
+                        memo=None,
+                        metrics=None):
     '''
         Processes a string, detects if it is Chinese or English, and returns list of words nested in lists of sentences, or text split by spaces and newlines depending on parameters.
         
@@ -140,6 +3190,7 @@ def Segment_str_langdetect(text,
         :param (bool) be_quiet: CoreNLPClient silent mode
         :param (bool) chinese_only: set to True to ignore English and other languages. Set to False to process English and Chinese. 
                                     Ignoring English can save overhead, when faster tools are available.
+        String options (reuse_session, memo, metrics): see the module docstring.
 
         :return: segmented text in nested list or string
 
@@ -167,29 +3218,20 @@ def Segment_str_langdetect(text,
                 properties={'tokenize_no_ssplit':True}
                 # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
             else:
+                properties = dict(properties)
                 properties.update({'tokenize_no_ssplit':True})
                 # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
         ##########
-        try:
-            lang = langdetect.detect(text)
-        except langdetect.lang_detect_exception.LangDetectException:
-            lang = "undetermined"
+        lang = _timed_detect_language(text, metrics)
         if chinese_only:
             parse_ok = (lang == "zh-cn")
         else:
             parse_ok = (lang == "zh-cn") or (lang == "en")
         if parse_ok:
             if (lang == "zh-cn"):
-                properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
-            with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
-                ann = client.annotate(text)
-            words = [[token.word for token in sent.token] for sent in ann.sentence]
-            segmented_list = [' '.join(wordlist) for wordlist in words]
-            if sent_split:
-                segmented = '\n'.join(segmented_list)
-            else:
-                words = [word for sent in words for word in sent]
-                segmented = ' '.join(segmented_list)
+                properties = get_StanfordCoreNLP_chinese_properties(properties=properties, task='segment')
+            ann = _annotate_str(text, lang, annotators, properties, timeout, be_quiet, reuse_session, metrics)
+            return _segment_sentences(ann.sentence, sent_split=sent_split, tolist=tolist, metrics=metrics)
         else:
             segmented = text
             words = segmented.split()
@@ -206,7 +3248,22 @@ def Segment(text_list,
             properties=None, 
             timeout=15000,
             verbose=1,
-            lang='zh-cn'):
+            lang='zh-cn',
+            batch_size=1,
+            max_batch_chars=20000,
+            workers=1,
+            shards=1,
+            memory=None,
+            cache=None,
+            shared_server=False,
+            checkpoint=None,
+            failures=None,
+            compact=False,
+            raw=False,
+            metrics=None,
+            pipeline=False,
+            convert_processes=0,
+            dedup=None):
     '''
         Processes a list of Chinese or English strings and returns list of words nested in lists of sentences, or a list of text split by spaces and newlines depending on parameters.
         It starts the server with the same properties for all texts, so all texts must be the same language, setup by the parameter :lang:. Default is Chinese lang='zh-cn'.
@@ -215,13 +3272,15 @@ def Segment(text_list,
         :param (bool) sent_split: Set True to split text into sentences. Set False to keep the text as one sentence.
         :param (bool) tolist: set to True (default) for a list of words nested in a list of sentences. Set False for a sentences split by newlines and words split by spaces.
         :param (dict) properties: additional request properties (written on top of Chinese ones exported here)
-        :param (int) timeout: CoreNLP server time before raising exception.
+        :param (int | AdaptiveTimeout) timeout: CoreNLP server time before raising exception.
         :param (int) verbose: verbose level
                 0: CoreNLPClient silent mode, no progress printing
                 1: CoreNLPClient silent mode, progress printing
                 2: CoreNLPClient silent mode off, no progress printing
                 3: CoreNLPClient silent mode off, progress printing
         :param (str) lang: 'zh-cn' for Chinese and 'en' for English 
+        Batch options (batch_size, max_batch_chars, workers, shards, memory, cache, shared_server, checkpoint, failures, compact, raw, metrics,
+        pipeline, convert_processes, dedup): see the module docstring.
 
         :return: list of segmented text in nested list or list of strings
 
@@ -239,67 +3298,117 @@ def Segment(text_list,
         >>>[['国务院 日前 发出 紧急 通知 ， 要求 各 地 切实 落实 保证 市场 供应 的 各 项 政策 ， 维护 副食品 价格 稳定 。']]
     
     '''
+    if compact and raw:
+        raise ValueError('compact and raw cannot be used together')
     if type(text_list)==type(''):
         text_list = [text_list]
-    if not sent_split:
-        if not properties:
-            properties={'tokenize_no_ssplit':True}
-            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
-        else:
-            properties.update({'tokenize_no_ssplit':True})
-            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
-    if (lang == "zh-cn"):
-        properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
+    properties = _batch_properties(properties, lang, sent_split=sent_split, task='segment')
     if sent_split:
         annotators = ['tokenize', 'ssplit']
     else:
         annotators = ['tokenize']
-    if verbose == 0:
-        be_quiet = True
-        print_progress = False
-    elif verbose == 1:
-        be_quiet = True
-        print_progress = True
-    elif verbose == 2:
-        be_quiet = False
-        print_progress = False
-    elif verbose == 3:
-        be_quiet = False
-        print_progress = True
-    else: 
-        be_quiet = False
-        print_progress = True
-    result = []
-    limit = len(text_list)
-    with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
-        for i ,text in enumerate(text_list):
-            if print_progress:
-                if lang=='zh-cn':
-                    print("Segmenting Chinese sentence {} of {}".format(i+1,limit))
-                elif lang=='en':
-                    print("SegmentingEnglish sentence {} of {}".format(i+1,limit))
-            if text!='':
-                ann = client.annotate(text)      
-                words = [[token.word for token in sent.token] for sent in ann.sentence]
-                segmented_list = [' '.join(wordlist) for wordlist in words]
-                if sent_split:
-                    segmented = '\n'.join(segmented_list)
-                else:
-                    words = [word for sent in words for word in sent]
-                    segmented = ' '.join(segmented_list)
-            else:
-                segmented = text
-                words=[]
-            if tolist:
-                result.append(words) #list
-            else:
-                result.append(segmented) #string
-    return result
+    if compact:
+        # The store keeps the sentences and formats them on the way out
+        result_options = dict(sent_split=True, tolist=True)
+    else:
+        result_options = dict(sent_split=sent_split, tolist=tolist)
+    convert = functools.partial(_segment_sentences, **result_options)
+    empty_result = functools.partial(_segment_empty, tolist=result_options['tolist'])
+    results = _run_batch('Segment', text_list, annotators, properties, convert, empty_result, result_options,
+                        timeout=timeout, verbose=verbose, lang=lang, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                        workers=workers, shards=shards, memory=memory, cache=cache,
+                        shared_server=shared_server, checkpoint=checkpoint, failures=failures, raw=raw, metrics=metrics,
+                        pipeline=pipeline, convert_processes=convert_processes, dedup=dedup)
+    if compact:
+        return TokenStore.from_results(results, tagged=False, sent_split=sent_split, tolist=tolist)
+    return list(results)
+
+def iter_segment(texts,
+                sent_split=True,
+                tolist=True,
+                properties=None,
+                timeout=15000,
+                verbose=0,
+                lang='zh-cn',
+                batch_size=1,
+                max_batch_chars=20000,
+                workers=1,
+                shards=1,
+                memory=None,
+                cache=None,
+                window=1000,
+                shared_server=False,
+                checkpoint=None,
+                failures=None,
+                raw=False,
+                metrics=None,
+                pipeline=False,
+                convert_processes=0,
+                dedup=None):
+    '''
+        Generator version of Segment(): reads documents from any iterable (e.g. an open file) and yields the result of each document, in order, as soon as it is ready.
+        Neither the corpus nor the results are kept in memory, so corpora larger than memory can be processed.
+        The server is started on the first next() and stopped when the generator is exhausted or closed.
+
+        :param (iterable[str] | str) texts: strings of raw text for the CoreNLPServer to parse, read lazily
+        :param (int) window: maximum number of documents read ahead of the one being yielded
+        See Segment() for the other parameters.
+
+        :return: generator of Segment() results, one per document
+
+        Example:
+
+        with open('weibo.txt') as f:
+            for words in iter_segment(line.rstrip('\n') for line in f):
+                ...
+    '''
+    if type(texts)==type(''):
+        texts = [texts]
+    properties = _batch_properties(properties, lang, sent_split=sent_split, task='segment')
+    if sent_split:
+        annotators = ['tokenize', 'ssplit']
+    else:
+        annotators = ['tokenize']
+    convert = functools.partial(_segment_sentences, sent_split=sent_split, tolist=tolist)
+    empty_result = functools.partial(_segment_empty, tolist=tolist)
+    return _run_batch('Segment', texts, annotators, properties, convert, empty_result, dict(sent_split=sent_split, tolist=tolist),
+                    timeout=timeout, verbose=verbose, lang=lang, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                    workers=workers, shards=shards, memory=memory, cache=cache, window=window,
+                    shared_server=shared_server, checkpoint=checkpoint, failures=failures, raw=raw, metrics=metrics,
+                    pipeline=pipeline, convert_processes=convert_processes, dedup=dedup)
 
 #########################
 ##### POS Tagging #######
 #########################
 
+def _pos_tag_sentences(sentences, sent_split=True, tolist=True, metrics=None):
+    '''
+        Converts annotated sentences to POS_Tag() output for one document, timing the convert and format stages when metrics is given.
+    '''
+    if metrics is not None:
+        started = time.perf_counter()
+    words = [[(token.word,token.pos) for token in sent.token] for sent in sentences]
+    if metrics is not None:
+        started = metrics.lap('convert', started)
+    result = _pos_tagged_output(words, sent_split=sent_split, tolist=tolist)
+    if metrics is not None:
+        metrics.lap('format', started)
+    return result
+
+def _pos_tagged_output(words, sent_split=True, tolist=True):
+    '''
+        POS_Tag() output for one document from its list of (word, tag) per sentence.
+    '''
+    if tolist:
+        if sent_split:
+            return words
+        return [(word,pos) for sent in words for word,pos in sent]
+    segmented_list = [' '.join(['#'.join(posted) for posted in wordlist]) for wordlist in words]
+    if sent_split:
+        return '\n'.join(segmented_list)
+    return ' '.join(segmented_list)
+
+@_memoized
 def POS_Tag_str_langdetect(text,
                         sent_split=True,
                         pre_tokenized=True,
@@ -307,7 +3416,10 @@ def POS_Tag_str_langdetect(text,
                         properties=None,
                         timeout=15000,
                         be_quiet=False,
-                        chinese_only=False):
+                        chinese_only=False,
+                        reuse_session=False,
+                        memo=None,
+                        metrics=None):
     '''
         Processes a string, detects if it is Chinese or English, and returns a list of words paired in tuples with their tags, nested in lists of sentences;
         or text split by spaces and newlines depending on parameters, tagged delimited by #.
@@ -320,6 +3432,7 @@ def POS_Tag_str_langdetect(text,
         :param (int) timeout: CoreNLP server time before raising exception.
         :param (bool) be_quiet: CoreNLPClient silent mode
         :param (bool) chinese_only: set to True to ignore English and other languages. Set to False to process English and Chinese.
+        String options (reuse_session, memo, metrics): see the module docstring.
         
         POS Tags explanation
 
@@ -359,6 +3472,7 @@ def POS_Tag_str_langdetect(text,
                 properties={'tokenize_pretokenized': True}
                 # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
             else:
+                properties = dict(properties)
                 properties.update({'tokenize_pretokenized': True})
                 # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
         if sent_split==False:
@@ -366,29 +3480,20 @@ def POS_Tag_str_langdetect(text,
                 properties={'tokenize_no_ssplit':True}
                 # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
             else:
+                properties = dict(properties)
                 properties.update({'tokenize_no_ssplit':True})
                 # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
         ##########
-        try:
-            lang = langdetect.detect(text)
-        except langdetect.lang_detect_exception.LangDetectException:
-            lang = "undetermined"
+        lang = _timed_detect_language(text, metrics)
         if chinese_only:
             parse_ok = (lang == "zh-cn")
         else:
             parse_ok = (lang == "zh-cn") or (lang == "en")
         if parse_ok:
             if (lang == "zh-cn"):
-                properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
-            with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
-                ann = client.annotate(text)
-            words = [[(token.word,token.pos) for token in sent.token] for sent in ann.sentence]
-            segmented_list = [' '.join(['#'.join(posted) for posted in wordlist]) for wordlist in words]
-            if sent_split:
-                segmented = '\n'.join(segmented_list)
-            else:
-                words = [(word,pos) for sent in words for word,pos in sent]
-                segmented = ' '.join(segmented_list)
+                properties = get_StanfordCoreNLP_chinese_properties(properties=properties, task='pos')
+            ann = _annotate_str(text, lang, annotators, properties, timeout, be_quiet, reuse_session, metrics)
+            return _pos_tag_sentences(ann.sentence, sent_split=sent_split, tolist=tolist, metrics=metrics)
         else:
             segmented = text
             words = segmented.split()
@@ -406,24 +3511,43 @@ def POS_Tag(text_list,
             properties=None, 
             timeout=15000,
             verbose=1,
-            lang='zh-cn'):
+            lang='zh-cn',
+            batch_size=1,
+            max_batch_chars=20000,
+            workers=1,
+            shards=1,
+            memory=None,
+            cache=None,
+            shared_server=False,
+            checkpoint=None,
+            failures=None,
+            compact=False,
+            raw=False,
+            metrics=None,
+            pipeline=False,
+            convert_processes=0,
+            dedup=None):
     '''
         Processes a list of Chinese or English strings and returns lists of words paired in tuples with their tags, nested in lists of sentences, nested in lists of documents in text_list;
         or lists of text split by spaces and newlines depending on parameters, tagged delimited by #.
         It starts the server with the same properties for all texts, so all texts must be the same language, setup by the parameter :lang:. Default is Chinese lang='zh-cn'.
         
-        :param (list[str] | tuple[str] | str) text_list: list of strings of raw text for the CoreNLPServer to parse
+        :param (list[str] | tuple[str] | str | list[list[list[str]]]) text_list: list of strings of raw text for the CoreNLPServer to parse,
+                                or of documents already tokenized, as lists of sentences of tokens (e.g. Segment() output). These are sent as
+                                they are, keeping their sentences whatever sent_split, and give one tag per input token, in the same order.
         :param (bool) sent_split: Set True to split text into sentences. Set False to keep the text as one sentence.
         :param (bool) pre_tokenized: Avoids loading the tokenizer if true. Assumes previously split words by spaces and sentences by newlines.
         :param (bool) tolist: set to True (default) for a list of words nested in a list of sentences. Set False for a sentences split by newlines and words split by spaces.
         :param (dict) properties: additional request properties (written on top of Chinese ones exported here)
-        :param (int) timeout: CoreNLP server time before raising exception.
+        :param (int | AdaptiveTimeout) timeout: CoreNLP server time before raising exception.
         :param (int) verbose: verbose level
                 0: CoreNLPClient silent mode, no progress printing
                 1: CoreNLPClient silent mode, progress printing
                 2: CoreNLPClient silent mode off, no progress printing
                 3: CoreNLPClient silent mode off, progress printing
         :param (str) lang: 'zh-cn' for Chinese and 'en' for English 
+        Batch options (batch_size, max_batch_chars, workers, shards, memory, cache, shared_server, checkpoint, failures, compact, raw, metrics,
+        pipeline, convert_processes, dedup): see the module docstring.
 
         POS Tags explanation
 
@@ -456,66 +3580,75 @@ def POS_Tag(text_list,
         POS_Tag(zh_texts, sent_split=True, tolist=False, properties=None, timeout=15000, chinese_only=False)
         >>>['国务院#NN 日前#NT 发出#VV 紧急#JJ 通知#NN ，#PU 要求#VV 各#DT 地#NN 切实#AD 落实#VV 保证#VV 市场#NN 供应#NN 的#DEG 各#DT 项#M 政策#NN ，#PU 维护#VV 副食品#NN 价格#NN 稳定#NN 。#PU']
     '''
+    if compact and raw:
+        raise ValueError('compact and raw cannot be used together')
     if type(text_list)==type(''):
         text_list = [text_list]
-    if pre_tokenized:
-        if not properties:
-            properties={'tokenize_pretokenized': True}
-            # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
-        else:
-            properties.update({'tokenize_pretokenized': True})
-            # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
-    if sent_split==False:
-        if not properties:
-            properties={'tokenize_no_ssplit':True}
-            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
-        else:
-            properties.update({'tokenize_no_ssplit':True})
-            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
-    if (lang == "zh-cn"):
-        properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
+    text_list, tokens = _token_documents(text_list, pre_tokenized)
+    properties = _batch_properties(properties, lang, sent_split=sent_split, pre_tokenized=pre_tokenized, task='pos', tokens=tokens)
     annotators = ['pos']
-    if verbose == 0:
-        be_quiet = True
-        print_progress = False
-    elif verbose == 1:
-        be_quiet = True
-        print_progress = True
-    elif verbose == 2:
-        be_quiet = False
-        print_progress = False
-    elif verbose == 3:
-        be_quiet = False
-        print_progress = True
-    else: 
-        be_quiet = False
-        print_progress = True
-    result = []
-    limit = len(text_list)
-    with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
-        for i ,text in enumerate(text_list):
-            if print_progress:
-                if lang=='zh-cn':
-                    print("POS Tagging Chinese sentence {} of {}".format(i+1,limit))
-                elif lang=='en':
-                    print("POS Tagging English sentence {} of {}".format(i+1,limit))
-            if text!='':
-                ann = client.annotate(text)
-                words = [[(token.word,token.pos) for token in sent.token] for sent in ann.sentence]
-                segmented_list = [' '.join(['#'.join(posted) for posted in wordlist]) for wordlist in words]
-                if sent_split:
-                    segmented = '\n'.join(segmented_list)
-                else:
-                    words = [(word,pos) for sent in words for word,pos in sent]
-                    segmented = ' '.join(segmented_list)
-            else:
-                segmented = text
-                words=[]
-            if tolist:
-                result.append(words) #list
-            else:
-                result.append(segmented) #string
-    return result
+    if compact:
+        # The store keeps the sentences and formats them on the way out
+        result_options = dict(sent_split=True, tolist=True)
+    else:
+        result_options = dict(sent_split=sent_split, tolist=tolist)
+    convert = functools.partial(_pos_tag_sentences, **result_options)
+    empty_result = functools.partial(_segment_empty, tolist=result_options['tolist'])
+    results = _run_batch('POS_Tag', text_list, annotators, properties, convert, empty_result, result_options,
+                        timeout=timeout, verbose=verbose, lang=lang, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                        workers=workers, shards=shards, memory=memory, cache=cache,
+                        shared_server=shared_server, checkpoint=checkpoint, failures=failures, raw=raw, metrics=metrics,
+                        pipeline=pipeline, convert_processes=convert_processes, dedup=dedup)
+    if compact:
+        return TokenStore.from_results(results, tagged=True, sent_split=sent_split, tolist=tolist)
+    return list(results)
+
+def iter_pos_tag(texts,
+                sent_split=True,
+                pre_tokenized=True,
+                tolist=True,
+                properties=None,
+                timeout=15000,
+                verbose=0,
+                lang='zh-cn',
+                batch_size=1,
+                max_batch_chars=20000,
+                workers=1,
+                shards=1,
+                memory=None,
+                cache=None,
+                window=1000,
+                shared_server=False,
+                checkpoint=None,
+                failures=None,
+                raw=False,
+                metrics=None,
+                pipeline=False,
+                convert_processes=0,
+                dedup=None):
+    '''
+        Generator version of POS_Tag(): reads documents from any iterable (e.g. an open file) and yields the result of each document, in order, as soon as it is ready.
+        The server is started on the first next() and stopped when the generator is exhausted or closed.
+
+        :param (iterable[str] | str | iterable[list[list[str]]]) texts: strings of raw text for the CoreNLPServer to parse, or token lists
+                                (see POS_Tag()), read lazily
+        :param (int) window: maximum number of documents read ahead of the one being yielded
+        See POS_Tag() for the other parameters.
+
+        :return: generator of POS_Tag() results, one per document
+    '''
+    if type(texts)==type(''):
+        texts = [texts]
+    texts, tokens = _token_documents(texts, pre_tokenized)
+    properties = _batch_properties(properties, lang, sent_split=sent_split, pre_tokenized=pre_tokenized, task='pos', tokens=tokens)
+    annotators = ['pos']
+    convert = functools.partial(_pos_tag_sentences, sent_split=sent_split, tolist=tolist)
+    empty_result = functools.partial(_segment_empty, tolist=tolist)
+    return _run_batch('POS_Tag', texts, annotators, properties, convert, empty_result, dict(sent_split=sent_split, tolist=tolist),
+                    timeout=timeout, verbose=verbose, lang=lang, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                    workers=workers, shards=shards, memory=memory, cache=cache, window=window,
+                    shared_server=shared_server, checkpoint=checkpoint, failures=failures, raw=raw, metrics=metrics,
+                    pipeline=pipeline, convert_processes=convert_processes, dedup=dedup)
 
 def POS_Tag_str_tolist(pos_tag_str):
     '''
@@ -530,10 +3663,13 @@ def POS_Tag_str_tolist(pos_tag_str):
             [   [(token, pos_tag), (token, pos_tag)],
                 [(token, pos_tag), (token, pos_tag)],
             ]
+
+        Words containing spaces or newlines cannot be read back from the string form, ResultWriter and read_results() store results safely.
     '''
     pos_tag_sentences = pos_tag_str.split('\n')
     pos_tag_tups = [sent.split(' ') for sent in pos_tag_sentences]
-    pos_tags = [[tuple(tup.split('#')) for tup in sent] for sent in pos_tag_tups]
+    # Tags never contain '#', so splitting at the last one keeps words like 'C#' whole
+    pos_tags = [[tuple(tup.rsplit('#', 1)) for tup in sent] for sent in pos_tag_tups]
     return pos_tags
 
 ################################
@@ -569,7 +3705,115 @@ def POS_Tag_str_tolist(pos_tag_str):
 '''
 ########################
 
+# Sentence field of each dependency_type, any other value gets basicDependencies
+_DEPENDENCY_FIELDS = {'alternativeDependencies': 'alternativeDependencies',
+                    'basicDependencies': 'basicDependencies',
+                    'collapsedCCProcessedDependencies': 'collapsedCCProcessedDependencies',
+                    'collapsedDependencies': 'collapsedDependencies',
+                    'enhancedDependencies': 'enhancedDependencies',
+                    'enhancedPlusPlusDependencies': 'enhancedPlusPlusDependencies'}
+
+def _dependency_getter(dependency_type):
+    '''
+        Returns a function giving the dependency graph of a sentence for the given dependency_type, basicDependencies by default.
+        The field is looked up once here instead of for every sentence.
+    '''
+    return operator.attrgetter(_DEPENDENCY_FIELDS.get(dependency_type, 'basicDependencies'))
+
+def _dependency_types(dependency_type):
+    '''
+        The list of dependency types asked, or None when dependency_type is a single type.
+    '''
+    if isinstance(dependency_type, (list, tuple)):
+        return list(dependency_type)
+    return None
+
+def _dependency_graph_sentences(sentences, dependency_type='basicDependencies', metrics=None):
+    '''
+        Converts annotated sentences to a list of (words, edges) per sentence, each edge a (dep, source, target) tuple of the indices of CoreNLP (from 1).
+        With a list of dependency types, returns a dict of these lists by type, all taken from the same annotation.
+        Timed as the convert stage when metrics is given.
+    '''
+    if metrics is not None:
+        with metrics.timer('convert'):
+            return _dependency_graph_sentences(sentences, dependency_type)
+    types = _dependency_types(dependency_type)
+    getters = [_dependency_getter(one_type) for one_type in (types or [dependency_type])]
+    graphs = [[] for getter in getters]
+    for sent in sentences:
+        words = [token.word for token in sent.token]
+        for getter, type_graphs in zip(getters, graphs):
+            type_graphs.append((words, [(edge.dep, edge.source, edge.target) for edge in getter(sent).edge]))
+    if types is None:
+        return graphs[0]
+    return dict(zip(types, graphs))
+
+def _dependency_parse_sentences(sentences, dependency_type='basicDependencies', tolist=True, output_with_sentence=True, metrics=None):
+    '''
+        Converts annotated sentences to Dependency_Parse() output for one document, a dict of outputs by type for a list of dependency types.
+        Times the convert and format stages when metrics is given.
+    '''
+    graphs = _dependency_graph_sentences(sentences, dependency_type, metrics=metrics)
+    if metrics is not None:
+        started = time.perf_counter()
+    if isinstance(graphs, dict):
+        result = {one_type: _dependency_parse_output(type_graphs, tolist=tolist, output_with_sentence=output_with_sentence)
+                for one_type, type_graphs in graphs.items()}
+    else:
+        result = _dependency_parse_output(graphs, tolist=tolist, output_with_sentence=output_with_sentence)
+    if metrics is not None:
+        metrics.lap('format', started)
+    return result
+
+def _dependency_parse_output(graphs, tolist=True, output_with_sentence=True):
+    '''
+        Dependency_Parse() output for one document from its list of (words, edges) per sentence.
+    '''
+    deps = []
+    if not tolist: deps_strs = []
+    for sentence_words, edges in graphs:
+        words = dict([(i+1,word) for i,word in enumerate(sentence_words)])
+        if output_with_sentence:
+            deps_sent_str = ' '.join(sentence_words) + '\n'
+        else:
+            deps_sent_str = ''
+        if output_with_sentence:
+            deps_sent = (sentence_words, [(dep, words[source], words[target]) for dep, source, target in edges])
+        else:
+            deps_sent = [(dep, words[source], words[target]) for dep, source, target in edges]
+        deps.append(deps_sent)
+        if not tolist:
+            if output_with_sentence:
+                deps_sent_str += ', '.join(['{}({},{})'.format(dep_tup[0],dep_tup[1],dep_tup[2]) for dep_tup in deps_sent[1]])
+            else:
+                deps_sent_str += ', '.join(['{}({},{})'.format(dep_tup[0],dep_tup[1],dep_tup[2]) for dep_tup in deps_sent])
+            deps_strs.append(deps_sent_str)
+    if tolist:
+        return deps
+    if output_with_sentence:
+        return '\n\n'.join(deps_strs)
+    return '\n'.join(deps_strs)
+
+def _no_sentences(text):
+    '''
+        Marks an empty document in compact results.
+    '''
+    return None
+
+def _dependency_parse_empty(text, tolist=True, output_with_sentence=True, dependency_type=None):
+    '''
+        Dependency_Parse() placeholder output for an empty document, a dict of placeholders by type for a list of dependency types.
+    '''
+    types = _dependency_types(dependency_type)
+    if types is not None:
+        return {one_type: _dependency_parse_empty(text, tolist=tolist, output_with_sentence=output_with_sentence) for one_type in types}
+    if not tolist:
+        return ''
+    if output_with_sentence:
+        return [([None],[(None, None, None)])]
+    return [[(None,None,None)]]
 
+@_memoized
 def Dependency_Parse_str_langdetect(text,
                                 dependency_type='basicDependencies',
                                 sent_split=False,
@@ -579,18 +3823,22 @@ def Dependency_Parse_str_langdetect(text,
                                 properties=None,
                                 timeout=15000,
                                 be_quiet=False,
-                                chinese_only=False):
+                                chinese_only=False,
+                                reuse_session=False,
+                                memo=None,
+                                metrics=None):
     '''
         Processes a string, detects if it is Chinese or English, and collects the dependency, source word and target word in a list of tuples nested in a list of sentences.
         
         :param (str | unicode) text: raw text for the CoreNLPServer to parse
-        :param (str) dependency_type: Choose from the options Stanford NLP has available. Default basicDependencies.
+        :param (str | list[str]) dependency_type: Choose from the options Stanford NLP has available. Default basicDependencies.
                 'alternativeDependencies'
                 'basicDependencies'
                 'collapsedCCProcessedDependencies'
                 'collapsedDependencies'
                 'enhancedDependencies'
                 'enhancedPlusPlusDependencies'
+                A list of these types gives, for each document, a dict of the output of each type, all taken from a single parse.
         :param (bool) sent_split: Set True to split text into sentences. Set False to keep the text as one sentence.
         :param (bool) pre_tokenized: Avoids loading the tokenizer if true. Assumes previously split words by spaces and sentences by newlines.
         :param (bool) tolist: set to True (default) for a list of words nested in a list of sentences. Set False for a sentences split by newlines and words split by spaces.
@@ -599,6 +3847,7 @@ def Dependency_Parse_str_langdetect(text,
         :param (int) timeout: CoreNLP server time before raising exception.
         :param (bool) be_quiet: CoreNLPClient silent mode
         :param (bool) chinese_only: set to True to ignore English and other languages. Set to False to process English and Chinese.
+        String options (reuse_session, memo, metrics): see the module docstring.
         
         Stanford NLP dependencies manual:
         https://nlp.stanford.edu/software/dependencies_manual.pdf
@@ -705,6 +3954,7 @@ def Dependency_Parse_str_langdetect(text,
             properties={'tokenize_pretokenized': True}
             # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
         else:
+            properties = dict(properties)
             properties.update({'tokenize_pretokenized': True})
             # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
     if sent_split==False:
@@ -712,61 +3962,21 @@ def Dependency_Parse_str_langdetect(text,
             properties={'tokenize_no_ssplit':True}
             # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
         else:
+            properties = dict(properties)
             properties.update({'tokenize_no_ssplit':True})
             # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
     if text!='':
-        if use_str_langdetect:
-            try:
-                lang = langdetect.detect(text)
-            except langdetect.lang_detect_exception.LangDetectException:
-                lang = "undetermined"
-            if chinese_only:
-                parse_ok = (lang == "zh-cn")
-            else:
-                parse_ok = (lang == "zh-cn") or (lang == "en")
+        lang = _timed_detect_language(text, metrics)
+        if chinese_only:
+            parse_ok = (lang == "zh-cn")
         else:
-            parse_ok = True
-            if no_str_langdetect_chinese:
-                lang = 'zh-cn'
+            parse_ok = (lang == "zh-cn") or (lang == "en")
         if parse_ok:
             if (lang == "zh-cn"):
-                properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
-            with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
-                ann = client.annotate(text)
-            #######
-            deps = []
-            if not tolist: deps_strs = []
-            for sent in ann.sentence:
-                words = dict([(i+1,token.word) for i,token in enumerate(sent.token)])
-                sentence_words = [token.word for token in sent.token]
-                if output_with_sentence:
-                    deps_sent_str = ' '.join(sentence_words) + '\n'
-                else:
-                    deps_sent_str = ''
-                if dependency_type == None: depTree = sent.basicDependencies
-                elif dependency_type == 'alternativeDependencies': depTree = sent.alternativeDependencies
-                elif dependency_type == 'basicDependencies': depTree = sent.basicDependencies
-                elif dependency_type == 'collapsedCCProcessedDependencies': depTree = sent.collapsedCCProcessedDependencies
-                elif dependency_type == 'collapsedDependencies': depTree = sent.collapsedDependencies
-                elif dependency_type == 'enhancedDependencies': depTree = sent.enhancedDependencies
-                elif dependency_type == 'enhancedPlusPlusDependencies': depTree = sent.enhancedPlusPlusDependencies
-                else: depTree = sent.basicDependencies
-                if output_with_sentence:
-                    deps_sent = (sentence_words, [(edge.dep, words[edge.source], words[edge.target]) for edge in depTree.edge])
-                else:
-                    deps_sent = [(edge.dep, words[edge.source], words[edge.target]) for edge in depTree.edge]
-                deps.append(deps_sent)
-                if not tolist:
-                    if output_with_sentence:
-                        deps_sent_str += ', '.join(['{}({},{})'.format(dep_tup[0],dep_tup[1],dep_tup[2]) for dep_tup in deps_sent[1]])
-                    else:
-                        deps_sent_str += ', '.join(['{}({},{})'.format(dep_tup[0],dep_tup[1],dep_tup[2]) for dep_tup in deps_sent])
-                    deps_strs.append(deps_sent_str)
-            if not tolist: 
-                if output_with_sentence:
-                    deps_str = '\n\n'.join(deps_strs)
-                else:
-                    deps_str = '\n'.join(deps_strs)
+                properties = get_StanfordCoreNLP_chinese_properties(properties=properties, task='depparse')
+            ann = _annotate_str(text, lang, annotators, properties, timeout, be_quiet, reuse_session, metrics)
+            return _dependency_parse_sentences(ann.sentence, dependency_type=dependency_type, tolist=tolist, output_with_sentence=output_with_sentence,
+                                            metrics=metrics)
         else:
             deps = None
             deps_str = ''
@@ -787,30 +3997,50 @@ def Dependency_Parse(text_list,
                     properties=None,
                     timeout=15000,
                     verbose=1,
-                    lang='zh-cn'):
+                    lang='zh-cn',
+                    batch_size=1,
+                    max_batch_chars=20000,
+                    workers=1,
+                    shards=1,
+                    memory=None,
+                    cache=None,
+                    shared_server=False,
+                    checkpoint=None,
+                    failures=None,
+                    compact=False,
+                    raw=False,
+                    metrics=None,
+                    pipeline=False,
+                    convert_processes=0,
+                    dedup=None):
     '''
         Processes a list of Chinese or English texts and collects the dependency, source word and target word in a list of tuples nested in a list of sentences, in a list of documents.
         
-        :param (list[str] | tuple[str] | str) text_list: list of strings of raw text for the CoreNLPServer to parse
-        :param (str) dependency_type: Choose from the options Stanford NLP has available. Default basicDependencies.
+        :param (list[str] | tuple[str] | str | list[list[list[str]]]) text_list: list of strings of raw text for the CoreNLPServer to parse,
+                                or of documents already tokenized, as lists of sentences of tokens (e.g. Segment() output, or POS_Tag() output whose
+                                words are used). These are sent as they are, keeping their sentences whatever sent_split, and give one parse per input sentence over the input tokens.
+        :param (str | list[str]) dependency_type: Choose from the options Stanford NLP has available. Default basicDependencies.
                 'alternativeDependencies'
                 'basicDependencies'
                 'collapsedCCProcessedDependencies'
                 'collapsedDependencies'
                 'enhancedDependencies'
                 'enhancedPlusPlusDependencies'
+                A list of these types gives, for each document, a dict of the output of each type, all taken from a single parse.
         :param (bool) sent_split: Set True to split text into sentences. Set False to keep the text as one sentence.
         :param (bool) pre_tokenized: Avoids loading the tokenizer if true. Assumes previously split words by spaces and sentences by newlines.
         :param (bool) tolist: set to True (default) for a list of words nested in a list of sentences. Set False for a sentences split by newlines and words split by spaces.
         :param (bool) output_with_sentence: set to True (default) to get the segmented sentence as part of the output on top of the dependencies. Set to False to keep dependencies only.
         :param (dict) properties: additional request properties (written on top of Chinese ones exported here)
-        :param (int) timeout: CoreNLP server time before raising exception.
+        :param (int | AdaptiveTimeout) timeout: CoreNLP server time before raising exception.
         :param (int) verbose: verbose level
                 0: CoreNLPClient silent mode, no progress printing
                 1: CoreNLPClient silent mode, progress printing
                 2: CoreNLPClient silent mode off, no progress printing
                 3: CoreNLPClient silent mode off, progress printing
         :param (str) lang: 'zh-cn' for Chinese and 'en' for English
+        Batch options (batch_size, max_batch_chars, workers, shards, memory, cache, shared_server, checkpoint, failures, compact, raw, metrics,
+        pipeline, convert_processes, dedup): see the module docstring.
 
         Stanford NLP dependencies manual:
             https://nlp.stanford.edu/software/dependencies_manual.pdf
@@ -919,97 +4149,88 @@ def Dependency_Parse(text_list,
         ["国务院 日前 发出 紧急 通知 ， 要求 各 地 切实 落实 保证 市场 供应 的 各 项 政策 ， 维护 副食品 价格 稳定 。
         nsubj(发出,国务院), nmod:tmod(发出,日前), dobj(发出,通知), punct(发出,，), conj(发出,要求), punct(发出,。), amod(通知,紧急), dobj(要求,地), ccomp(要求,落实), det(地,各), advmod(落实,切实), ccomp(落实,保证), dobj(保证,政策), punct(保证,，), conj(保证,维护), compound:nn(供应,市场), case(供应,的), mark:clf(各,项), det(政策,各), nmod:assmod(政策,供应), dobj(维护,稳定), compound:nn(稳定,副食品), compound:nn(稳定,价格)"]
     '''
+    if compact and raw:
+        raise ValueError('compact and raw cannot be used together')
     if type(text_list)==type(''):
         text_list = [text_list]
-    if pre_tokenized:
-        if not properties:
-            properties={'tokenize_pretokenized': True}
-            # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
-        else:
-            properties.update({'tokenize_pretokenized': True})
-            # Assume the text is tokenized by white space and sentence split by newline. Do not run a model.
-    if sent_split==False:
-        if not properties:
-            properties={'tokenize_no_ssplit':True}
-            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
-        else:
-            properties.update({'tokenize_no_ssplit':True})
-            # Assume the sentences are split by two continuous newlines (\n\n). Only run tokenization and disable sentence segmentation.
-    if lang == "zh-cn":
-        properties = get_StanfordCoreNLP_chinese_properties(properties=properties)
+    text_list, tokens = _token_documents(text_list, pre_tokenized)
+    properties = _batch_properties(properties, lang, sent_split=sent_split, pre_tokenized=pre_tokenized, task='depparse', tokens=tokens)
     annotators=['depparse']
-    if verbose == 0:
-        be_quiet = True
-        print_progress = False
-    elif verbose == 1:
-        be_quiet = True
-        print_progress = True
-    elif verbose == 2:
-        be_quiet = False
-        print_progress = False
-    elif verbose == 3:
-        be_quiet = False
-        print_progress = True
-    else: 
-        be_quiet = False
-        print_progress = True
-    result = []
-    limit = len(text_list)
-    with CoreNLPClient(annotators=annotators, properties=properties, timeout=timeout, be_quiet=be_quiet) as client:
-        for i ,text in enumerate(text_list):
-            if print_progress:
-                if lang=='zh-cn':
-                    print("Dependency Parsing Chinese sentence {} of {}".format(i+1,limit))
-                elif lang=='en':
-                    print("Dependency Parsing English sentence {} of {}".format(i+1,limit))
-            if text!='':
-                ann = client.annotate(text)
-                #######
-                deps = []
-                if not tolist: deps_strs = []
-                for sent in ann.sentence:
-                    words = dict([(i+1,token.word) for i,token in enumerate(sent.token)])
-                    sentence_words = [token.word for token in sent.token]
-                    if output_with_sentence:
-                        deps_sent_str = ' '.join(sentence_words) + '\n'
-                    else:
-                        deps_sent_str = ''
-                    if dependency_type == None: depTree = sent.basicDependencies
-                    elif dependency_type == 'alternativeDependencies': depTree = sent.alternativeDependencies
-                    elif dependency_type == 'basicDependencies': depTree = sent.basicDependencies
-                    elif dependency_type == 'collapsedCCProcessedDependencies': depTree = sent.collapsedCCProcessedDependencies
-                    elif dependency_type == 'collapsedDependencies': depTree = sent.collapsedDependencies
-                    elif dependency_type == 'enhancedDependencies': depTree = sent.enhancedDependencies
-                    elif dependency_type == 'enhancedPlusPlusDependencies': depTree = sent.enhancedPlusPlusDependencies
-                    else: depTree = sent.basicDependencies
-                    if output_with_sentence:
-                        deps_sent = (sentence_words, [(edge.dep, words[edge.source], words[edge.target]) for edge in depTree.edge])
-                    else:
-                        deps_sent = [(edge.dep, words[edge.source], words[edge.target]) for edge in depTree.edge]
-                    deps.append(deps_sent)
-                    if not tolist:
-                        if output_with_sentence:
-                            deps_sent_str += ', '.join(['{}({},{})'.format(dep_tup[0],dep_tup[1],dep_tup[2]) for dep_tup in deps_sent[1]])
-                        else:
-                            deps_sent_str += ', '.join(['{}({},{})'.format(dep_tup[0],dep_tup[1],dep_tup[2]) for dep_tup in deps_sent])
-                        deps_strs.append(deps_sent_str)
-                if not tolist: 
-                    if output_with_sentence:
-                        deps_str = '\n\n'.join(deps_strs)
-                    else:
-                        deps_str = '\n'.join(deps_strs)
-            else:
-                if output_with_sentence:
-                    deps = [([None],[(None, None, None)])]
-                else:
-                    deps = [[(None,None,None)]]
-                deps_str = ''
-            if tolist:
-                result.append(deps)
-            else:
-                result.append(deps_str)
-    return result
+    if compact:
+        # Per document (words, edges) of each sentence, or None for an empty document, gathered in DependencyGraphs
+        convert = functools.partial(_dependency_graph_sentences, dependency_type=dependency_type)
+        empty_result = _no_sentences
+        result_options = dict(dependency_type=dependency_type, compact=True)
+    else:
+        convert = functools.partial(_dependency_parse_sentences, dependency_type=dependency_type, tolist=tolist, output_with_sentence=output_with_sentence)
+        empty_result = functools.partial(_dependency_parse_empty, tolist=tolist, output_with_sentence=output_with_sentence, dependency_type=dependency_type)
+        result_options = dict(dependency_type=dependency_type, tolist=tolist, output_with_sentence=output_with_sentence)
+    results = _run_batch('Dependency_Parse', text_list, annotators, properties, convert, empty_result, result_options,
+                        timeout=timeout, verbose=verbose, lang=lang, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                        workers=workers, shards=shards, memory=memory, cache=cache,
+                        shared_server=shared_server, checkpoint=checkpoint, failures=failures, raw=raw, metrics=metrics,
+                        pipeline=pipeline, convert_processes=convert_processes, dedup=dedup)
+    if compact:
+        types = _dependency_types(dependency_type)
+        if types is None:
+            return DependencyGraphs.from_results(results, tolist=tolist, output_with_sentence=output_with_sentence)
+        stores = dict((one_type, DependencyGraphs(tolist=tolist, output_with_sentence=output_with_sentence)) for one_type in types)
+        for result in results:
+            for one_type, store in stores.items():
+                store.append(None if result is None else result[one_type])
+        return stores
+    return list(results)
+
 
+def iter_dependency_parse(texts,
+                        dependency_type='basicDependencies',
+                        sent_split=False,
+                        pre_tokenized=True,
+                        tolist=True,
+                        output_with_sentence=True,
+                        properties=None,
+                        timeout=15000,
+                        verbose=0,
+                        lang='zh-cn',
+                        batch_size=1,
+                        max_batch_chars=20000,
+                        workers=1,
+                        shards=1,
+                        memory=None,
+                        cache=None,
+                        window=1000,
+                        shared_server=False,
+                        checkpoint=None,
+                        failures=None,
+                        raw=False,
+                        metrics=None,
+                        pipeline=False,
+                        convert_processes=0,
+                        dedup=None):
+    '''
+        Generator version of Dependency_Parse(): reads documents from any iterable (e.g. an open file) and yields the result of each document, in order, as soon as it is ready.
+        The server is started on the first next() and stopped when the generator is exhausted or closed.
+
+        :param (iterable[str] | str | iterable[list[list[str]]]) texts: strings of raw text for the CoreNLPServer to parse, or token lists
+                                (see Dependency_Parse()), read lazily
+        :param (int) window: maximum number of documents read ahead of the one being yielded
+        See Dependency_Parse() for the other parameters.
+
+        :return: generator of Dependency_Parse() results, one per document
+    '''
+    if type(texts)==type(''):
+        texts = [texts]
+    texts, tokens = _token_documents(texts, pre_tokenized)
+    properties = _batch_properties(properties, lang, sent_split=sent_split, pre_tokenized=pre_tokenized, task='depparse', tokens=tokens)
+    annotators = ['depparse']
+    convert = functools.partial(_dependency_parse_sentences, dependency_type=dependency_type, tolist=tolist, output_with_sentence=output_with_sentence)
+    empty_result = functools.partial(_dependency_parse_empty, tolist=tolist, output_with_sentence=output_with_sentence, dependency_type=dependency_type)
+    result_options = dict(dependency_type=dependency_type, tolist=tolist, output_with_sentence=output_with_sentence)
+    return _run_batch('Dependency_Parse', texts, annotators, properties, convert, empty_result, result_options,
+                    timeout=timeout, verbose=verbose, lang=lang, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                    workers=workers, shards=shards, memory=memory, cache=cache, window=window,
+                    shared_server=shared_server, checkpoint=checkpoint, failures=failures, raw=raw, metrics=metrics,
+                    pipeline=pipeline, convert_processes=convert_processes, dedup=dedup)
 
 # sometimes returns unshapely tuples, maybe broken by punctuation as words
 def Dependency_Parse_str_tolist(dep_parse_str, output_with_sentence=True):
@@ -1042,6 +4263,8 @@ def Dependency_Parse_str_tolist(dep_parse_str, output_with_sentence=True):
                 [   [(dependency, source_word, target_word),(dependency, source_word, target_word)],
                     [(dependency, source_word, target_word),(dependency, source_word, target_word)],
                 ...]
+
+        Words containing spaces, newlines, ',', '(' or ')' cannot be read back from the string form, ResultWriter and read_results() store results safely.
     '''
     deps = []
     if output_with_sentence:
@@ -1061,5 +4284,313 @@ def Dependency_Parse_str_tolist(dep_parse_str, output_with_sentence=True):
             deps.append(tup_new_list)
     return deps
 
+#################################
+##### Combined annotation #######
+#################################
+
+# Tasks of Annotate(), in pipeline order, with the Chinese property profile they need
+_ANNOTATE_TASKS = ('segment', 'pos', 'deps')
+_ANNOTATE_PROFILES = {'segment': 'segment', 'pos': 'pos', 'deps': 'depparse'}
+
+def _annotate_sentences(sentences, tasks, sent_split=True, tolist=True, dependency_type='basicDependencies', output_with_sentence=True, metrics=None):
+    '''
+        Converts annotated sentences to the Annotate() record of one document.
+    '''
+    record = {}
+    if 'segment' in tasks:
+        record['segment'] = _segment_sentences(sentences, sent_split=sent_split, tolist=tolist, metrics=metrics)
+    if 'pos' in tasks:
+        record['pos'] = _pos_tag_sentences(sentences, sent_split=sent_split, tolist=tolist, metrics=metrics)
+    if 'deps' in tasks:
+        record['deps'] = _dependency_parse_sentences(sentences, dependency_type=dependency_type, tolist=tolist, output_with_sentence=output_with_sentence,
+                                                    metrics=metrics)
+    return record
+
+def _annotate_empty(text, tasks, tolist=True, dependency_type='basicDependencies', output_with_sentence=True):
+    '''
+        Annotate() record of an empty document.
+    '''
+    record = {}
+    if 'segment' in tasks:
+        record['segment'] = _segment_empty(text, tolist=tolist)
+    if 'pos' in tasks:
+        record['pos'] = _segment_empty(text, tolist=tolist)
+    if 'deps' in tasks:
+        record['deps'] = _dependency_parse_empty(text, tolist=tolist, output_with_sentence=output_with_sentence, dependency_type=dependency_type)
+    return record
+
+def Annotate(text_list,
+            tasks=('segment', 'pos', 'deps'),
+            dependency_type='basicDependencies',
+            sent_split=True,
+            pre_tokenized=False,
+            tolist=True,
+            output_with_sentence=True,
+            properties=None,
+            timeout=15000,
+            verbose=1,
+            lang='zh-cn',
+            batch_size=1,
+            max_batch_chars=20000,
+            workers=1,
+            shards=1,
+            memory=None,
+            cache=None,
+            shared_server=False,
+            checkpoint=None,
+            failures=None,
+            raw=False,
+            metrics=None,
+            pipeline=False,
+            convert_processes=0,
+            dedup=None):
+    '''
+        Segments, POS tags and dependency parses a list of Chinese or English texts in a single pass: one server is started with the annotators
+        of every requested task, each document is sent, tokenized and decoded once, and every layer is built from the same annotation.
+        Running Segment(), POS_Tag() and Dependency_Parse() one after the other starts three servers and tokenizes the corpus three times.
+
+        :param (list[str] | tuple[str] | str) text_list: list of strings of raw text for the CoreNLPServer to parse
+        :param (tuple[str]) tasks: layers to return, any of 'segment', 'pos' and 'deps'
+        :param (str | list[str]) dependency_type: dependency type(s) of the 'deps' layer, see Dependency_Parse()
+        :param (bool) sent_split: Set True to split text into sentences. Set False to keep the text as one sentence.
+        :param (bool) pre_tokenized: set to True if words are already split by spaces and sentences by newlines
+        :param (bool) tolist: set to True (default) for nested lists, False for the strings of each method
+        :param (bool) output_with_sentence: output_with_sentence of the 'deps' layer, see Dependency_Parse()
+        :param (bool) raw: set to True to get an AnnotatedDocument per document instead of a dict, whose words, tags and edges are read from
+                                the protobuf sentences only when accessed. document.tolist() gives the usual dict.
+        See Segment() for the other parameters.
+
+        :return: list with one dict per document, holding the output of each requested task in the format of
+                Segment() ('segment'), POS_Tag() ('pos') and Dependency_Parse() ('deps') with the same options
+
+        Example:
+
+        zh_texts = ["国务院日前发出紧急通知，要求各地切实落实保证市场供应的各项政策，维护副食品价格稳定。"]
+        Annotate(zh_texts, tasks=('segment', 'pos'))
+        >>>[{'segment': [['国务院', '日前', '发出', ...]],
+             'pos': [[('国务院', 'NN'), ('日前', 'NT'), ('发出', 'VV'), ...]]}]
+    '''
+    unknown = [task for task in tasks if task not in _ANNOTATE_TASKS]
+    if unknown or not tasks:
+        raise ValueError('tasks must be some of {}, got {}'.format(', '.join(_ANNOTATE_TASKS), tasks))
+    tasks = tuple(task for task in _ANNOTATE_TASKS if task in tasks)
+    if type(text_list)==type(''):
+        text_list = [text_list]
+    properties = _batch_properties(properties, lang, sent_split=sent_split, pre_tokenized=pre_tokenized, task=_ANNOTATE_PROFILES[tasks[-1]])
+    annotators = ['tokenize']
+    if sent_split:
+        annotators.append('ssplit')
+    if 'pos' in tasks or 'deps' in tasks:
+        annotators.append('pos')
+    if 'deps' in tasks:
+        annotators.append('depparse')
+    result_options = dict(tasks=tasks, sent_split=sent_split, tolist=tolist, dependency_type=dependency_type, output_with_sentence=output_with_sentence)
+    convert = functools.partial(_annotate_sentences, **result_options)
+    empty_result = functools.partial(_annotate_empty, tasks=tasks, tolist=tolist, dependency_type=dependency_type, output_with_sentence=output_with_sentence)
+    return list(_run_batch('Annotate', text_list, annotators, properties, convert, empty_result, result_options,
+                        timeout=timeout, verbose=verbose, lang=lang, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                        workers=workers, shards=shards, memory=memory, cache=cache,
+                        shared_server=shared_server, checkpoint=checkpoint, failures=failures, raw=raw, metrics=metrics,
+                        pipeline=pipeline, convert_processes=convert_processes, dedup=dedup))
+
+#########################
+##### asyncio API #######
+#########################
+'''
+    The a* methods below are coroutine versions of Segment(), POS_Tag() and Dependency_Parse() for asyncio applications.
+    They send the requests of the blocking methods from a thread pool, without blocking the event loop, to one shared server (a running one
+    given by :endpoint:, or one kept in CoreNLP_session_pool), at most :concurrency: at a time, and return exactly the same output.
+
+    async def main():
+        zh_texts = ["国务院日前发出紧急通知，要求各地切实落实保证市场供应的各项政策，维护副食品价格稳定。"]
+        words = await asegment(zh_texts, concurrency=8)
+        deps = await adependency_parse(zh_texts, pre_tokenized=False, endpoint='http://localhost:9000')
+'''
+
+_PROTOBUF_SERIALIZER = 'edu.stanford.nlp.pipeline.ProtobufAnnotationSerializer'
+
+def _request_properties(annotators, properties):
+    '''
+        Builds the properties sent with each asynchronous request, so that a server started with other defaults still runs the right pipeline.
+        Values are written as the strings the server expects.
+    '''
+    request_properties = {}
+    for key, value in (properties or {}).items():
+        if value is None:
+            continue
+        elif isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (list, tuple)):
+            value = ','.join(value)
+        request_properties[key.strip()] = str(value)
+    request_properties['annotators'] = ','.join(annotators)
+    request_properties['outputFormat'] = 'serialized'
+    request_properties['serializer'] = _PROTOBUF_SERIALIZER
+    return request_properties
+
+class _RequestPropertiesClient(object):
+    '''
+        Client sending :request_properties: (output of _request_properties()) with every request, so that the asynchronous methods get the right
+        pipeline from a server started with other defaults. Only annotate() is used, through _annotate_batch().
+    '''
+    def __init__(self, client, request_properties):
+        self.client = client
+        self.request_properties = request_properties
+
+    def annotate(self, text, properties=None):
+        request_properties = dict(self.request_properties)
+        request_properties.update(properties or {})
+        return self.client.annotate(text, properties=request_properties)
+
+async def _aannotate_documents(text_list, annotators, properties, timeout, lang, convert, empty_result,
+                                concurrency=8, endpoint=None, batch_size=1, max_batch_chars=20000, failures=None):
+    '''
+        Coroutine version of _iter_documents(). Uses a session of CoreNLP_session_pool when no endpoint is given, once its server answers.
+        Batches go through _annotate_batch() in a thread pool, at most :concurrency: at a time, so that requests are retried in halves
+        and documents that time out are split exactly like in the blocking methods.
+        The input is read only as requests are sent, and each batch is converted as soon as it is annotated.
+    '''
+    if type(text_list)==type(''):
+        text_list = [text_list]
+    loop = asyncio.get_running_loop()
+    results = {}
+    document_failures = []
+    pending = {}
+    def collect(done):
+        for future in done:
+            batch = pending.pop(future)
+            for (i, text), sentences in zip(batch, future.result()):
+                if sentences is None:
+                    results[i] = empty_result(text)
+                elif isinstance(sentences, _FailedDocument):
+                    if failures is None:
+                        raise sentences.error
+                    document_failures.append({'index': i, 'status': 'failed', 'chars': len(text), 'error': repr(sentences.error)})
+                    results[i] = empty_result('')
+                else:
+                    if isinstance(sentences, _SplitSentences):
+                        document_failures.append({'index': i, 'status': 'split', 'chars': len(text), 'pieces': sentences.pieces})
+                    results[i] = convert(sentences)
+    with contextlib.ExitStack() as stack:
+        if endpoint is None:
+            client = stack.enter_context(CoreNLP_session_pool.session(lang, annotators, properties=properties, timeout=timeout))
+            # CoreNLPClient.start() does not wait for the JVM
+            await loop.run_in_executor(None, client.ensure_alive)
+        else:
+            client = CoreNLPClient(annotators=annotators, properties=properties, timeout=_client_timeout(timeout), endpoint=endpoint,
+                                start_server=StartServer.DONT_START)
+        client = _RequestPropertiesClient(client, _request_properties(annotators, properties))
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            for batch in _iter_document_batches(enumerate(text_list), batch_size=batch_size, max_batch_chars=max_batch_chars):
+                if len(pending) >= concurrency:
+                    done, waiting = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+                pending[loop.run_in_executor(executor, _annotate_batch, client, [text for i, text in batch], timeout)] = batch
+            while pending:
+                done, waiting = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+                collect(done)
+        finally:
+            try:
+                if pending:
+                    # Requests already sent still use the client, which must not go back to the pool before they end
+                    await asyncio.wait(list(pending))
+            finally:
+                executor.shutdown(wait=True)
+    if failures is not None:
+        failures.extend(sorted(document_failures, key=operator.itemgetter('index')))
+    return [results[i] for i in range(len(results))]
+
+async def asegment(text_list,
+                sent_split=True,
+                tolist=True,
+                properties=None,
+                timeout=15000,
+                lang='zh-cn',
+                concurrency=8,
+                endpoint=None,
+                batch_size=1,
+                max_batch_chars=20000,
+                failures=None):
+    '''
+        Coroutine version of Segment(), same output.
+
+        :param (int) concurrency: maximum number of requests in flight at the same time.
+        :param (str) endpoint: address of a running CoreNLP server, e.g. 'http://localhost:9000'. None to start (or reuse) one in CoreNLP_session_pool.
+        :param (list) failures: list receiving a dict for each document that could not be annotated, as in the blocking method.
+        See Segment() for the other parameters.
+    '''
+    properties = _batch_properties(properties, lang, sent_split=sent_split, task='segment')
+    if sent_split:
+        annotators = ['tokenize', 'ssplit']
+    else:
+        annotators = ['tokenize']
+    convert = functools.partial(_segment_sentences, sent_split=sent_split, tolist=tolist)
+    empty_result = functools.partial(_segment_empty, tolist=tolist)
+    return await _aannotate_documents(text_list, annotators, properties, timeout, lang, convert, empty_result,
+                                    concurrency=concurrency, endpoint=endpoint, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                                    failures=failures)
+
+async def apos_tag(text_list,
+                sent_split=True,
+                pre_tokenized=True,
+                tolist=True,
+                properties=None,
+                timeout=15000,
+                lang='zh-cn',
+                concurrency=8,
+                endpoint=None,
+                batch_size=1,
+                max_batch_chars=20000,
+                failures=None):
+    '''
+        Coroutine version of POS_Tag(), same output.
+
+        :param (int) concurrency: maximum number of requests in flight at the same time.
+        :param (str) endpoint: address of a running CoreNLP server, e.g. 'http://localhost:9000'. None to start (or reuse) one in CoreNLP_session_pool.
+        :param (list) failures: list receiving a dict for each document that could not be annotated, as in the blocking method.
+        See POS_Tag() for the other parameters.
+    '''
+    text_list, tokens = _token_documents(text_list, pre_tokenized)
+    properties = _batch_properties(properties, lang, sent_split=sent_split, pre_tokenized=pre_tokenized, task='pos', tokens=tokens)
+    annotators = ['pos']
+    convert = functools.partial(_pos_tag_sentences, sent_split=sent_split, tolist=tolist)
+    empty_result = functools.partial(_segment_empty, tolist=tolist)
+    return await _aannotate_documents(text_list, annotators, properties, timeout, lang, convert, empty_result,
+                                    concurrency=concurrency, endpoint=endpoint, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                                    failures=failures)
+
+async def adependency_parse(text_list,
+                        dependency_type='basicDependencies',
+                        sent_split=False,
+                        pre_tokenized=True,
+                        tolist=True,
+                        output_with_sentence=True,
+                        properties=None,
+                        timeout=15000,
+                        lang='zh-cn',
+                        concurrency=8,
+                        endpoint=None,
+                        batch_size=1,
+                        max_batch_chars=20000,
+                        failures=None):
+    '''
+        Coroutine version of Dependency_Parse(), same output.
+
+        :param (int) concurrency: maximum number of requests in flight at the same time.
+        :param (str) endpoint: address of a running CoreNLP server, e.g. 'http://localhost:9000'. None to start (or reuse) one in CoreNLP_session_pool.
+        :param (list) failures: list receiving a dict for each document that could not be annotated, as in the blocking method.
+        See Dependency_Parse() for the other parameters.
+    '''
+    text_list, tokens = _token_documents(text_list, pre_tokenized)
+    properties = _batch_properties(properties, lang, sent_split=sent_split, pre_tokenized=pre_tokenized, task='depparse', tokens=tokens)
+    annotators = ['depparse']
+    convert = functools.partial(_dependency_parse_sentences, dependency_type=dependency_type, tolist=tolist, output_with_sentence=output_with_sentence)
+    empty_result = functools.partial(_dependency_parse_empty, tolist=tolist, output_with_sentence=output_with_sentence, dependency_type=dependency_type)
+    return await _aannotate_documents(text_list, annotators, properties, timeout, lang, convert, empty_result,
+                                    concurrency=concurrency, endpoint=endpoint, batch_size=batch_size, max_batch_chars=max_batch_chars,
+                                    failures=failures)
+
 if __name__ == '__main__':
-    pass
+    if len(sys.argv) == 3 and sys.argv[1] == '--shared-server':
+        _serve_shared(json.loads(sys.argv[2]))
@@ -0,0 +1,354 @@
+#-*- coding: utf-8 -*-
+#!python3
+
+'''
+    Offline benchmark of the wrapper: a local stand-in for the CoreNLP server answers every request with a canned protobuf Document
+    after a configurable latency, so the time spent in this module (requests, protobuf decoding, conversion, formatting) can be measured
+    and compared between versions without a CoreNLP installation.
+
+    The stand-in tokenizes and tags mechanically (Chinese text in two-character words, English at spaces and punctuation, a fixed tag cycle,
+    every word depending on the first of its sentence), so the results are not linguistic, but the responses have the size and shape of real ones.
+
+    For each case, over synthetic Chinese and English corpora, it reports:
+        docs_per_s, chars_per_s: throughput of the whole run
+        p50_ms, p99_ms: latency of one call (one document for the *_str_langdetect methods and the *_str_tolist parsers,
+                        :docs_per_call: documents for Segment(), POS_Tag() and Dependency_Parse())
+        server_s: time the stand-in server spent answering, including the latency, the rest of the run is client time
+        peak_rss_mb: peak resident memory of the process that ran the case (each case runs in a fresh process)
+
+    Usage:
+        python benchmarks/offline.py [--documents 2000] [--latency-ms 0] [--docs-per-call 100] [--batch-size 1]
+                                     [--cases Segment,POS_Tag] [--output offline_results.json] [--compare old.json]
+'''
+
+import argparse
+import ast
+import io
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO)
+
+import StanfordCoreNLP
+from StanfordCoreNLP import _find_free_port
+from stanza.protobuf import Document, writeToDelimitedString
+from stanza.server import StartServer
+
+##### Stand-in server #####
+
+TAGS = ['NN', 'VV', 'AD', 'JJ', 'NR', 'DEG', 'M', 'DT']
+DEPS = ['nsubj', 'dobj', 'amod', 'advmod', 'compound:nn', 'case', 'mark:clf', 'det']
+TOKEN = re.compile(r'[一-鿿]{1,2}|[A-Za-z0-9]+|\S')
+SENTENCE_END = re.compile(r'[。！？.!?]+|\n\n+')
+# Dependency fields filled in each sentence, the others stay empty as with a server that does not compute them
+DEPENDENCY_FIELDS = ('basicDependencies', 'enhancedDependencies', 'enhancedPlusPlusDependencies')
+
+def sentence_spans(text, properties):
+    '''
+        (start, end) of each sentence, following the tokenization options the methods send.
+    '''
+    if str(properties.get('tokenize_pretokenized', '')).lower() == 'true':
+        separator = re.compile(r'\n')
+    elif str(properties.get('tokenize_no_ssplit', '')).lower() == 'true' or properties.get('annotators', '') == 'tokenize':
+        # Any annotator after tokenize needs ssplit, which the server adds when it is not listed
+        separator = re.compile(r'\n\n+')
+    else:
+        separator = SENTENCE_END
+    spans = []
+    start = 0
+    for match in separator.finditer(text):
+        end = match.end() if match.group().strip() else match.start()
+        spans.append((start, end))
+        start = match.end()
+    spans.append((start, len(text)))
+    return spans
+
+def canned_document(text, properties):
+    '''
+        Protobuf Document for :text:, with the layers of the annotators asked.
+        Offsets count characters, which matches the UTF-16 offsets of the server for the BMP-only synthetic corpora.
+    '''
+    annotators = properties.get('annotators', '')
+    tagged = 'pos' in annotators or 'depparse' in annotators
+    parsed = 'depparse' in annotators
+    pretokenized = str(properties.get('tokenize_pretokenized', '')).lower() == 'true'
+    document = Document(text=text)
+    token_count = 0
+    for start, end in sentence_spans(text, properties):
+        if pretokenized:
+            tokens = [(match.start(), match.group()) for match in re.finditer(r'\S+', text[start:end])]
+        else:
+            tokens = [(match.start(), match.group()) for match in TOKEN.finditer(text, start, end)]
+            tokens = [(begin - start, word) for begin, word in tokens]
+        if not tokens:
+            continue
+        sentence = document.sentence.add(sentenceIndex=len(document.sentence), tokenOffsetBegin=token_count, tokenOffsetEnd=token_count+len(tokens))
+        token_count += len(tokens)
+        for i, (begin, word) in enumerate(tokens):
+            token = sentence.token.add(word=word, originalText=word, beginChar=start+begin, endChar=start+begin+len(word))
+            if tagged:
+                token.pos = 'PU' if not word[0].isalnum() else TAGS[i % len(TAGS)]
+        if parsed:
+            for field in DEPENDENCY_FIELDS:
+                graph = getattr(sentence, field)
+                for i in range(len(tokens)):
+                    graph.node.add(sentenceIndex=sentence.sentenceIndex, index=i+1)
+                graph.root.append(1)
+                for i in range(2, len(tokens)+1):
+                    graph.edge.add(source=1, target=i, dep=DEPS[i % len(DEPS)])
+    return document
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    '''
+        HTTP server answering like a CoreNLP server started with outputFormat=serialized, after :latency: seconds per request.
+        requests and busy_s count the requests answered and the time spent on them, reported by GET /stats.
+    '''
+    daemon_threads = True
+
+    def __init__(self, port, latency):
+        HTTPServer.__init__(self, ('localhost', port), StandInHandler)
+        self.latency = latency
+        self.requests = 0
+        self.busy_s = 0.0
+        self.lock = threading.Lock()
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, content_type='text/plain'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        if path == '/stats':
+            with self.server.lock:
+                stats = {'requests': self.server.requests, 'busy_s': self.server.busy_s}
+            self.reply(json.dumps(stats).encode('utf-8'), 'application/json')
+        else:
+            # /ping, /ready and /live
+            self.reply(b'pong\n')
+
+    def do_POST(self):
+        start = time.perf_counter()
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        properties = ast.literal_eval(query['properties'][0]) if 'properties' in query else {}
+        text = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if isinstance(properties.get('annotators'), list):
+            properties['annotators'] = ','.join(properties['annotators'])
+        stream = io.BytesIO()
+        writeToDelimitedString(canned_document(text, properties), stream)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.reply(stream.getvalue(), 'application/x-protobuf')
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.busy_s += time.perf_counter() - start
+
+def start_server(latency_ms):
+    '''
+        Starts the stand-in server on a free port in a background thread and returns it.
+    '''
+    server = StandInServer(_find_free_port(), latency_ms / 1000.0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def server_stats(endpoint):
+    with urllib.request.urlopen(endpoint + '/stats') as response:
+        return json.loads(response.read().decode('utf-8'))
+
+##### Corpora #####
+
+ZH_WORDS = ['国务院', '日前', '发出', '紧急', '通知', '要求', '各地', '切实', '落实', '保证', '市场', '供应', '的', '各项', '政策', '维护', '副食品', '价格', '稳定']
+EN_WORDS = ['the', 'server', 'is', 'a', 'test', 'sentence', 'for', 'handle', 'wonder', 'what', 'it', 'will', 'do', 'market', 'prices', 'remain', 'stable']
+
+def corpus(lang, documents, seed=0):
+    '''
+        Synthetic documents of one to four sentences of 5 to 30 words.
+    '''
+    rng = random.Random(seed)
+    texts = []
+    for i in range(documents):
+        sentences = []
+        for s in range(rng.randint(1, 4)):
+            if lang == 'zh-cn':
+                words = [rng.choice(ZH_WORDS) for w in range(rng.randint(5, 30))]
+                sentences.append(''.join(words) + '。')
+            else:
+                words = [rng.choice(EN_WORDS) for w in range(rng.randint(5, 30))]
+                sentences.append(' '.join(words).capitalize() + '.')
+        texts.append(('' if lang == 'zh-cn' else ' ').join(sentences))
+    return texts
+
+##### Cases #####
+
+BATCH_METHODS = {'Segment': StanfordCoreNLP.Segment,
+                'POS_Tag': StanfordCoreNLP.POS_Tag,
+                'Dependency_Parse': StanfordCoreNLP.Dependency_Parse}
+STR_METHODS = {'Segment_str_langdetect': StanfordCoreNLP.Segment_str_langdetect,
+                'POS_Tag_str_langdetect': StanfordCoreNLP.POS_Tag_str_langdetect,
+                'Dependency_Parse_str_langdetect': StanfordCoreNLP.Dependency_Parse_str_langdetect}
+# Parsers, with the batch method producing the strings they read
+PARSERS = {'POS_Tag_str_tolist': (StanfordCoreNLP.POS_Tag_str_tolist, 'POS_Tag', {}),
+            'Dependency_Parse_str_tolist': (StanfordCoreNLP.Dependency_Parse_str_tolist, 'Dependency_Parse', {'sent_split': True})}
+CASES = list(BATCH_METHODS) + list(STR_METHODS) + list(PARSERS)
+
+def use_stand_in(endpoint):
+    '''
+        Makes every CoreNLPClient of the module connect to the stand-in server instead of starting a JVM.
+    '''
+    client_class = StanfordCoreNLP.CoreNLPClient
+    def client(*args, **kwargs):
+        kwargs['endpoint'] = endpoint
+        kwargs['start_server'] = StartServer.DONT_START
+        return client_class(*args, **kwargs)
+    StanfordCoreNLP.CoreNLPClient = client
+
+def peak_rss_mb():
+    '''
+        Peak resident memory of this process in MB, None where the resource module is missing (Windows).
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on MacOSX, kilobytes elsewhere
+    return round(peak / (1024.0**2 if sys.platform == 'darwin' else 1024.0), 1)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values)-1, int(fraction * len(values)))]
+
+def run_case(case, lang, endpoint, documents, docs_per_call, batch_size):
+    '''
+        Runs one case in this process and returns its measures.
+    '''
+    use_stand_in(endpoint)
+    texts = corpus(lang, documents)
+    calls = []
+    if case in PARSERS:
+        parse, method, options = PARSERS[case]
+        # The strings are made before the measure, only parsing is timed
+        strings = BATCH_METHODS[method](texts, tolist=False, verbose=0, lang=lang, batch_size=max(batch_size, 64), **options)
+        calls = [(parse, (string,), {}) for string in strings]
+    elif case in STR_METHODS:
+        calls = [(STR_METHODS[case], (text,), {'be_quiet': True, 'reuse_session': True}) for text in texts]
+    else:
+        options = {'verbose': 0, 'lang': lang, 'batch_size': batch_size}
+        if case == 'Dependency_Parse':
+            options['sent_split'] = True
+            options['pre_tokenized'] = False
+        calls = [(BATCH_METHODS[case], (texts[i:i+docs_per_call],), options) for i in range(0, len(texts), docs_per_call)]
+    before = server_stats(endpoint)
+    latencies = []
+    start = time.perf_counter()
+    for function, args, kwargs in calls:
+        call_start = time.perf_counter()
+        function(*args, **kwargs)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    after = server_stats(endpoint)
+    StanfordCoreNLP.CoreNLP_session_pool.close_all()
+    chars = sum(len(text) for text in texts)
+    return {'case': case,
+            'lang': lang,
+            'documents': len(texts),
+            'chars': chars,
+            'calls': len(calls),
+            'seconds': round(elapsed, 4),
+            'docs_per_s': round(len(texts) / elapsed, 1),
+            'chars_per_s': round(chars / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'requests': after['requests'] - before['requests'],
+            'server_s': round(after['busy_s'] - before['busy_s'], 4),
+            'peak_rss_mb': peak_rss_mb()}
+
+def run_in_subprocess(case, lang, endpoint, args):
+    '''
+        Runs one case in a fresh Python process, so that its peak memory is its own.
+    '''
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', case, '--lang', lang, '--endpoint', endpoint,
+                '--documents', str(args.documents), '--docs-per-call', str(args.docs_per_call), '--batch-size', str(args.batch_size)]
+    output = subprocess.check_output(command)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO, stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, path):
+    '''
+        Prints the throughput of each case relative to a previous output file.
+    '''
+    with open(path) as f:
+        previous = dict(((result['case'], result['lang']), result) for result in json.load(f)['results'])
+    print('\nCompared with {}:'.format(path))
+    for result in results:
+        old = previous.get((result['case'], result['lang']))
+        if old:
+            print('{case:32} {lang:6} docs/s x{:.2f}   p99 x{:.2f}'.format(result['docs_per_s'] / old['docs_per_s'],
+                                                                        result['p99_ms'] / max(old['p99_ms'], 1e-9), **result))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=2000, help='documents per corpus')
+    parser.add_argument('--latency-ms', type=float, default=0, help='time the stand-in server waits before answering each request')
+    parser.add_argument('--docs-per-call', type=int, default=100, help='documents per call of Segment(), POS_Tag() and Dependency_Parse()')
+    parser.add_argument('--batch-size', type=int, default=1, help='batch_size of the batch methods')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma-separated cases, default all')
+    parser.add_argument('--langs', default='zh-cn,en', help='comma-separated corpora languages')
+    parser.add_argument('--output', default='offline_results.json',
+                        help='JSON file for the results, default offline_results.json in the working directory')
+    parser.add_argument('--compare', default=None, help='previous output file to compare with')
+    parser.add_argument('--run-case', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--lang', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--endpoint', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.lang, args.endpoint, args.documents, args.docs_per_call, args.batch_size)))
+        return
+    server = start_server(args.latency_ms)
+    endpoint = 'http://localhost:{}'.format(server.server_address[1])
+    results = []
+    try:
+        for case in args.cases.split(','):
+            for lang in args.langs.split(','):
+                result = run_in_subprocess(case, lang, endpoint, args)
+                results.append(result)
+                print('{case:32} {lang:6} {docs_per_s:10.1f} docs/s {chars_per_s:12.1f} chars/s   p50 {p50_ms:8.2f} ms  p99 {p99_ms:8.2f} ms'
+                        '   server {server_s:7.2f} s of {seconds:7.2f} s   peak rss {peak_rss_mb} MB'.format(**result))
+    finally:
+        server.shutdown()
+    with open(args.output, 'w') as f:
+        json.dump({'settings': {'documents': args.documents, 'latency_ms': args.latency_ms, 'docs_per_call': args.docs_per_call,
+                                'batch_size': args.batch_size},
+                    'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'commit': git_commit(),
+                                    'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                    'results': results}, f, indent=2)
+    print('Results written to {}'.format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#-*- coding: utf-8 -*-
+#!python3
+
+'''
+    Measures server startup time and memory of the Chinese property profiles.
+
+    For each task, starts a CoreNLP server once with every Chinese property (task=None, what the methods used before)
+    and once with the minimal profile of that task, annotates one sentence, and reports:
+        startup_s: seconds from starting the client until the first annotation returns (JVM start + model loading)
+        rss_mb: resident memory of the server process after the first annotation
+
+    Needs a CoreNLP installation with CORENLP_HOME set, see README.md.
+
+    Usage:
+        python benchmarks/profile_startup.py [--repeat 3] [--memory 4G] [--output profile_startup.json]
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from StanfordCoreNLP import CoreNLPClient, _find_free_port, get_StanfordCoreNLP_chinese_properties
+
+TEXT = "国务院日前发出紧急通知，要求各地切实落实保证市场供应的各项政策，维护副食品价格稳定。"
+
+TASK_ANNOTATORS = {'segment': ['tokenize', 'ssplit'],
+                    'pos': ['tokenize', 'ssplit', 'pos'],
+                    'depparse': ['tokenize', 'ssplit', 'pos', 'depparse']}
+
+def rss_mb(pid):
+    '''
+        Resident memory of a process in MB, read with ps so that it works on Linux and MacOSX.
+    '''
+    output = subprocess.check_output(['ps', '-o', 'rss=', '-p', str(pid)])
+    return int(output.strip()) / 1024.0
+
+def measure(task, profile, memory):
+    properties = get_StanfordCoreNLP_chinese_properties(task=profile)
+    client = CoreNLPClient(annotators=TASK_ANNOTATORS[task],
+                            properties=properties,
+                            timeout=60000,
+                            memory=memory,
+                            be_quiet=True,
+                            endpoint='http://localhost:{}'.format(_find_free_port()))
+    start = time.time()
+    client.start()
+    try:
+        client.annotate(TEXT)
+        startup = time.time() - start
+        rss = rss_mb(client.server.pid)
+    finally:
+        client.stop()
+    return {'task': task, 'profile': profile or 'full', 'startup_s': round(startup, 3), 'rss_mb': round(rss, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--memory', default='4G')
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    args = parser.parse_args()
+    results = []
+    for task in ('segment', 'pos', 'depparse'):
+        for profile in (None, task):
+            runs = [measure(task, profile, args.memory) for i in range(args.repeat)]
+            best = min(runs, key=lambda run: run['startup_s'])
+            results.append(best)
+            print('{task:9} {profile:9} startup {startup_s:7.2f} s   rss {rss_mb:8.1f} MB'.format(**best))
+    for task in ('segment', 'pos', 'depparse'):
+        full, minimal = [result for result in results if result['task'] == task]
+        print('{:9} startup -{:.0%}  rss -{:.0%}'.format(task,
+                                                    1 - minimal['startup_s'] / full['startup_s'],
+                                                    1 - minimal['rss_mb'] / full['rss_mb']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
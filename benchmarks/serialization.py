@@ -0,0 +1,83 @@
+#-*- coding: utf-8 -*-
+#!python3
+
+'''
+    Compares storing POS_Tag() and Dependency_Parse() results as the strings of tolist=False, read back with
+    POS_Tag_str_tolist() and Dependency_Parse_str_tolist(), with ResultWriter and read_results().
+    Runs on synthetic results, no CoreNLP server needed.
+
+    Usage:
+        python benchmarks/serialization.py [--documents 100000]
+'''
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from StanfordCoreNLP import (ResultWriter, read_results, POS_Tag_str_tolist, Dependency_Parse_str_tolist,
+                            _pos_tagged_output, _dependency_parse_output)
+
+WORDS = ['国务院', '日前', '发出', '紧急', '通知', '，', '要求', '各地', '切实', '落实', '保证', '市场', '供应', '的', '政策', '。']
+TAGS = ['NN', 'NT', 'VV', 'JJ', 'PU', 'AD', 'DEG', 'DT', 'M']
+DEPS = ['nsubj', 'dobj', 'amod', 'advmod', 'punct', 'compound:nn', 'case', 'mark']
+
+def synthetic_documents(count, seed=0):
+    '''
+        Yields (words, edges) per sentence for each document, the input of the output helpers of the methods.
+    '''
+    rng = random.Random(seed)
+    for i in range(count):
+        graphs = []
+        for s in range(rng.randint(1, 3)):
+            words = [rng.choice(WORDS) for w in range(rng.randint(5, 30))]
+            edges = [(rng.choice(DEPS), rng.randint(1, len(words)), target) for target in range(1, len(words)+1)]
+            graphs.append((words, edges))
+        yield graphs
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=100000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+    graphs = list(synthetic_documents(args.documents))
+    pos_tags = [[[(word, rng.choice(TAGS)) for word in words] for words, edges in document] for document in graphs]
+    dependencies = [_dependency_parse_output(document) for document in graphs]
+    # (method, kind, results, what the string form is written from, writer of the string form, reader of the string form)
+    cases = [('POS_Tag', 'pos_tag', pos_tags, pos_tags,
+                lambda document: _pos_tagged_output(document, tolist=False), POS_Tag_str_tolist),
+            ('Dependency_Parse', 'dependency_parse', dependencies, graphs,
+                lambda document: _dependency_parse_output(document, tolist=False), Dependency_Parse_str_tolist)]
+    for name, kind, results, sources, to_string, from_string in cases:
+        write_strings, strings = timed(lambda: [to_string(document) for document in sources])
+        read_strings, restored = timed(lambda: [from_string(string) for string in strings])
+        buffer = io.StringIO()
+        def write_file():
+            writer = ResultWriter(buffer, kind)
+            writer.write_all(results)
+            writer.close()
+        write_file_time, unused = timed(write_file)
+        buffer.seek(0)
+        read_file_time, read_back = timed(lambda: list(read_results(buffer)))
+        print('{}: {} documents'.format(name, len(results)))
+        print('    strings      write {:6.2f} s  read {:6.2f} s  exact round trip: {}'.format(write_strings, read_strings, restored == results))
+        print('    ResultWriter write {:6.2f} s  read {:6.2f} s  exact round trip: {}'.format(write_file_time, read_file_time, read_back == results))
+    awkward = [[[('C#', 'NN'), ('a b', 'NN'), ('f(x,y)', 'NN'), ('#', 'PU')]]]
+    buffer = io.StringIO()
+    with ResultWriter(buffer, 'pos_tag') as writer:
+        writer.write_all(awkward)
+    buffer.seek(0)
+    print('Words with "#", spaces, "(", ")" and ",": strings exact {}, ResultWriter exact {}'.format(
+        [POS_Tag_str_tolist(_pos_tagged_output(document, tolist=False)) for document in awkward] == awkward, list(read_results(buffer)) == awkward))
+
+if __name__ == '__main__':
+    main()
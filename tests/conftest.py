@@ -0,0 +1,30 @@
+'''
+    Shared fixtures: the stand-in CoreNLP server of benchmarks/offline.py, so the tests need stanza and langdetect but no Java or CoreNLP.
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import offline
+import StanfordCoreNLP
+
+@pytest.fixture(scope='session')
+def stand_in():
+    '''
+        Endpoint of a stand-in server answering without latency, which every CoreNLPClient of the module connects to.
+    '''
+    server = offline.start_server(0)
+    endpoint = 'http://localhost:%d' % server.server_address[1]
+    client_class = StanfordCoreNLP.CoreNLPClient
+    offline.use_stand_in(endpoint)
+    yield endpoint
+    StanfordCoreNLP.CoreNLPClient = client_class
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def zh_texts():
+    return offline.corpus('zh-cn', 30) + ['']
@@ -0,0 +1,15 @@
+import StanfordCoreNLP
+
+def test_annotate_matches_the_separate_methods(stand_in, zh_texts):
+    documents = StanfordCoreNLP.Annotate(zh_texts, verbose=0, batch_size=4)
+    assert [document['segment'] for document in documents] == StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    assert [document['pos'] for document in documents] == StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False)
+    parses = StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False, sent_split=True)
+    assert [document['deps'] for document in documents if document['segment']] == [parse for parse, text in zip(parses, zh_texts) if text]
+
+def test_annotate_tasks(stand_in, zh_texts):
+    documents = StanfordCoreNLP.Annotate(zh_texts, tasks=('pos', 'segment'), verbose=0, tolist=False)
+    assert all(sorted(document) == ['pos', 'segment'] for document in documents)
+    assert [document['pos'] for document in documents] == StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, tolist=False)
+    raw = StanfordCoreNLP.Annotate(zh_texts, tasks=('segment',), verbose=0, raw=True)
+    assert [document.tolist() for document in raw] == [{'segment': words} for words in StanfordCoreNLP.Segment(zh_texts, verbose=0)]
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import stanza.server
+
+import offline
+
+import StanfordCoreNLP
+
+def test_asegment_matches_segment(stand_in, zh_texts):
+    words = asyncio.run(StanfordCoreNLP.asegment(zh_texts, endpoint=stand_in, concurrency=4, batch_size=4))
+    assert words == StanfordCoreNLP.Segment(zh_texts, verbose=0)
+
+def test_apos_tag_from_pool(stand_in, zh_texts):
+    try:
+        tags = asyncio.run(StanfordCoreNLP.apos_tag(zh_texts, pre_tokenized=False, concurrency=2))
+    finally:
+        StanfordCoreNLP.CoreNLP_session_pool.close_all()
+    assert tags == StanfordCoreNLP.POS_Tag(zh_texts, pre_tokenized=False, verbose=0)
+
+def test_afailures_recorded(zh_texts, monkeypatch):
+    monkeypatch.setattr(StanfordCoreNLP, 'CoreNLPClient', stanza.server.CoreNLPClient)
+    failures = []
+    # Nothing listens on this port: every document fails and gets the empty result
+    words = asyncio.run(StanfordCoreNLP.asegment(zh_texts[:3], endpoint='http://localhost:9', failures=failures, timeout=1000))
+    assert words == [[], [], []]
+    assert [failure['index'] for failure in failures] == [0, 1, 2]
+
+def test_apool_waits_for_server(zh_texts, monkeypatch):
+    # The server of the pool only comes up after the first request would have been sent
+    port = StanfordCoreNLP._find_free_port()
+    endpoint = 'http://localhost:%d' % port
+    servers = []
+    def start():
+        server = offline.StandInServer(port, 0)
+        servers.append(server)
+        server.serve_forever()
+    threading.Timer(1.5, start).start()
+    def client(*args, **kwargs):
+        kwargs.update(endpoint=endpoint, start_server=stanza.server.StartServer.DONT_START)
+        return stanza.server.CoreNLPClient(*args, **kwargs)
+    monkeypatch.setattr(StanfordCoreNLP, 'CoreNLPClient', client)
+    try:
+        words = asyncio.run(StanfordCoreNLP.asegment(zh_texts[:3]))
+    finally:
+        StanfordCoreNLP.CoreNLP_session_pool.close_all()
+        while not servers:
+            time.sleep(0.1)
+        servers[0].shutdown()
+        servers[0].server_close()
+    assert len(words) == 3 and all(words)
+
+def test_agenerator_input_read_as_requests_are_sent(stand_in, zh_texts, monkeypatch):
+    expected = StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    monkeypatch.setattr(StanfordCoreNLP, 'CoreNLPClient', stanza.server.CoreNLPClient)
+    server = offline.start_server(200)
+    endpoint = 'http://localhost:%d' % server.server_address[1]
+    read = []
+    def texts():
+        for text in zh_texts:
+            read.append(text)
+            yield text
+    async def main():
+        task = asyncio.ensure_future(StanfordCoreNLP.asegment(texts(), endpoint=endpoint, concurrency=2))
+        await asyncio.sleep(0.1)
+        assert len(read) <= 3
+        return await task
+    try:
+        words = asyncio.run(main())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert words == expected
+
+def test_acancelled_run_keeps_session_until_requests_end(zh_texts, monkeypatch):
+    server = offline.start_server(300)
+    endpoint = 'http://localhost:%d' % server.server_address[1]
+    def client(*args, **kwargs):
+        kwargs.update(endpoint=endpoint, start_server=stanza.server.StartServer.DONT_START)
+        return stanza.server.CoreNLPClient(*args, **kwargs)
+    monkeypatch.setattr(StanfordCoreNLP, 'CoreNLPClient', client)
+    async def main():
+        task = asyncio.ensure_future(StanfordCoreNLP.asegment(zh_texts, concurrency=2))
+        await asyncio.sleep(0.15)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    try:
+        asyncio.run(main())
+        # Both requests in flight were answered before the session went back to the pool
+        assert server.requests == 2
+        assert [session.in_use for session in StanfordCoreNLP.CoreNLP_session_pool._sessions.values()] == [0]
+    finally:
+        StanfordCoreNLP.CoreNLP_session_pool.close_all()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,14 @@
+import StanfordCoreNLP
+
+def test_cache_hits_on_rerun(stand_in, zh_texts, tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with StanfordCoreNLP.AnnotationCache(path) as cache:
+        first = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, cache=cache, batch_size=4)
+        assert cache.stats()['hits'] == 0
+        again = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, cache=cache, batch_size=4)
+        assert again == first
+        assert cache.stats()['hits'] == len(zh_texts) - 1
+    metrics = StanfordCoreNLP.Metrics()
+    reopened = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, cache=path, metrics=metrics)
+    assert reopened == first
+    assert metrics.summary()['counters']['cache_hits'] == len(zh_texts) - 1
@@ -0,0 +1,40 @@
+from stanza.server import AnnotationException
+
+import StanfordCoreNLP
+
+def failing_on(monkeypatch, bad_text):
+    annotate_request = StanfordCoreNLP._annotate_request
+    def flaky(client, text, *args, **kwargs):
+        if text == bad_text:
+            raise AnnotationException('server error')
+        return annotate_request(client, text, *args, **kwargs)
+    monkeypatch.setattr(StanfordCoreNLP, '_annotate_request', flaky)
+
+def test_resume_reads_results_back(stand_in, zh_texts, tmp_path):
+    checkpoint = str(tmp_path / 'run.ckpt')
+    expected = StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    # The first run stops half way
+    results = StanfordCoreNLP.iter_segment(zh_texts, checkpoint=StanfordCoreNLP.Checkpoint(checkpoint, every=5))
+    for i, result in zip(range(12), results):
+        pass
+    results.close()
+    metrics = StanfordCoreNLP.Metrics()
+    assert StanfordCoreNLP.Segment(zh_texts, verbose=0, checkpoint=checkpoint, metrics=metrics) == expected
+    assert metrics.summary()['counters']['documents'] == len(zh_texts) - 12
+
+def test_failed_documents_are_retried_on_resume(stand_in, zh_texts, tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / 'run.ckpt')
+    expected = StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    with monkeypatch.context() as patch:
+        failing_on(patch, zh_texts[10])
+        failures = []
+        first = StanfordCoreNLP.Segment(zh_texts, verbose=0, checkpoint=checkpoint, failures=failures)
+    assert [failure['index'] for failure in failures] == [10]
+    assert first[10] == [] and first[:10] == expected[:10]
+    metrics = StanfordCoreNLP.Metrics()
+    assert StanfordCoreNLP.Segment(zh_texts, verbose=0, checkpoint=checkpoint, metrics=metrics) == expected
+    # Documents before the failed one are read back, the rest is annotated again
+    assert metrics.summary()['counters']['documents'] == len(zh_texts) - 10
+    metrics = StanfordCoreNLP.Metrics()
+    assert StanfordCoreNLP.Segment(zh_texts, verbose=0, checkpoint=checkpoint, metrics=metrics) == expected
+    assert 'documents' not in metrics.summary()['counters']
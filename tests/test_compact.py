@@ -0,0 +1,21 @@
+import pickle
+
+import StanfordCoreNLP
+
+def test_token_store_matches_lists(stand_in, zh_texts):
+    words = StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    store = StanfordCoreNLP.Segment(zh_texts, verbose=0, compact=True, batch_size=4)
+    assert isinstance(store, StanfordCoreNLP.TokenStore) and len(store) == len(zh_texts)
+    assert store.tolist() == words
+    assert store[0][0].words == words[0][0]
+    tags = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False)
+    tag_store = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, compact=True)
+    assert tag_store.tolist() == tags
+    assert [document.tolist() for document in tag_store] == tags
+    assert pickle.loads(pickle.dumps(tag_store)).tolist() == tags
+
+def test_token_store_with_other_output_options(stand_in, zh_texts):
+    for options in ({'sent_split': False}, {'tolist': False}):
+        assert StanfordCoreNLP.Segment(zh_texts, verbose=0, compact=True, **options).tolist() == StanfordCoreNLP.Segment(zh_texts, verbose=0, **options)
+        assert StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, compact=True, **options).tolist() == \
+                StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, **options)
@@ -0,0 +1,6 @@
+import StanfordCoreNLP
+
+def test_pipeline_and_convert_processes(stand_in, zh_texts):
+    expected = StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False, batch_size=4)
+    assert StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False, batch_size=4, pipeline=True) == expected
+    assert StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False, batch_size=4, convert_processes=2) == expected
@@ -0,0 +1,40 @@
+import StanfordCoreNLP
+
+def test_duplicates_get_the_result_of_the_first_copy(stand_in, zh_texts):
+    texts = zh_texts[:10] + zh_texts[:10] + [' '.join(zh_texts[0].split(' ')) + ' ']
+    expected = StanfordCoreNLP.Segment(texts, verbose=0)
+    dedup = StanfordCoreNLP.Dedup(normalize=StanfordCoreNLP.collapse_whitespace)
+    results = StanfordCoreNLP.Segment(texts, verbose=0, batch_size=4, dedup=dedup)
+    assert results == expected
+    stats = dedup.stats()
+    assert stats['documents'] == len(texts)
+    assert stats['duplicate_documents'] == 11
+
+def test_sentence_dedup(stand_in):
+    texts = ['第一句话。第二句话。', '第二句话。第三句话。', '第一句话。第三句话。']
+    expected = StanfordCoreNLP.Segment(texts, verbose=0)
+    dedup = StanfordCoreNLP.Dedup(sentences=True)
+    assert StanfordCoreNLP.Segment(texts, verbose=0, batch_size=2, dedup=dedup) == expected
+    assert dedup.stats()['sentences'] == 6
+    assert dedup.stats()['duplicate_sentences'] == 3
+
+def test_copies_are_independent(stand_in, zh_texts):
+    texts = zh_texts[:3] * 3
+    dedup = StanfordCoreNLP.Dedup()
+    results = StanfordCoreNLP.Segment(texts, verbose=0, batch_size=2, dedup=dedup)
+    assert dedup.stats()['duplicate_documents'] == 6
+    assert results[0] == results[3] == results[6] and results[0] is not results[3]
+    results[0].append(['changed'])
+    results[3][0].append('changed')
+    assert results[6] == results[0][:-1] and results[6][0][-1] != 'changed'
+    # A result changed by the caller before its copies come along is not what they get
+    iterated = StanfordCoreNLP.iter_segment(texts, dedup=True)
+    first = next(iterated)
+    expected = [list(sentence) for sentence in first]
+    first.clear()
+    assert list(iterated)[2] == expected
+
+def test_raw_copies_are_independent(stand_in, zh_texts):
+    documents = StanfordCoreNLP.Dependency_Parse(zh_texts[:2] * 2, verbose=0, pre_tokenized=False, raw=True, dedup=True)
+    assert documents[0] is not documents[2] and documents[0].sentences[0] is not documents[2].sentences[0]
+    assert documents[0].tolist() == documents[2].tolist()
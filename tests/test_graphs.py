@@ -0,0 +1,19 @@
+import pickle
+
+import StanfordCoreNLP
+
+def test_dependency_graphs_match_lists(stand_in, zh_texts):
+    for options in ({}, {'output_with_sentence': False}, {'tolist': False}):
+        parses = StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False, **options)
+        graphs = StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False, compact=True, batch_size=4, **options)
+        assert isinstance(graphs, StanfordCoreNLP.DependencyGraphs)
+        assert graphs.tolist() == parses
+        assert pickle.loads(pickle.dumps(graphs)).tolist() == parses
+
+def test_edges_keep_token_indices(stand_in, zh_texts):
+    parses = StanfordCoreNLP.Dependency_Parse(zh_texts[:1], verbose=0, pre_tokenized=False)
+    graphs = StanfordCoreNLP.Dependency_Parse(zh_texts[:1], verbose=0, pre_tokenized=False, compact=True)
+    sentence = graphs[0][0]
+    words, edges = parses[0][0]
+    assert sentence.words == words
+    assert [(label, sentence.words[source-1] if source else 'ROOT', sentence.words[target-1]) for label, source, target in sentence.edges] == edges
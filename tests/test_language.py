@@ -0,0 +1,15 @@
+import langdetect
+
+import StanfordCoreNLP
+
+def test_detect_language_leaves_langdetect_seed_alone():
+    langdetect.DetectorFactory.seed = None
+    text = 'Ceci est un texte assez court'
+    answers = set(StanfordCoreNLP.detect_language(text) for i in range(5))
+    assert len(answers) == 1
+    assert langdetect.DetectorFactory.seed is None
+
+def test_clear_cut_texts():
+    assert StanfordCoreNLP.detect_language('國務院日前發出緊急通知') == 'zh-cn'
+    assert StanfordCoreNLP.detect_language('This is a test sentence for the server to handle.') == 'en'
+    assert StanfordCoreNLP.detect_language('12345 !!') == 'undetermined'
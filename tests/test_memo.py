@@ -0,0 +1,27 @@
+import StanfordCoreNLP
+
+def test_memo_answers_repeated_strings(stand_in, zh_texts, monkeypatch):
+    text = zh_texts[0]
+    expected = StanfordCoreNLP.POS_Tag([text], verbose=0, pre_tokenized=False)[0]
+    memo = StanfordCoreNLP.ResultMemo(capacity=2)
+    tags = StanfordCoreNLP.POS_Tag_str_langdetect(text, pre_tokenized=False, chinese_only=True, memo=memo)
+    assert tags == expected
+    requests = []
+    monkeypatch.setattr(StanfordCoreNLP, '_annotate_str', lambda *args, **kwargs: requests.append(args))
+    again = StanfordCoreNLP.POS_Tag_str_langdetect(text, pre_tokenized=False, chinese_only=True, memo=memo)
+    assert again == expected and requests == []
+    # Each hit is a copy of its own
+    again.append('changed')
+    assert StanfordCoreNLP.POS_Tag_str_langdetect(text, pre_tokenized=False, chinese_only=True, memo=memo) == expected
+    assert memo.stats()['hits'] == 2 and memo.stats()['misses'] == 1
+
+def test_memo_key_holds_the_result_parameters(stand_in, zh_texts):
+    text = zh_texts[0]
+    memo = StanfordCoreNLP.ResultMemo(capacity=2)
+    words = StanfordCoreNLP.Segment_str_langdetect(text, chinese_only=True, memo=memo)
+    flat = StanfordCoreNLP.Segment_str_langdetect(text, chinese_only=True, sent_split=False, memo=memo)
+    assert words == StanfordCoreNLP.Segment([text], verbose=0)[0]
+    assert flat == StanfordCoreNLP.Segment([text], verbose=0, sent_split=False)[0]
+    assert memo.stats()['hits'] == 0
+    StanfordCoreNLP.Segment_str_langdetect(zh_texts[1], chinese_only=True, memo=memo)
+    assert len(memo) == 2 and memo.stats()['evictions'] == 1
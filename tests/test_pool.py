@@ -0,0 +1,55 @@
+import time
+
+import StanfordCoreNLP
+
+def test_pool_reuses_sessions(stand_in):
+    pool = StanfordCoreNLP.CoreNLPSessionPool(idle_timeout=None)
+    try:
+        with pool.session('en', ['tokenize', 'ssplit']) as client:
+            with pool.session('en', ['tokenize', 'ssplit']) as again:
+                assert again is client
+        with pool.session('en', ['tokenize', 'ssplit']) as again:
+            assert again is client
+        with pool.session('en', ['tokenize']) as other:
+            assert other is not client
+        assert len(pool) == 2
+    finally:
+        pool.close_all()
+    assert len(pool) == 0
+
+def test_pool_closes_idle_sessions(stand_in):
+    pool = StanfordCoreNLP.CoreNLPSessionPool(idle_timeout=0.2, reap_interval=60)
+    try:
+        with pool.session('en', ['tokenize']):
+            time.sleep(0.3)
+            pool.close_idle()
+            assert len(pool) == 1 # in use
+        pool.close_idle()
+        assert len(pool) == 1 # just released
+        time.sleep(0.3)
+        pool.close_idle()
+        assert len(pool) == 0
+    finally:
+        pool.close_all()
+
+def test_pool_reaper(stand_in):
+    pool = StanfordCoreNLP.CoreNLPSessionPool(idle_timeout=0.1, reap_interval=0.1)
+    try:
+        pool.annotate('A sentence.', 'en', ['tokenize'])
+        assert len(pool) == 1
+        deadline = time.time() + 5
+        while len(pool) and time.time() < deadline:
+            time.sleep(0.05)
+        assert len(pool) == 0
+    finally:
+        pool.close_all()
+
+def test_str_methods_reuse_the_module_pool(stand_in, zh_texts):
+    try:
+        expected = StanfordCoreNLP.Segment_str_langdetect(zh_texts[0], chinese_only=True)
+        for text in zh_texts[:3]:
+            StanfordCoreNLP.Segment_str_langdetect(text, chinese_only=True, reuse_session=True)
+        assert len(StanfordCoreNLP.CoreNLP_session_pool) == 1
+        assert StanfordCoreNLP.Segment_str_langdetect(zh_texts[0], chinese_only=True, reuse_session=True) == expected
+    finally:
+        StanfordCoreNLP.CoreNLP_session_pool.close_all()
@@ -0,0 +1,50 @@
+import StanfordCoreNLP
+
+def test_sharded_results_round_trip(stand_in, zh_texts, tmp_path):
+    directory = str(tmp_path / 'parsed')
+    expected = StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False)
+    with StanfordCoreNLP.ShardedResultWriter(directory, 'dependency_parse', docs_per_shard=7) as writer:
+        writer.write_all(StanfordCoreNLP.iter_dependency_parse(zh_texts, pre_tokenized=False))
+    with StanfordCoreNLP.ShardedResults(directory) as results:
+        assert len(results) == len(zh_texts)
+        assert list(results) == expected
+        assert results[-1] == expected[-1] and results[9] == expected[9]
+
+def test_sharded_results_after_a_crash(stand_in, zh_texts, tmp_path):
+    directory = str(tmp_path / 'words')
+    expected = StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    writer = StanfordCoreNLP.ShardedResultWriter(directory, 'segment', docs_per_shard=7)
+    with StanfordCoreNLP.ShardedResults(directory) as results:
+        assert len(results) == 0
+    for result in expected[:17]:
+        writer.write(result)
+    # The writer is never closed: the two complete shards are readable, the third is not counted yet
+    with StanfordCoreNLP.ShardedResults(directory) as results:
+        assert list(results) == expected[:14]
+    writer.write_all(expected[17:])
+    writer.close()
+    with StanfordCoreNLP.ShardedResults(directory) as results:
+        assert list(results) == expected
+
+def test_result_file_round_trip(stand_in, zh_texts, tmp_path):
+    texts = zh_texts + ['含有 # , ( ) 的\n文本。']
+    for kind, results in (('segment', StanfordCoreNLP.Segment(texts, verbose=0)),
+                        ('pos_tag', StanfordCoreNLP.POS_Tag(texts, verbose=0, pre_tokenized=False)),
+                        ('dependency_parse', StanfordCoreNLP.Dependency_Parse(texts, verbose=0, pre_tokenized=False))):
+        path = str(tmp_path / (kind + '.jsonl'))
+        with StanfordCoreNLP.ResultWriter(path, kind) as writer:
+            writer.write_all(results)
+        assert writer.count == len(texts)
+        assert list(StanfordCoreNLP.read_results(path)) == results
+
+def test_result_file_options(stand_in, zh_texts, tmp_path):
+    path = str(tmp_path / 'tags.jsonl')
+    tags = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, sent_split=False)
+    with StanfordCoreNLP.ResultWriter(path, 'pos_tag', sent_split=False) as writer:
+        writer.write_all(tags)
+    assert list(StanfordCoreNLP.read_results(path)) == tags
+    path = str(tmp_path / 'edges.jsonl')
+    edges = StanfordCoreNLP.Dependency_Parse(zh_texts, verbose=0, pre_tokenized=False, output_with_sentence=False)
+    with StanfordCoreNLP.ResultWriter(path, 'dependency_parse', output_with_sentence=False) as writer:
+        writer.write_all(edges)
+    assert list(StanfordCoreNLP.read_results(path)) == edges
@@ -0,0 +1,25 @@
+import pickle
+
+import StanfordCoreNLP
+
+def test_raw_document_pickles(stand_in, zh_texts):
+    documents = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, raw=True, batch_size=4)
+    copies = pickle.loads(pickle.dumps(documents))
+    assert [document.tolist() for document in copies] == [document.tolist() for document in documents]
+    assert copies[0].tags == documents[0].tags
+
+def test_raw_cache_round_trip(stand_in, zh_texts, tmp_path):
+    cache = str(tmp_path / 'cache.sqlite')
+    first = StanfordCoreNLP.Segment(zh_texts, verbose=0, raw=True, cache=cache)
+    metrics = StanfordCoreNLP.Metrics()
+    again = StanfordCoreNLP.Segment(zh_texts, verbose=0, raw=True, cache=cache, metrics=metrics)
+    assert [document.tolist() for document in again] == [document.tolist() for document in first]
+    assert metrics.summary()['counters']['cache_hits'] == len(zh_texts) - 1
+
+def test_raw_checkpoint_round_trip(stand_in, zh_texts, tmp_path):
+    checkpoint = str(tmp_path / 'run.ckpt')
+    expected = StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    first = StanfordCoreNLP.Segment(zh_texts, verbose=0, raw=True, checkpoint=checkpoint)
+    resumed = StanfordCoreNLP.Segment(zh_texts, verbose=0, raw=True, checkpoint=checkpoint)
+    assert [document.tolist() for document in first] == expected
+    assert [document.tolist() for document in resumed] == expected
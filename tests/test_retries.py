@@ -0,0 +1,71 @@
+import requests
+from stanza.server import AnnotationException, TimeoutException
+
+import StanfordCoreNLP
+
+def server_error(message):
+    '''
+        AnnotationException as stanza raises it for an HTTP 500 response of the server.
+    '''
+    response = requests.models.Response()
+    response.status_code = 500
+    response._content = message.encode('utf-8')
+    return AnnotationException(requests.HTTPError(message, response=response))
+
+def connection_refused():
+    '''
+        AnnotationException as stanza raises it when nothing listens on the endpoint.
+    '''
+    try:
+        try:
+            requests.post('http://localhost:%d' % StanfordCoreNLP._find_free_port(), timeout=5)
+        except requests.exceptions.RequestException as error:
+            raise AnnotationException(error)
+    except AnnotationException as error:
+        return error
+
+def failing(monkeypatch, error, fails=lambda text: True):
+    annotate_request = StanfordCoreNLP._annotate_request
+    requested = []
+    def flaky(client, text, *args, **kwargs):
+        requested.append(text)
+        if fails(text):
+            raise error
+        return annotate_request(client, text, *args, **kwargs)
+    monkeypatch.setattr(StanfordCoreNLP, '_annotate_request', flaky)
+    return requested
+
+def test_unreachable_server_fails_batches_at_once(stand_in, zh_texts, monkeypatch):
+    texts = zh_texts[:-1]
+    requested = failing(monkeypatch, connection_refused())
+    failures = []
+    results = StanfordCoreNLP.Segment(texts, verbose=0, batch_size=5, failures=failures)
+    assert len(requested) == len(texts) // 5
+    assert [failure['index'] for failure in failures] == list(range(len(texts)))
+    assert results == [[]] * len(texts)
+
+def test_other_server_errors_are_not_retried(stand_in, zh_texts, monkeypatch):
+    long_text = ''.join(zh_texts[:10])
+    requested = failing(monkeypatch, server_error('java.lang.RuntimeException: no models for this language'))
+    failures = []
+    StanfordCoreNLP.Segment([long_text], verbose=0, failures=failures)
+    assert len(requested) == 1
+    assert failures[0]['status'] == 'failed'
+
+def test_too_long_batches_are_halved_and_documents_split(stand_in, zh_texts, monkeypatch):
+    long_text = ''.join(zh_texts[:10])
+    texts = zh_texts[10:14] + [long_text]
+    expected = StanfordCoreNLP.Segment(texts, verbose=0)
+    for error in (TimeoutException('Timeout requesting to CoreNLPServer'), server_error('CoreNLP request timed out. Your document may be too long.')):
+        with monkeypatch.context() as patch:
+            failing(patch, error, fails=lambda text: len(text) > len(long_text) // 2)
+            failures = []
+            assert StanfordCoreNLP.Segment(texts, verbose=0, batch_size=5, failures=failures) == expected
+            assert [(failure['index'], failure['status']) for failure in failures] == [(4, 'split')]
+
+def test_too_long():
+    assert StanfordCoreNLP._too_long(TimeoutException('Timeout requesting to CoreNLPServer'))
+    assert StanfordCoreNLP._too_long(server_error('Request is too long to be handled by server: 200000 characters.'))
+    assert not StanfordCoreNLP._too_long(server_error('java.lang.NullPointerException'))
+    assert not StanfordCoreNLP._too_long(connection_refused())
+    assert not StanfordCoreNLP._too_long(ValueError('bad output'))
@@ -0,0 +1,26 @@
+import stanza.server
+
+import offline
+import StanfordCoreNLP
+
+def test_documents_spread_over_shards(stand_in, zh_texts, monkeypatch):
+    expected = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False)
+    # One stand-in server per shard, in the order the shards are started
+    servers = [offline.start_server(20) for shard in range(3)]
+    started = []
+    def client(*args, **kwargs):
+        server = servers[len(started) % len(servers)]
+        started.append(kwargs.get('endpoint'))
+        kwargs.update(endpoint='http://localhost:%d' % server.server_address[1], start_server=stanza.server.StartServer.DONT_START)
+        return stanza.server.CoreNLPClient(*args, **kwargs)
+    monkeypatch.setattr(StanfordCoreNLP, 'CoreNLPClient', client)
+    try:
+        tags = StanfordCoreNLP.POS_Tag(zh_texts, verbose=0, pre_tokenized=False, shards=3, batch_size=2)
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    assert tags == expected
+    # Each shard got its own port, and a share of the requests
+    assert len(set(started)) == 3
+    assert all(server.requests for server in servers)
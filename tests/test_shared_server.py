@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import offline
+import StanfordCoreNLP
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+# Runs the daemon of CoreNLPSharedServer with a stand-in server in its own process instead of a JVM
+DAEMON = '''
+import json, sys
+sys.path[:0] = sys.argv[1:3]
+import offline, StanfordCoreNLP
+server = offline.start_server(0)
+offline.use_stand_in('http://localhost:%d' % server.server_address[1])
+StanfordCoreNLP._serve_shared(json.loads(sys.argv[3]))
+'''
+
+# Attaches to the shared server from another process and prints the lock file it got
+ATTACH = '''
+import json, sys
+sys.path[:0] = sys.argv[1:3]
+import StanfordCoreNLP
+server = StanfordCoreNLP.CoreNLPSharedServer(['tokenize', 'ssplit'], idle_timeout=float(sys.argv[4]), lock_dir=sys.argv[3], start_timeout=30)
+info = server.acquire()
+print(json.dumps(info))
+server.release(info)
+'''
+
+class StandInSharedServer(StanfordCoreNLP.CoreNLPSharedServer):
+    def _daemon_command(self):
+        command = StanfordCoreNLP.CoreNLPSharedServer._daemon_command(self)
+        return [sys.executable, '-c', DAEMON, os.path.dirname(TESTS), os.path.dirname(offline.__file__), command[-1]]
+
+@pytest.fixture
+def shared(tmp_path):
+    server = StandInSharedServer(['tokenize', 'ssplit'], idle_timeout=1, lock_dir=str(tmp_path), start_timeout=30)
+    yield server
+    server.stop()
+
+def wait_for(condition, seconds=15):
+    deadline = time.time() + seconds
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.1)
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def test_processes_share_one_daemon(shared, zh_texts):
+    with shared.attach() as client:
+        words = StanfordCoreNLP._segment_sentences(client.annotate(zh_texts[0]).sentence)
+        info = shared.status()
+        other = subprocess.check_output([sys.executable, '-c', ATTACH, os.path.dirname(TESTS), os.path.dirname(offline.__file__),
+                                        shared.lock_dir, str(shared.idle_timeout)])
+    assert words
+    assert info['users'] == 1 and info['healthy']
+    other = json.loads(other.decode('utf-8'))
+    assert (other['pid'], other['endpoint']) == (info['pid'], info['endpoint'])
+    # Another object of the same settings in this process attaches to the same daemon
+    again = StanfordCoreNLP.CoreNLPSharedServer(['tokenize', 'ssplit'], idle_timeout=1, lock_dir=shared.lock_dir)
+    info_again = again.acquire()
+    assert info_again['pid'] == info['pid']
+    again.release(info_again)
+
+def test_daemon_stops_after_idle_timeout(shared):
+    with shared.attach():
+        info = shared.status()
+        time.sleep(2)
+        # Held leases keep it up past idle_timeout
+        assert shared.status() is not None
+    wait_for(lambda: shared.status() is None)
+    assert not os.path.exists(shared.lock_path) and not os.path.exists(info['leases'])
+
+def test_dead_leases_are_reaped(shared):
+    info = shared.acquire()
+    shared.release(info)
+    lease = os.path.join(info['leases'], str(dead_pid()))
+    open(lease, 'w').close()
+    assert shared.status()['users'] == 0
+    assert not os.path.exists(lease)
+    # A lease of a dead process does not keep the daemon up
+    open(lease, 'w').close()
+    wait_for(lambda: shared.status() is None)
+
+def test_stale_lock_is_replaced(shared):
+    os.makedirs(shared.lock_dir, exist_ok=True)
+    with open(shared.lock_path, 'w') as f:
+        json.dump({'state': 'ready', 'pid': dead_pid(), 'endpoint': 'http://localhost:9', 'leases': shared.lock_dir}, f)
+    info = shared.acquire()
+    shared.release(info)
+    assert info['endpoint'] != 'http://localhost:9'
+
+def test_acquire_gives_up_when_the_lock_keeps_changing(tmp_path):
+    server = StanfordCoreNLP.CoreNLPSharedServer(['tokenize'], lock_dir=str(tmp_path), start_timeout=0.5)
+    # The lock file never matches what _ready_info() returned
+    server._ready_info = lambda: {'state': 'ready', 'pid': os.getpid(), 'endpoint': 'http://localhost:9', 'leases': str(tmp_path)}
+    with pytest.raises(RuntimeError):
+        server.acquire()
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,27 @@
+import StanfordCoreNLP
+
+def test_token_lists_after_empty_documents(stand_in, zh_texts):
+    words = StanfordCoreNLP.Segment(zh_texts[:5], verbose=0)
+    documents = ['', ''] + words
+    tags = StanfordCoreNLP.POS_Tag(documents, verbose=0)
+    assert tags[:2] == [[], []]
+    assert [[[word for word, tag in sentence] for sentence in document] for document in tags[2:]] == words
+    assert list(StanfordCoreNLP.iter_pos_tag(iter(documents))) == tags
+
+def test_token_lists_chain(stand_in, zh_texts):
+    words = StanfordCoreNLP.Segment(zh_texts, verbose=0)
+    tags = StanfordCoreNLP.POS_Tag(words, verbose=0, batch_size=4)
+    parses = StanfordCoreNLP.Dependency_Parse(tags, verbose=0, batch_size=4)
+    assert [[sentence_words for sentence_words, edges in document] for document, text in zip(parses, zh_texts) if text] == [document for document in words if document]
+
+def test_empty_input():
+    assert StanfordCoreNLP._token_documents(iter(['', '']), True)[1] is False
+    assert list(StanfordCoreNLP.iter_pos_tag(iter([]))) == []
+
+def test_flat_token_lists_are_one_sentence(stand_in, zh_texts):
+    words = StanfordCoreNLP.Segment(zh_texts[:5], verbose=0, sent_split=False)
+    tags = StanfordCoreNLP.POS_Tag(words, verbose=0, sent_split=False)
+    assert [[word for word, tag in document] for document in tags] == words
+    # POS_Tag() output with sent_split=False, (word, tag) pairs
+    parses = StanfordCoreNLP.Dependency_Parse(tags, verbose=0)
+    assert [[word for sentence_words, edges in document for word in sentence_words] for document in parses] == words